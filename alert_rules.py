@@ -0,0 +1,226 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from columnar_store import to_micros
+from sensor_schema import NUMERIC_FIELDS
+
+RULES_FILE = "alert_rules.json"
+
+RULE_THRESHOLD = "threshold"    # значение вне [min, max]
+RULE_RATE = "rate"              # |изменение| быстрее max_rate единиц в минуту
+RULE_SUSTAINED = "sustained"    # вне [min, max] не меньше for_seconds подряд
+RULE_HYSTERESIS = "hysteresis"  # срабатывает вне [min, max], сбрасывается только внутри [clear_min, clear_max]
+RULE_KINDS = (RULE_THRESHOLD, RULE_RATE, RULE_SUSTAINED, RULE_HYSTERESIS)
+
+STATE_OPENED = "opened"
+STATE_ACTIVE = "active"
+STATE_CLOSED = "closed"
+
+
+class Rule:
+    """Одно правило из alert_rules.json; devices=None - для всех устройств."""
+
+    def __init__(self, name, field, kind=RULE_THRESHOLD, min=None, max=None, clear_min=None, clear_max=None,
+                 max_rate=None, for_seconds=0, devices=None, label=None, unit=""):
+        if field not in NUMERIC_FIELDS:
+            raise ValueError(f"Правило {name}: неизвестное поле {field}")
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Правило {name}: неизвестный тип {kind}")
+        if kind == RULE_RATE and max_rate is None:
+            raise ValueError(f"Правило {name}: для rate нужен max_rate")
+        self.name = name
+        self.field = field
+        self.kind = kind
+        self.min = -np.inf if min is None else float(min)
+        self.max = np.inf if max is None else float(max)
+        self.clear_min = self.min if clear_min is None else float(clear_min)
+        self.clear_max = self.max if clear_max is None else float(clear_max)
+        self.max_rate = np.inf if max_rate is None else float(max_rate)
+        self.for_seconds = float(for_seconds)
+        self.devices = None if devices in (None, "*", ["*"]) else set(devices)
+        self.label = label or field
+        self.unit = unit
+
+    def applies_to(self, device_id):
+        return self.devices is None or device_id in self.devices
+
+    def describe(self, value):
+        if self.kind == RULE_RATE:
+            return f"❗️ {self.label}: {value}{self.unit} (изменение быстрее {self.max_rate:g}{self.unit} в минуту)"
+        bounds = f"{self.min}-{self.max}{self.unit}"
+        if self.kind == RULE_SUSTAINED:
+            return f"❗️ {self.label}: {value}{self.unit} (вне нормы {bounds} дольше {self.for_seconds:g} сек)"
+        return f"❗️ {self.label}: {value}{self.unit} (норма: {bounds})"
+
+
+def load_rules(path=RULES_FILE, defaults=()):
+    """Правила из JSON-файла (список объектов с полями Rule); без файла - defaults."""
+    if not os.path.isfile(path):
+        return list(defaults)
+    with open(path, 'r', encoding='utf-8') as f:
+        return [Rule(**spec) for spec in json.load(f)]
+
+
+class AlertEvent:
+    def __init__(self, device_id, rule, state, value, timestamp, row):
+        self.device_id = device_id
+        self.rule = rule
+        self.state = state
+        self.value = value
+        self.timestamp = timestamp
+        self.row = row
+
+    def message(self):
+        return self.rule.describe(self.value)
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else np.nan
+    except (ValueError, TypeError):
+        return np.nan
+
+
+class RuleEngine:
+    """Правила, скомпилированные в массивы numpy: пачка показаний проверяется за один проход.
+
+    Вся пачка - матрица (строки x правила); состояние между пачками (прошлое
+    значение для rate, начало нарушения для sustained, флаг hysteresis,
+    активность правила) хранится в массивах (устройства x правила).
+    evaluate() возвращает события по строкам, где правило сменило состояние:
+    opened - начало срабатывать, closed - вернулось в норму; active - по
+    последней строке устройства, если правило срабатывает и до неё.
+    """
+
+    def __init__(self, rules, fields=NUMERIC_FIELDS):
+        self.rules = list(rules)
+        self.fields = list(fields)
+        field_index = {field: i for i, field in enumerate(self.fields)}
+        self._field = np.array([field_index[rule.field] for rule in self.rules], dtype=np.intp)
+        self._min = np.array([rule.min for rule in self.rules], dtype=float)
+        self._max = np.array([rule.max for rule in self.rules], dtype=float)
+        self._clear_min = np.array([rule.clear_min for rule in self.rules], dtype=float)
+        self._clear_max = np.array([rule.clear_max for rule in self.rules], dtype=float)
+        self._max_rate = np.array([rule.max_rate for rule in self.rules], dtype=float)
+        self._for_seconds = np.array([rule.for_seconds for rule in self.rules], dtype=float)
+        kinds = np.array([rule.kind for rule in self.rules], dtype=object)
+        self._is_rate = kinds == RULE_RATE
+        self._is_sustained = kinds == RULE_SUSTAINED
+        self._is_hysteresis = kinds == RULE_HYSTERESIS
+
+        n_rules = len(self.rules)
+        self._lock = threading.Lock()
+        self.devices = []
+        self._device_index = {}
+        self._applies = np.zeros((0, n_rules), dtype=bool)
+        self._last_values = np.zeros((0, len(self.fields)))
+        self._last_time = np.zeros(0)
+        self._run_since = np.zeros((0, n_rules))
+        self._hysteresis = np.zeros((0, n_rules), dtype=bool)
+        self._active = np.zeros((0, n_rules), dtype=bool)
+
+    def _device(self, device_id):
+        index = self._device_index.get(device_id)
+        if index is None:
+            index = len(self.devices)
+            self.devices.append(device_id)
+            self._device_index[device_id] = index
+            n_rules = len(self.rules)
+            self._applies = np.vstack([self._applies, [[rule.applies_to(device_id) for rule in self.rules]]])
+            self._last_values = np.vstack([self._last_values, np.full((1, len(self.fields)), np.nan)])
+            self._last_time = np.append(self._last_time, np.nan)
+            self._run_since = np.vstack([self._run_since, np.full((1, n_rules), np.nan)])
+            self._hysteresis = np.vstack([self._hysteresis, np.zeros((1, n_rules), dtype=bool)])
+            self._active = np.vstack([self._active, np.zeros((1, n_rules), dtype=bool)])
+        return index
+
+    def evaluate(self, rows):
+        if not rows or not self.rules:
+            return []
+        # Состояние между пачками общее: параллельные проверки идут по очереди
+        with self._lock:
+            return self._evaluate(rows)
+
+    def _evaluate(self, rows):
+
+        devices = np.array([self._device(str(row.get("device_id", ""))) for row in rows], dtype=np.intp)
+        times = np.array([to_micros(row["timestamp"]) for row in rows], dtype=float) / 1e6
+        order = np.lexsort((times, devices))
+        devices, times = devices[order], times[order]
+        rows = [rows[i] for i in order]
+        values = np.array([[_to_float(row.get(field)) for field in self.fields] for row in rows])
+
+        n = len(rows)
+        positions = np.arange(n)
+        group_first = np.r_[True, devices[1:] != devices[:-1]]
+        group_last = np.r_[devices[1:] != devices[:-1], True]
+        # Номер первой строки своего устройства для каждой строки
+        group_start = np.maximum.accumulate(np.where(group_first, positions, 0))[:, None]
+        row_index = positions[:, None]
+
+        x = values[:, self._field]
+        with np.errstate(invalid='ignore'):
+            outside = (x < self._min) | (x > self._max)
+
+            # rate: предыдущая точка того же устройства, для первой - из прошлой пачки
+            prev_x = np.vstack([x[:1], x[:-1]])
+            prev_t = np.r_[times[:1], times[:-1]]
+            prev_x[group_first] = self._last_values[devices[group_first]][:, self._field]
+            prev_t[group_first] = self._last_time[devices[group_first]]
+            dt = (times - prev_t)[:, None]
+            rate = np.abs(x - prev_x) / np.where(dt > 0, dt, np.nan) * 60
+            rate_breach = rate > self._max_rate
+
+        # sustained: начало текущей серии нарушений
+        last_ok = np.maximum.accumulate(np.where(~outside, row_index, -1), axis=0)
+        began_earlier = last_ok < group_start
+        carried = self._run_since[devices]
+        run_start = np.where(
+            began_earlier,
+            np.where(np.isnan(carried), times[group_start[:, 0]][:, None], carried),
+            times[np.clip(last_ok + 1, 0, n - 1)],
+        )
+        sustained_breach = outside & (times[:, None] - run_start >= self._for_seconds)
+
+        # hysteresis: последнее событие "вход"/"сброс" решает состояние
+        with np.errstate(invalid='ignore'):
+            cleared = (x >= self._clear_min) & (x <= self._clear_max)
+        event = np.maximum.accumulate(np.where(outside | cleared, row_index, -1), axis=0)
+        hysteresis = np.where(
+            event < group_start,
+            self._hysteresis[devices],
+            np.take_along_axis(outside, np.clip(event, 0, n - 1), axis=0),
+        )
+
+        breach = np.where(self._is_rate, rate_breach,
+                          np.where(self._is_sustained, sustained_breach,
+                                   np.where(self._is_hysteresis, hysteresis, outside)))
+        breach &= self._applies[devices]
+
+        # Переходы по каждой строке: для первой строки устройства прошлое состояние - из прошлой пачки
+        prev_breach = np.vstack([breach[:1], breach[:-1]])
+        prev_breach[group_first] = self._active[devices[group_first]]
+        opened = breach & ~prev_breach
+        closed = ~breach & prev_breach
+        active = breach & prev_breach & group_last[:, None]
+
+        for i in np.flatnonzero(group_last):
+            device = devices[i]
+            self._last_values[device] = values[i]
+            self._last_time[device] = times[i]
+            self._run_since[device] = np.where(outside[i], run_start[i], np.nan)
+            self._hysteresis[device] = hysteresis[i]
+            self._active[device] = breach[i]
+
+        events = []
+        for i, r in zip(*np.nonzero(opened | closed | active)):
+            state = STATE_OPENED if opened[i, r] else (STATE_CLOSED if closed[i, r] else STATE_ACTIVE)
+            value = x[i, r]
+            events.append(AlertEvent(
+                self.devices[devices[i]], self.rules[r], state,
+                None if np.isnan(value) else float(value), rows[i].get("timestamp"), rows[i],
+            ))
+        return events
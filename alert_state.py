@@ -0,0 +1,150 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from alert_rules import STATE_OPENED, STATE_ACTIVE, STATE_CLOSED
+
+ALERT_STATE_FILE = "alert_state.json"
+ALERT_COOLDOWN_SECONDS = 60 * 120
+ALERT_SNAPSHOT_SECONDS = 30
+STATE_VERSION = 1
+
+INCIDENT_OPEN = "open"
+INCIDENT_CLOSED = "closed"
+
+
+class AlertState:
+    """Состояние одной пары (устройство, правило)."""
+
+    def __init__(self, incident=INCIDENT_CLOSED, opened_at=None, closed_at=None, last_fired=None, fired_count=0):
+        self.incident = incident
+        self.opened_at = opened_at
+        self.closed_at = closed_at
+        self.last_fired = last_fired
+        self.fired_count = fired_count
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class AlertStateStore:
+    """Кулдаун и инциденты по парам (устройство, правило) в памяти.
+
+    Меняет состояние только процесс, который проверяет оповещения
+    (alerter.AlertWorker), поэтому достаточно threading.Lock между его
+    потоками. После каждой проверки, раз в snapshot_interval секунд и при
+    выходе состояние атомарно пишется в alert_state.json (tmp + os.replace);
+    процесс, взявший проверку после перезапуска или смерти прежнего, читает
+    его заново: открытый инцидент остаётся открытым, а кулдаун - в силе.
+    Времена - секунды Unix, чтобы переживать перезапуск.
+    """
+
+    def __init__(self, path=ALERT_STATE_FILE, cooldown=ALERT_COOLDOWN_SECONDS):
+        self.path = path
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._states = {}
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            states = {
+                (item["device_id"], item["rule"]): AlertState(
+                    item["incident"], item.get("opened_at"), item.get("closed_at"),
+                    item.get("last_fired"), item.get("fired_count", 0),
+                )
+                for item in snapshot.get("states", [])
+            }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Alerter: не удалось прочитать {self.path}, состояние оповещений сброшено: {e}")
+            return
+        with self._lock:
+            self._states = states
+            self._dirty = False
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return False
+            snapshot = {
+                "version": STATE_VERSION,
+                "saved_at": time.time(),
+                "states": [
+                    dict(device_id=device_id, rule=rule, **state.to_dict())
+                    for (device_id, rule), state in self._states.items()
+                ],
+            }
+            self._dirty = False
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            with self._lock:
+                self._dirty = True
+            print(f"Alerter: не удалось сохранить {self.path}: {e}")
+            return False
+        return True
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.save()
+
+    def start(self, interval=ALERT_SNAPSHOT_SECONDS):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="alert-state", daemon=True)
+            self._thread.start()
+            atexit.register(self.save)
+
+    def stop(self):
+        self._stop.set()
+        self.save()
+
+    def apply(self, events, now=None):
+        """Учесть события RuleEngine; вернуть те, по которым пора отправить оповещение.
+
+        Событие отправляется, если по его паре истёк кулдаун; отметка
+        last_fired ставится здесь же, под блокировкой, поэтому две
+        параллельные проверки не отправят одно и то же дважды.
+        """
+        now = time.time() if now is None else now
+        to_send = []
+        with self._lock:
+            for event in events:
+                key = (event.device_id, event.rule.name)
+                state = self._states.get(key)
+                if state is None:
+                    state = self._states[key] = AlertState()
+
+                if event.state == STATE_CLOSED:
+                    if state.incident == INCIDENT_OPEN:
+                        state.incident = INCIDENT_CLOSED
+                        state.closed_at = now
+                        self._dirty = True
+                    continue
+
+                # opened после перезапуска для уже открытого инцидента - продолжение, а не новый
+                if event.state in (STATE_OPENED, STATE_ACTIVE) and state.incident != INCIDENT_OPEN:
+                    state.incident = INCIDENT_OPEN
+                    state.opened_at = now
+                    state.closed_at = None
+                    self._dirty = True
+
+                if state.last_fired is None or now - state.last_fired >= self.cooldown:
+                    state.last_fired = now
+                    state.fired_count += 1
+                    self._dirty = True
+                    to_send.append(event)
+        return to_send
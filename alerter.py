@@ -1,18 +1,26 @@
 #!/usr/bin/env python3
+import json
 import os
-import csv
-import time
+import queue
+import threading
 import datetime
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from collections import deque
 import sqlite3
-import requests
 from dotenv import load_dotenv
 
+from alert_rules import Rule, RuleEngine, load_rules, RULES_FILE, STATE_OPENED
+from alert_state import AlertStateStore, ALERT_STATE_FILE, ALERT_COOLDOWN_SECONDS
+from csv_tail import read_last_rows
+from devices import load_registry, day_csv_path, DEVICES_FILE
+from notifier import notifier_from_env, summarize
+from subscribers import SubscriberRegistry
 
-# STATE_FILE_TO_RESET = "last_alert_time.txt"
+try:
+    import fcntl
+except ImportError:  # Windows: сервер - один процесс, он и проверяет
+    fcntl = None
+
+
+# STATE_FILE_TO_RESET = "alert_state.json"
 # if os.path.exists(STATE_FILE_TO_RESET):
 #     try:
 #         os.remove(STATE_FILE_TO_RESET)
@@ -28,187 +36,215 @@ TEMP_MIN = 23.0
 TEMP_MAX = 30.0
 HUMIDITY_MIN = 40.0
 HUMIDITY_MAX = 60.0
-CHECK_INTERVAL_SECONDS = 10
+ALERT_QUEUE_SIZE = 1000
+# Общая очередь показаний на проверку для всех процессов сервера
+ALERT_QUEUE_FILE = "alert_queue.db"
+ALERT_LOCK_FILE = ".alerter.lock"
+ALERT_POLL_SECONDS = 2
 DATA_MAX_AGE_MINUTES = 15
-ALERT_COOLDOWN_SECONDS = 60 * 120
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-LAST_ALERT_STATE_FILE = "last_alert_time.txt"
-CHECK_LOCK_FILE = "alert_check.lock"
 
 DB_FILE = "telegram_users.db"
 
+# Без alert_rules.json - прежние пороги температуры и влажности
+DEFAULT_RULES = [
+    Rule("air_temperature_range", "air_temperature", min=TEMP_MIN, max=TEMP_MAX, label="Температура", unit="°C"),
+    Rule("air_humidity_range", "air_humidity", min=HUMIDITY_MIN, max=HUMIDITY_MAX, label="Влажность", unit="%"),
+]
+rule_engine = RuleEngine(load_rules(os.getenv("ALERT_RULES_FILE", RULES_FILE), DEFAULT_RULES))
 
-def send_alert_email(subject, body):
-    if not SENDER_PASSWORD:
-        print("ОШИБКА: Пароль для email не установлен.")
-        return
 
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT email FROM users WHERE email IS NOT NULL AND email != ''")
-        recipients = [row[0] for row in cursor.fetchall()]
-        conn.close()
-    except Exception as e:
-        print(f"Критическая ошибка при чтении email'ов из БД: {e}")
-        return
+notifier = notifier_from_env(BOT_TOKEN, SENDER_EMAIL, SENDER_PASSWORD)
+subscribers = SubscriberRegistry(DB_FILE)
+alert_state = AlertStateStore(os.getenv("ALERT_STATE_FILE", ALERT_STATE_FILE), ALERT_COOLDOWN_SECONDS)
 
-    if not recipients:
-        print("Нет подписчиков на Email-рассылку.")
-        return
 
+def send_alert(subject, body, device_id=None, rules=()):
+    """Рассылка оповещения подписчикам устройства и правил; возвращает DeliveryResult по каждому."""
     try:
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-
-        server = smtplib.SMTP_SSL('smtp.mail.ru', 465)
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        server.sendmail(SENDER_EMAIL, recipients, msg.as_string())
-        server.quit()
-        print(f"Email успешно отправлен {len(recipients)} подписчикам.")
-    except Exception as e:
-        print(f"Ошибка при отправке email: {e}")
-
-
-def send_telegram_alert(body: str):
-    print("Начинаю рассылку в Telegram...")
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users WHERE notifications_enabled = 1")
-        user_ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
-
-        if not user_ids:
-            print("Нет активных подписчиков в Telegram.")
-            return
-
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-        for user_id in user_ids:
-            payload = {'chat_id': user_id, 'text': body}
-            try:
-                requests.post(url, json=payload, timeout=5)
-            except requests.RequestException:
-                pass
-    except Exception as e:
-        print(f"Ошибка в send_telegram_alert: {e}")
-
-
-def check_and_alert():
-    print("\n--- [DEBUG] Начало новой проверки ---")
-
+        user_ids, emails = subscribers.recipients(device_id, rules)
+    except sqlite3.Error as e:
+        print(f"Критическая ошибка при чтении подписчиков из БД: {e}")
+        return []
+    if not user_ids and not emails:
+        print("Нет подписчиков на оповещения.")
+        return []
+
+    results = notifier.dispatch(subject, body, user_ids, emails)
+    for channel, (delivered, total) in summarize(results).items():
+        print(f"Alerter: {channel} - доставлено {delivered} из {total}.")
+    for result in results:
+        if not result.ok:
+            print(f"Alerter: не доставлено {result.channel} {result.recipient}: {result.error}")
+    return results
+
+
+def is_fresh(row, now):
+    timestamp_str = row.get("timestamp", "")
     try:
-        lock_fd = os.open(CHECK_LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-    except FileExistsError:
-        print("[DEBUG] Lock-файл уже существует, другая проверка активна. Пропускаю.")
+        timestamp_dt = datetime.datetime.fromisoformat(timestamp_str)
+    except (ValueError, TypeError):
+        print(f"[DEBUG] Неверный формат временной метки: '{timestamp_str}'.")
+        return False
+    return (now - timestamp_dt).total_seconds() <= DATA_MAX_AGE_MINUTES * 60
+
+
+def format_alert(row, problem_messages):
+    full_body = "Обнаружены следующие критические отклонения:\n\n"
+    full_body += "\n".join(problem_messages)
+    full_body += "\n\n" + "=" * 40 + "\n\nПОЛНЫЕ ДАННЫЕ:\n"
+    for key, value in row.items():
+        full_body += f"- {key.replace('_', ' ').capitalize()}: {value}\n"
+    return full_body
+
+
+def check_and_alert(rows):
+    """Проверка только что пришедших показаний правилами alert_rules.json."""
+    now = datetime.datetime.now()
+
+    # Устаревшие строки (например, догруженный архив) не проверяем
+    rows = [row for row in rows if is_fresh(row, now)]
+    # Правила видят каждую строку, даже во время кулдауна: им нужна история
+    events = rule_engine.evaluate(rows)
+    to_send = alert_state.apply(events, now.timestamp())
+    # Сразу на диск: процесс, который возьмёт проверку следующим, продолжит с тех же кулдаунов
+    alert_state.save()
+    if not to_send:
+        if any(event.state == STATE_OPENED for event in events):
+            print("[DEBUG] Кулдаун активен по всем сработавшим правилам. Выход.")
         return
 
-    try:
-        now = datetime.datetime.now()
-
-        print("[DEBUG] 1. Проверяю кулдаун...")
-        if os.path.isfile(LAST_ALERT_STATE_FILE):
-            with open(LAST_ALERT_STATE_FILE, 'r') as f:
-                try:
-                    last_alert_timestamp = float(f.read().strip())
-                    seconds_since_last_alert = (
-                                now - datetime.datetime.fromtimestamp(last_alert_timestamp)).total_seconds()
-                    if seconds_since_last_alert < ALERT_COOLDOWN_SECONDS:
-                        print(
-                            f"[DEBUG] Кулдаун активен. Осталось {int(ALERT_COOLDOWN_SECONDS - seconds_since_last_alert)} сек. Выход.")
-                        return
-                except (ValueError, TypeError):
-                    pass
-        print("[DEBUG] Кулдаун неактивен.")
-
-        print("[DEBUG] 2. Ищу файл данных...")
-        current_date = now.strftime("%Y-%m-%d")
-        csv_filename = f'box_data/{current_date}.csv'
-        if not os.path.isfile(csv_filename):
-            print(f"[DEBUG] Файл данных {csv_filename} не найден. Выход.")
-            return
-        print(f"[DEBUG] Файл данных найден: {csv_filename}")
-
-        print("[DEBUG] 3. Читаю последнюю строку из файла...")
-        with open(csv_filename, 'r', newline='') as f:
-            last_row_iter = deque(csv.DictReader(f), maxlen=1)
-        if not last_row_iter:
-            print("[DEBUG] Файл данных пуст. Выход.")
-            return
-        last_row = last_row_iter[0]
-        print(f"[DEBUG] Последняя строка: {last_row}")
-
-        print("[DEBUG] 4. Проверяю возраст данных...")
-        timestamp_str = last_row.get("timestamp", "")
-        if not timestamp_str:
-            print("[DEBUG] Временная метка отсутствует. Выход.")
-            return
+    by_device = {}
+    for event in to_send:
+        by_device.setdefault(event.device_id, []).append(event)
+
+    print("Alerter: Обнаружены проблемы, формируется оповещение...")
+    subject = "🚨 Срочное оповещение от системы мониторинга"
+    for device_id, device_events in by_device.items():
+        full_body = format_alert(device_events[0].row, [event.message() for event in device_events])
+        send_alert(subject, full_body, device_id, [event.rule.name for event in device_events])
+
+
+class AlertQueue:
+    """Показания на проверку в SQLite: общая очередь всех процессов сервера (воркеров Gunicorn)."""
+
+    def __init__(self, path=ALERT_QUEUE_FILE):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS alert_queue (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, rows):
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO alert_queue (row) VALUES (?)",
+                             [(json.dumps(row, ensure_ascii=False),) for row in rows])
+
+    def take(self):
+        """Забрать все накопившиеся строки в порядке поступления."""
+        conn = self._connect()
+        with conn:
+            records = conn.execute("SELECT id, row FROM alert_queue ORDER BY id").fetchall()
+            if records:
+                conn.execute("DELETE FROM alert_queue WHERE id <= ?", (records[-1][0],))
+        return [json.loads(row) for _, row in records]
+
+
+class AlertWorker:
+    """Проверка показаний сразу после записи, в отдельном потоке.
+
+    submit() вызывается из хука приёмника и не блокирует запись. Процессов
+    сервера может быть несколько (воркеры Gunicorn), а правилам rate и
+    sustained и кулдауну нужна вся история устройства, поэтому проверяет
+    один процесс - тот, кто держит блокировку ALERT_LOCK_FILE. Каждый процесс
+    перекладывает свои показания в общую AlertQueue, проверяющий забирает
+    их оттуда вместе; если он завершится, блокировку возьмёт следующий.
+    """
+
+    def __init__(self, max_queue=ALERT_QUEUE_SIZE, check=check_and_alert, queue_path=ALERT_QUEUE_FILE,
+                 lock_path=ALERT_LOCK_FILE, interval=ALERT_POLL_SECONDS):
+        self.check = check
+        self.queue_path = queue_path
+        self.lock_path = lock_path
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock_file = None
+        self._thread = threading.Thread(target=self._run, name="alerter", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
         try:
-            timestamp_dt = datetime.datetime.fromisoformat(timestamp_str)
-            data_age_seconds = (now - timestamp_dt).total_seconds()
-            if data_age_seconds > DATA_MAX_AGE_MINUTES * 60:
-                print(f"[DEBUG] Данные слишком старые ({int(data_age_seconds)} сек). Выход.")
-                return
-        except ValueError:
-            print(f"[DEBUG] Неверный формат временной метки: '{timestamp_str}'. Выход.")
-            return
-        print(f"[DEBUG] Возраст данных в норме ({int(data_age_seconds)} сек).")
-
-        print("[DEBUG] 5. Анализирую показатели...")
-        problem_messages = []
-
-        air_temp_str = last_row.get("air_temperature", "").strip()
-        if air_temp_str:
+            self._queue.put_nowait(list(rows))
+        except queue.Full:
+            print("Alerter: очередь проверок переполнена, пачка пропущена.")
+
+    @property
+    def is_leader(self):
+        return self._lock_file is not None
+
+    def _try_lead(self):
+        if self._lock_file is not None:
+            return True
+        lock = open(self.lock_path, 'a')
+        if fcntl:
             try:
-                air_temp = float(air_temp_str)
-                print(f"[DEBUG]   Температура: {air_temp}°C")
-                if air_temp < TEMP_MIN or air_temp > TEMP_MAX:
-                    problem_messages.append(f"❗️ Температура: {air_temp}°C (норма: {TEMP_MIN}-{TEMP_MAX}°C)")
-            except ValueError:
-                print(f"[DEBUG]   Ошибка конвертации температуры: '{air_temp_str}' не является числом.")
-        else:
-            print("[DEBUG]   Поле 'air_temperature' пустое.")
-
-        air_humidity_str = last_row.get("air_humidity", "").strip()
-        if air_humidity_str:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                return False
+        # Блокировка держится до конца процесса
+        self._lock_file = lock
+        # Кулдауны и инциденты - как их оставил предыдущий проверяющий процесс
+        alert_state.load()
+        alert_state.start()
+        print(f"Alerter: оповещения проверяет процесс {os.getpid()}.")
+        return True
+
+    def _run(self):
+        shared = AlertQueue(self.queue_path)
+        while True:
             try:
-                air_humidity = float(air_humidity_str)
-                print(f"[DEBUG]   Влажность: {air_humidity}%")
-                if air_humidity < HUMIDITY_MIN or air_humidity > HUMIDITY_MAX:
-                    problem_messages.append(f"❗️ Влажность: {air_humidity}% (норма: {HUMIDITY_MIN}-{HUMIDITY_MAX}%)")
-            except ValueError:
-                print(f"[DEBUG]   Ошибка конвертации влажности: '{air_humidity_str}' не является числом.")
-        else:
-            print("[DEBUG]   Поле 'air_humidity' пустое.")
-
-        if problem_messages:
-            print("Alerter: Обнаружены проблемы, формируется оповещение...")
-            subject = "🚨 Срочное оповещение от системы мониторинга"
-
-            full_body = "Обнаружены следующие критические отклонения:\n\n"
-            full_body += "\n".join(problem_messages)
-            full_body += "\n\n" + "=" * 40 + "\n\nПОЛНЫЕ ДАННЫЕ:\n"
-            for key, value in last_row.items():
-                full_body += f"- {key.replace('_', ' ').capitalize()}: {value}\n"
-
-            send_alert_email(subject, full_body)
-
-            send_telegram_alert(full_body)
-
-            with open(LAST_ALERT_STATE_FILE, 'w') as f:
-                f.write(str(datetime.datetime.now().timestamp()))
-        else:
-            print("Alerter: Все показатели в норме.")
-
-    finally:
-        os.close(lock_fd)
-        os.remove(CHECK_LOCK_FILE)
+                rows = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                rows = []
+            while True:
+                try:
+                    rows.extend(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if rows:
+                    shared.put(rows)
+                if self._try_lead():
+                    pending = shared.take()
+                    if pending:
+                        self.check(pending)
+            except Exception as e:
+                print(f"Alerter: ошибка при проверке: {e}")
+
+
+def check_latest(data_folder='box_data'):
+    """Разовая проверка последней строки сегодняшнего файла каждого устройства (для запуска вручную)."""
+    today = datetime.datetime.now().strftime("%Y-%m-%d")
+    last_rows = []
+    for device_id in load_registry(os.getenv("DEVICES_FILE", DEVICES_FILE)).ids():
+        csv_filename = day_csv_path(data_folder, today, device_id)
+        rows = read_last_rows(csv_filename, 1)
+        if not rows:
+            print(f"Файл данных {csv_filename} не найден или пуст.")
+        last_rows.extend(rows)
+    if last_rows:
+        check_and_alert(last_rows)
 
 
 if __name__ == '__main__':
-    print("--- Запуск сервиса оповещений (Alerter) ---")
-    while True:
-        check_and_alert()
-        time.sleep(CHECK_INTERVAL_SECONDS)
\ No newline at end of file
+    # Постоянная проверка идёт в server.py по каждому пришедшему показанию (AlertWorker)
+    print("--- Разовая проверка последних показаний (Alerter) ---")
+    check_latest()
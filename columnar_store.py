@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import datetime
+import json
+import os
+
+import numpy as np
+
+from sensor_schema import CSV_HEADERS, NUMERIC_FIELDS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Формат дня: каталог box_data/YYYY-MM-DD.col/ с одним файлом на колонку.
+#   timestamp.i64  - микросекунды от 1970-01-01 (локальное "настенное" время, как в CSV)
+#   device_id.i32  - индекс устройства в meta.json["devices"]
+#   <field>.f64    - значение датчика, NaN для пустых ячеек
+# Все колонки только дописываются, число строк = минимальная длина колонки.
+TIMESTAMP_COLUMN = "timestamp"
+DEVICE_COLUMN = "device_id"
+TIMESTAMP_DTYPE = np.dtype('<i8')
+DEVICE_DTYPE = np.dtype('<i4')
+VALUE_DTYPE = np.dtype('<f8')
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+CHUNK_ROWS = 10000
+
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def to_micros(timestamp):
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return (timestamp - EPOCH) // ONE_MICROSECOND
+
+
+def from_micros(value):
+    return EPOCH + datetime.timedelta(microseconds=int(value))
+
+
+def row_micros(row):
+    """Метка строки в формате CSV в микросекундах; -1 для пустой или битой (такие строки идут первыми)."""
+    try:
+        return to_micros(row.get("timestamp"))
+    except (ValueError, TypeError):
+        return -1
+
+
+def sort_rows(rows):
+    # Устойчивая сортировка: строки с одинаковой меткой сохраняют порядок поступления
+    return sorted(rows, key=row_micros)
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else np.nan
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def format_value(value):
+    if np.isnan(value):
+        return ""
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def column_path(day_path, name):
+    if name == TIMESTAMP_COLUMN:
+        return os.path.join(day_path, f'{name}.i64')
+    if name == DEVICE_COLUMN:
+        return os.path.join(day_path, f'{name}.i32')
+    return os.path.join(day_path, f'{name}.f64')
+
+
+def _column_dtype(name):
+    if name == TIMESTAMP_COLUMN:
+        return TIMESTAMP_DTYPE
+    if name == DEVICE_COLUMN:
+        return DEVICE_DTYPE
+    return VALUE_DTYPE
+
+
+class ColumnarDay:
+    """Колоночное хранилище показаний за один день."""
+
+    def __init__(self, path, fields=NUMERIC_FIELDS):
+        self.path = path
+        self.fields = list(fields)
+
+    @property
+    def columns(self):
+        return [TIMESTAMP_COLUMN, DEVICE_COLUMN] + self.fields
+
+    def exists(self):
+        return os.path.isfile(column_path(self.path, TIMESTAMP_COLUMN))
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, META_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"devices": []}
+
+    def _write_meta(self, meta):
+        path = os.path.join(self.path, META_FILE)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(f'{path}.tmp', path)
+
+    @property
+    def devices(self):
+        return self._read_meta()["devices"]
+
+    def __len__(self):
+        lengths = []
+        for name in self.columns:
+            try:
+                lengths.append(os.path.getsize(column_path(self.path, name)) // _column_dtype(name).itemsize)
+            except OSError:
+                return 0
+        return min(lengths)
+
+    def _last_timestamp(self, count):
+        return int(np.fromfile(column_path(self.path, TIMESTAMP_COLUMN), dtype=TIMESTAMP_DTYPE, count=1,
+                               offset=(count - 1) * TIMESTAMP_DTYPE.itemsize)[0])
+
+    def _rewrite_sorted(self, count, columns, fsync):
+        # Старые строки (догрузка пропущенных показаний) - в середину дня: колонки
+        # пересобираются по времени целиком, иначе read() через searchsorted режет не то
+        merged = {
+            name: np.concatenate((np.fromfile(column_path(self.path, name), dtype=_column_dtype(name), count=count),
+                                  array))
+            for name, array in columns.items()
+        }
+        order = np.argsort(merged[TIMESTAMP_COLUMN], kind='stable')
+        for name, array in merged.items():
+            path = column_path(self.path, name)
+            with open(f'{path}.tmp', 'wb') as f:
+                f.write(array[order].tobytes())
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(f'{path}.tmp', path)
+
+    def append_columns(self, timestamps, device_ids, values, fsync=False):
+        """Дописывает готовые колонки: timestamps (int64), device_ids (строки), values {field: float64}.
+
+        Колонки остаются отсортированными по времени: пачка сортируется, а если
+        она старше последней записанной строки, день пересобирается.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_FILE), 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Выравниваем колонки после возможного обрыва записи
+                count = len(self)
+                for name in self.columns:
+                    path = column_path(self.path, name)
+                    if os.path.exists(path):
+                        with open(path, 'r+b') as f:
+                            f.truncate(count * _column_dtype(name).itemsize)
+
+                meta = self._read_meta()
+                known = {device: i for i, device in enumerate(meta["devices"])}
+                for device in device_ids:
+                    if device not in known:
+                        known[device] = len(meta["devices"])
+                        meta["devices"].append(device)
+                self._write_meta(meta)
+
+                columns = {
+                    TIMESTAMP_COLUMN: np.asarray(timestamps, dtype=TIMESTAMP_DTYPE),
+                    DEVICE_COLUMN: np.asarray([known[d] for d in device_ids], dtype=DEVICE_DTYPE),
+                }
+                for field in self.fields:
+                    columns[field] = np.asarray(values[field], dtype=VALUE_DTYPE)
+                order = np.argsort(columns[TIMESTAMP_COLUMN], kind='stable')
+                columns = {name: array[order] for name, array in columns.items()}
+
+                if count and len(order) and columns[TIMESTAMP_COLUMN][0] < self._last_timestamp(count):
+                    self._rewrite_sorted(count, columns, fsync)
+                    return
+
+                for name, array in columns.items():
+                    with open(column_path(self.path, name), 'ab') as f:
+                        f.write(array.tobytes())
+                        if fsync:
+                            f.flush()
+                            os.fsync(f.fileno())
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def append(self, rows, fsync=False):
+        """Дописывает строки в формате CSV (словари с ключами CSV_HEADERS)."""
+        if not rows:
+            return
+        self.append_columns(
+            [to_micros(row["timestamp"]) for row in rows],
+            [str(row.get("device_id", "")) for row in rows],
+            {field: [_to_float(row.get(field)) for row in rows] for field in self.fields},
+            fsync,
+        )
+
+    def column(self, name):
+        """Колонка целиком как numpy.memmap (без копирования)."""
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=_column_dtype(name))
+        return np.memmap(column_path(self.path, name), dtype=_column_dtype(name), mode='r', shape=(count,))
+
+    def read(self, fields=None, start=None, end=None):
+        """Срез [start, end) по времени; возвращает {колонка: массив-представление}."""
+        timestamps = self.column(TIMESTAMP_COLUMN)
+        lo = 0 if start is None else int(np.searchsorted(timestamps, to_micros(start), side='left'))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, to_micros(end), side='left'))
+        result = {TIMESTAMP_COLUMN: timestamps[lo:hi]}
+        for name in [DEVICE_COLUMN] + list(fields or self.fields):
+            result[name] = self.column(name)[lo:hi]
+        return result
+
+    def take(self, indexes):
+        """Строки с номерами indexes в формате CSV; номера за концом - последняя строка."""
+        count = len(self)
+        if count == 0:
+            return []
+        positions = np.minimum(np.asarray(indexes, dtype=np.intp), count - 1)
+        devices = self.devices
+        columns = {name: np.asarray(self.column(name)[positions]) for name in self.columns}
+        rows = []
+        for i in range(len(positions)):
+            row = {
+                TIMESTAMP_COLUMN: from_micros(columns[TIMESTAMP_COLUMN][i]).isoformat(),
+                DEVICE_COLUMN: devices[columns[DEVICE_COLUMN][i]],
+            }
+            for field in self.fields:
+                row[field] = format_value(columns[field][i])
+            rows.append(row)
+        return rows
+
+    def iter_rows(self, chunk_rows=CHUNK_ROWS):
+        """Строки в формате CSV, по chunk_rows за раз."""
+        devices = self.devices
+        columns = {name: self.column(name) for name in self.columns}
+        for lo in range(0, len(columns[TIMESTAMP_COLUMN]), chunk_rows):
+            chunk = {name: np.array(array[lo:lo + chunk_rows]) for name, array in columns.items()}
+            for i in range(len(chunk[TIMESTAMP_COLUMN])):
+                row = {
+                    TIMESTAMP_COLUMN: from_micros(chunk[TIMESTAMP_COLUMN][i]).isoformat(),
+                    DEVICE_COLUMN: devices[chunk[DEVICE_COLUMN][i]],
+                }
+                for field in self.fields:
+                    row[field] = format_value(chunk[field][i])
+                yield row
+
+
+def columnar_path(csv_path):
+    base, _ = os.path.splitext(csv_path)
+    return f'{base}.col'
+
+
+def csv_to_columnar(csv_path, day_path=None, chunk_rows=CHUNK_ROWS):
+    day = ColumnarDay(day_path or columnar_path(csv_path))
+    if day.exists():
+        raise FileExistsError(f"Колоночные данные уже существуют: {day.path}")
+
+    chunk = []
+    with open(csv_path, 'r', newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            if not row.get("timestamp"):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                day.append(chunk)
+                chunk = []
+    day.append(chunk)
+    return day
+
+
+def columnar_to_csv(day_path, csv_path, chunk_rows=CHUNK_ROWS):
+    day = ColumnarDay(day_path)
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_HEADERS)
+        writer.writeheader()
+        for row in day.iter_rows(chunk_rows):
+            writer.writerow(row)
+
+
+def read_frame(day_paths, fields=NUMERIC_FIELDS):
+    """pandas.DataFrame с индексом timestamp из одного или нескольких дней."""
+    import pandas as pd
+
+    if isinstance(day_paths, str):
+        day_paths = [day_paths]
+
+    frames = []
+    for day_path in day_paths:
+        data = ColumnarDay(day_path).read(fields)
+        index = pd.to_datetime(np.asarray(data[TIMESTAMP_COLUMN]), unit='us')
+        frames.append(pd.DataFrame({field: np.asarray(data[field]) for field in fields}, index=index))
+
+    df = pd.concat(frames) if frames else pd.DataFrame(columns=list(fields))
+    df.index.name = TIMESTAMP_COLUMN
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Конвертация box_data между CSV и колоночным форматом")
+    parser.add_argument("direction", choices=["to-columnar", "to-csv"])
+    parser.add_argument("paths", nargs="+", help="CSV-файлы (to-columnar) или каталоги .col (to-csv)")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if args.direction == "to-columnar":
+            day = csv_to_columnar(path)
+            print(f"{path} -> {day.path} ({len(day)} строк)")
+        else:
+            out_path = path[:-len('.col')] + '.csv' if path.endswith('.col') else path + '.csv'
+            if os.path.exists(out_path):
+                print(f"Пропуск {path}: файл {out_path} уже существует")
+                continue
+            columnar_to_csv(path, out_path)
+            print(f"{path} -> {out_path}")
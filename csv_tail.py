@@ -0,0 +1,50 @@
+import csv
+import os
+
+from sensor_schema import CSV_HEADERS
+
+BLOCK_SIZE = 8192
+
+
+def read_last_lines(path, n, block_size=BLOCK_SIZE):
+    """Возвращает последние n полных строк файла, читая его блоками с конца.
+
+    Недописанная последняя строка (без перевода строки в конце) отбрасывается.
+    """
+    if n <= 0:
+        return []
+
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b''
+        # n полных строк = n + 1 перевод строки (первый кусок может быть обрезан)
+        while pos > 0 and data.count(b'\n') <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+
+    lines = data.split(b'\n')
+    lines.pop()
+    if pos > 0:
+        lines = lines[1:]
+
+    lines = [line.rstrip(b'\r').decode('utf-8', errors='replace') for line in lines]
+    return [line for line in lines if line][-n:]
+
+
+def read_last_rows(path, n, fieldnames=CSV_HEADERS, block_size=BLOCK_SIZE):
+    """Последние n строк CSV-файла в виде словарей, как у csv.DictReader."""
+    try:
+        lines = read_last_lines(path, n + 1, block_size)
+    except FileNotFoundError:
+        return []
+
+    rows = []
+    for values in csv.reader(lines):
+        if values == list(fieldnames):
+            continue
+        values += [''] * (len(fieldnames) - len(values))
+        rows.append(dict(zip(fieldnames, values)))
+    return rows[-n:]
@@ -0,0 +1,141 @@
+import csv
+import json
+import os
+import threading
+
+from columnar_store import ColumnarDay
+from sensor_schema import NUMERIC_FIELDS
+
+SUMMARY_VERSION = 1
+SUMMARY_SAMPLES = 10
+
+
+def summary_path(csv_path):
+    base, _ = os.path.splitext(csv_path)
+    return f'{base}.summary.json'
+
+
+def _to_float(value):
+    try:
+        return float(value) if value else None
+    except (ValueError, TypeError):
+        return None
+
+
+def sample_indexes(count, samples=SUMMARY_SAMPLES):
+    # Та же выборка, что раньше делал /data_by_date: шаг N // 10 от начала дня
+    if count == 0:
+        return []
+    step = max(1, count // samples)
+    return [min(i * step, count - 1) for i in range(samples)]
+
+
+def read_samples(path, count, samples=SUMMARY_SAMPLES):
+    """Строки sample_indexes(count) сырого файла дня: из каталога .col - по номерам, из CSV - одним проходом."""
+    indexes = sample_indexes(count, samples)
+    if not indexes:
+        return []
+    if os.path.isdir(path):
+        return ColumnarDay(path).take(indexes)
+    wanted = set(indexes)
+    picked = {}
+    with open(path, 'r', newline='') as csvfile:
+        for i, row in enumerate(csv.DictReader(csvfile)):
+            if i in wanted:
+                picked[i] = row
+            if i >= indexes[-1]:
+                break
+    return [picked[i] for i in indexes if i in picked]
+
+
+def build_summary(csv_path, fields=NUMERIC_FIELDS, samples=SUMMARY_SAMPLES):
+    st = os.stat(csv_path)
+    with open(csv_path, 'r', newline='') as csvfile:
+        all_rows = list(csv.DictReader(csvfile))
+
+    stats = {field: {"count": 0, "sum": 0.0, "min": None, "max": None, "last": 0.0} for field in fields}
+    for row in all_rows:
+        for field in fields:
+            value = _to_float(row.get(field))
+            if value is None:
+                continue
+            field_stats = stats[field]
+            field_stats["count"] += 1
+            field_stats["sum"] += value
+            if field_stats["min"] is None or value < field_stats["min"]:
+                field_stats["min"] = value
+            if field_stats["max"] is None or value > field_stats["max"]:
+                field_stats["max"] = value
+
+    last_row = all_rows[-1] if all_rows else {}
+    for field in fields:
+        stats[field]["last"] = _to_float(last_row.get(field)) or 0.0
+
+    return {
+        "version": SUMMARY_VERSION,
+        "source_size": st.st_size,
+        "source_mtime_ns": st.st_mtime_ns,
+        "rows": len(all_rows),
+        "last_timestamp": last_row.get("timestamp"),
+        "fields": stats,
+        "samples": [all_rows[i] for i in sample_indexes(len(all_rows), samples)],
+    }
+
+
+def write_summary(csv_path, summary):
+    path = summary_path(csv_path)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _is_fresh(summary, csv_path):
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return False
+    return (summary.get("version") == SUMMARY_VERSION
+            and summary.get("source_size") == st.st_size
+            and summary.get("source_mtime_ns") == st.st_mtime_ns)
+
+
+def load_summary(csv_path, persist=True):
+    """Сводка за день из файла-спутника; строится (и сохраняется) при необходимости.
+
+    persist=False - для файла текущего дня, который ещё дописывается.
+    """
+    if not os.path.isfile(csv_path):
+        return None
+
+    try:
+        with open(summary_path(csv_path), 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        if _is_fresh(summary, csv_path):
+            return summary
+    except (OSError, ValueError):
+        pass
+
+    summary = build_summary(csv_path)
+    if persist:
+        try:
+            write_summary(csv_path, summary)
+        except OSError as e:
+            print(f"Не удалось сохранить сводку для {csv_path}: {e}")
+    return summary
+
+
+def summarize_in_background(csv_path):
+    def worker():
+        try:
+            load_summary(csv_path)
+        except Exception as e:
+            print(f"Ошибка при построении сводки для {csv_path}: {e}")
+
+    threading.Thread(target=worker, daemon=True).start()
+
+
+def field_average(summary, field):
+    # Среднее по всем строкам дня: пустые значения считаются нулём, как и раньше
+    rows = summary["rows"]
+    return summary["fields"][field]["sum"] / rows if rows else 0.0
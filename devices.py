@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+
+from columnar_store import ColumnarDay, columnar_path, sort_rows
+from sensor_schema import CSV_HEADERS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEVICES_FILE = "devices.json"
+# Без devices.json - единственный прежний бокс
+DEFAULT_DEVICES = [{"device_id": "esp1", "name": "Гроубокс 1"}]
+# device_id становится именем каталога: без разделителей пути и точек в начале
+DEVICE_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+# Блокировка разбиения: при старте его могут начать сразу несколько воркеров
+SHARD_LOCK_FILE = ".shard.lock"
+
+
+class Device:
+    def __init__(self, device_id, name=None, location=None, enabled=True, **meta):
+        if not isinstance(device_id, str) or not DEVICE_ID_PATTERN.match(device_id):
+            raise ValueError(f"Недопустимый device_id: {device_id!r}")
+        self.device_id = device_id
+        self.name = name or device_id
+        self.location = location
+        self.enabled = bool(enabled)
+        # Остальные поля из конфига (культура, прошивка, ...) - как есть
+        self.meta = meta
+
+    def to_dict(self):
+        return dict(self.meta, device_id=self.device_id, name=self.name, location=self.location,
+                    enabled=self.enabled)
+
+
+class DeviceRegistry:
+    """Известные серверу устройства; первое включённое - устройство по умолчанию для чтения."""
+
+    def __init__(self, devices):
+        self._devices = {}
+        for device in devices:
+            if device.device_id in self._devices:
+                raise ValueError(f"Устройство {device.device_id} описано дважды")
+            self._devices[device.device_id] = device
+        if not self.ids():
+            raise ValueError("Нет ни одного включённого устройства")
+
+    def get(self, device_id):
+        device = self._devices.get(device_id)
+        return device if device is not None and device.enabled else None
+
+    def known(self, device_id):
+        return self.get(device_id) is not None
+
+    def ids(self):
+        return [device_id for device_id, device in self._devices.items() if device.enabled]
+
+    @property
+    def default_id(self):
+        return self.ids()[0]
+
+    def to_list(self):
+        return [device.to_dict() for device in self._devices.values()]
+
+
+def load_registry(path=DEVICES_FILE, defaults=DEFAULT_DEVICES):
+    """Реестр из JSON-файла (список объектов с device_id и метаданными); без файла - defaults."""
+    specs = defaults
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            specs = json.load(f)
+    return DeviceRegistry([Device(**spec) for spec in specs])
+
+
+def day_csv_path(data_folder, day, device_id=None):
+    """<data_folder>/<device_id>/<day>.csv; без device_id - прежний общий файл <data_folder>/<day>.csv."""
+    if device_id:
+        return os.path.join(data_folder, device_id, f'{day}.csv')
+    return os.path.join(data_folder, f'{day}.csv')
+
+
+def device_folders(data_folder):
+    """{device_id: каталог} для всех каталогов устройств в data_folder."""
+    if not os.path.isdir(data_folder):
+        return {}
+    return {
+        name: os.path.join(data_folder, name)
+        for name in sorted(os.listdir(data_folder))
+        # Колоночные копии общих дней (YYYY-MM-DD.col[.bak]) - не устройства
+        if DEVICE_ID_PATTERN.match(name) and not name.endswith(('.col', '.bak'))
+        and os.path.isdir(os.path.join(data_folder, name))
+    }
+
+
+def available_days(folder, limit=None):
+    """Даты дневных CSV-файлов в каталоге, от новых к старым."""
+    days = sorted(
+        (os.path.basename(path)[:-len('.csv')] for path in glob.glob(os.path.join(folder, '????-??-??.csv'))),
+        reverse=True,
+    )
+    return days[:limit] if limit else days
+
+
+def _read_rows(path):
+    with open(path, 'r', newline='') as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+def shard_day_file(data_folder, csv_path, default_device):
+    """Разложить общий дневной файл по каталогам устройств; исходный переименовывается в .csv.bak."""
+    day = os.path.basename(csv_path)[:-len('.csv')]
+    by_device = {}
+    for row in _read_rows(csv_path):
+        device_id = row.get("device_id") or default_device
+        row["device_id"] = device_id
+        by_device.setdefault(device_id, []).append(row)
+
+    for device_id, rows in by_device.items():
+        shard_path = day_csv_path(data_folder, day, device_id)
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+        # Колоночную копию шарда, если она уже есть, дополняем теми же строками
+        shard_columns = ColumnarDay(columnar_path(shard_path))
+        if shard_columns.exists():
+            shard_columns.append([row for row in rows if row.get("timestamp")])
+        # Если сервер уже пишет в шард этого дня - объединяем по времени
+        if os.path.isfile(shard_path):
+            rows = sort_rows(rows + _read_rows(shard_path))
+        with open(shard_path + '.tmp', 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(CSV_HEADERS)
+            writer.writerows([row.get(key, "") for key in CSV_HEADERS] for row in rows)
+        os.replace(shard_path + '.tmp', shard_path)
+    os.replace(csv_path, csv_path + '.bak')
+    # Общая колоночная копия дня дублировала бы строки шардов при чтении истории
+    if os.path.isdir(columnar_path(csv_path)):
+        os.replace(columnar_path(csv_path), columnar_path(csv_path) + '.bak')
+    return {device_id: len(by_device[device_id]) for device_id in by_device}
+
+
+def legacy_day_files(data_folder):
+    """Общие дневные файлы box_data/YYYY-MM-DD.csv, оставшиеся с до разбиения по устройствам."""
+    return sorted(glob.glob(os.path.join(data_folder, '????-??-??.csv')))
+
+
+def shard_legacy_days(data_folder, default_device):
+    """Разложить все общие дневные файлы по каталогам устройств; {путь: {device_id: строк}}."""
+    if not legacy_day_files(data_folder):
+        return {}
+    with open(os.path.join(data_folder, SHARD_LOCK_FILE), 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Список заново под блокировкой: другой воркер мог уже всё разложить
+            return {path: shard_day_file(data_folder, path, default_device) for path in legacy_day_files(data_folder)}
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Реестр устройств и разбиение box_data по устройствам")
+    parser.add_argument("--config", default=DEVICES_FILE)
+    parser.add_argument("--data", default="box_data")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    commands.add_parser("shard", help="разложить старые box_data/YYYY-MM-DD.csv по каталогам устройств")
+    args = parser.parse_args()
+
+    registry = load_registry(args.config)
+    if args.command == "list":
+        for device in registry.to_list():
+            days = available_days(os.path.join(args.data, device["device_id"]))
+            state = "" if device["enabled"] else " (выключено)"
+            print(f"{device['device_id']}: {device['name']}{state}, дней данных: {len(days)}")
+    else:
+        for path, counts in shard_legacy_days(args.data, registry.default_id).items():
+            print(f"{path}: {', '.join(f'{device_id} - {count}' for device_id, count in counts.items())}")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import DEVICE_COLUMN
+from training_data import day_range, day_sources, read_day
+
+METHOD_MINMAX = "minmax"
+METHOD_LTTB = "lttb"
+METHODS = (METHOD_MINMAX, METHOD_LTTB)
+SERIES_POINTS = 500
+SERIES_MAX_POINTS = 10000
+SERIES_MAX_DAYS = 366
+
+
+def minmax_buckets(t, y, n_points):
+    """Индексы точек: минимум и максимум в каждом из n_points // 2 равных по времени интервалов.
+
+    Пики не теряются, как при выборке каждой N-й строки. t - отсортированные
+    метки (числа), y - значения без NaN.
+    """
+    n = len(t)
+    if n <= n_points:
+        return np.arange(n)
+    buckets = max(n_points // 2, 1)
+    span = t[-1] - t[0]
+    bucket = np.minimum(((t - t[0]) * buckets // max(span, 1)).astype(np.int64), buckets - 1)
+    # Внутри интервала - по возрастанию значения: первый - минимум, последний - максимум
+    order = np.lexsort((y, bucket))
+    sorted_bucket = bucket[order]
+    first = np.flatnonzero(np.r_[True, sorted_bucket[1:] != sorted_bucket[:-1]])
+    last = np.r_[first[1:] - 1, n - 1]
+    return np.unique(np.concatenate((order[first], order[last])))
+
+
+def lttb(t, y, n_points):
+    """Largest-Triangle-Three-Buckets: индексы n_points точек, сохраняющих форму графика.
+
+    Цикл только по интервалам (их n_points - 2), площади треугольников в
+    интервале считаются numpy за раз.
+    """
+    n = len(t)
+    if n <= n_points or n_points < 3:
+        return np.arange(n) if n <= n_points else np.array([0, n - 1])
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_points - 1).astype(np.int64)
+    selected = np.empty(n_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Третья вершина - среднее следующего интервала (для последнего - последняя точка)
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_t = t[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((t[a] - avg_t) * (y[lo:hi] - y[a]) - (t[a] - t[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+DOWNSAMPLERS = {METHOD_MINMAX: minmax_buckets, METHOD_LTTB: lttb}
+
+
+def load_series(data_folder, device_id, fields, start, end):
+    """Сырые показания устройства за [start, end) из всех попавших в диапазон дневных файлов."""
+    frames = []
+    for day in day_range(start.date(), (end - datetime.timedelta(microseconds=1)).date()):
+        for path in day_sources(data_folder, day, device_id):
+            df = read_day(path, fields)
+            df = df[(df[DEVICE_COLUMN] == device_id) & (df.index >= start) & (df.index < end)]
+            if len(df):
+                frames.append(df[list(fields)])
+    if not frames:
+        return pd.DataFrame(columns=list(fields), dtype=float)
+    return pd.concat(frames).sort_index()
+
+
+def downsample(t, y, n_points=SERIES_POINTS, method=METHOD_MINMAX):
+    """Метки datetime64[us] и значения -> не больше n_points точек; NaN отбрасываются."""
+    valid = ~np.isnan(y)
+    t, y = t[valid], y[valid]
+    keep = DOWNSAMPLERS[method](t.astype(np.int64), y, n_points)
+    return t[keep], y[keep]
+
+
+def downsample_series(df, fields, n_points=SERIES_POINTS, method=METHOD_MINMAX):
+    """{поле: (метки datetime64[us], значения)} не длиннее n_points; пропуски в каждом поле отдельно."""
+    t = df.index.to_numpy(dtype='datetime64[us]')
+    return {
+        field: downsample(t, pd.to_numeric(df[field], errors='coerce').to_numpy(dtype=float), n_points, method)
+        for field in fields
+    }
+
+
+def series_to_json(series):
+    """Тот же формат, что *_data в /data: [{"timestamp": ..., поле: значение}, ...]."""
+    return {
+        field: [
+            {"timestamp": timestamp, field: value}
+            for timestamp, value in zip(np.datetime_as_string(t, unit='s').tolist(), y.tolist())
+        ]
+        for field, (t, y) in series.items()
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Прореженный ряд показаний за произвольный период")
+    parser.add_argument("device")
+    parser.add_argument("start", help="ISO 8601")
+    parser.add_argument("end", help="ISO 8601")
+    parser.add_argument("--field", action="append", default=None)
+    parser.add_argument("--points", type=int, default=SERIES_POINTS)
+    parser.add_argument("--method", choices=METHODS, default=METHOD_MINMAX)
+    parser.add_argument("--data", default="box_data")
+    args = parser.parse_args()
+
+    fields = args.field or ["air_temperature", "air_humidity"]
+    df = load_series(args.data, args.device, fields, datetime.datetime.fromisoformat(args.start),
+                     datetime.datetime.fromisoformat(args.end))
+    for field, (t, y) in downsample_series(df, fields, args.points, args.method).items():
+        print(f"{field}: {df[field].notna().sum()} -> {len(t)} точек")
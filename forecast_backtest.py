@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import platform
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+import statsmodels
+from sklearn.preprocessing import MinMaxScaler
+
+from forecast_script import (
+    INPUT_LEN, FORECAST_STEPS, ARIMA_TRAIN_LEN, ARIMA_ORDER, FIELDS, TCN_EPOCHS, TRAIN_STRIDE,
+    fit_arima, make_dataset, build_tcn, train_tcn,
+)
+from training_data import TrainingDataLoader, segments
+
+BACKTEST_ORIGINS = 20
+BACKTEST_HORIZONS = (1, 10, 100, 600, 1200)
+BACKTEST_MODELS = ("naive", "arima", "tcn")
+BACKTEST_SEED = 42
+# Доля истории перед первой точкой отсчёта (обучающая часть для TCN)
+BACKTEST_TRAIN_FRACTION = 0.5
+REPORT_FILE = "backtest_report.json"
+
+
+class PeakRss:
+    """Пиковый RSS процесса за время блока with (опрос psutil в фоновом потоке)."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+class Timer:
+    """Суммарное время по стене и CPU процесса за несколько блоков with."""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.count = 0
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall += time.perf_counter() - self._wall
+        self.cpu += time.process_time() - self._cpu
+        self.count += 1
+
+
+def choose_origins(parts, context, steps, count, train_fraction=BACKTEST_TRAIN_FRACTION):
+    """Точки отсчёта (кусок, позиция), равномерно по времени; перед каждой context точек, после - steps.
+
+    Первые train_fraction возможных точек пропускаются, чтобы TCN было на чём обучиться.
+    """
+    candidates = [
+        (part_index, position)
+        for part_index, part in enumerate(parts)
+        for position in range(context, len(part) - steps + 1)
+    ]
+    candidates = candidates[int(len(candidates) * train_fraction):]
+    if not candidates:
+        return []
+    picks = np.unique(np.linspace(0, len(candidates) - 1, count).astype(int))
+    return [candidates[i] for i in picks]
+
+
+def _metrics(errors):
+    # NaN - точка отсчёта, где модель не обучилась; в среднее не входит
+    errors = errors[~np.isnan(errors)]
+    if not errors.size:
+        return {"mae": None, "rmse": None}
+    return {"mae": float(np.mean(np.abs(errors))), "rmse": float(np.sqrt(np.mean(errors ** 2)))}
+
+
+def error_metrics(errors, horizons, fields):
+    """errors: (точки отсчёта, шаги, поля) -> MAE/RMSE по горизонтам и в целом, без неудавшихся прогнозов."""
+    result = {"horizons": {}, "overall": {}, "failed_origins": {}}
+    for horizon in horizons:
+        step_errors = errors[:, horizon - 1]
+        result["horizons"][str(horizon)] = {field: _metrics(step_errors[:, i]) for i, field in enumerate(fields)}
+    for i, field in enumerate(fields):
+        result["overall"][field] = _metrics(errors[:, :, i])
+        result["failed_origins"][field] = int(np.isnan(errors[:, :, i]).all(axis=1).sum())
+    return result
+
+
+def _format_metric(value):
+    return f"{value:>9.4f}" if value is not None else f"{'-':>9}"
+
+
+class Backtest:
+    """Оценка моделей прогноза со скользящей точкой отсчёта (rolling origin) по истории box_data.
+
+    В каждой точке отсчёта модель видит только данные до неё и прогнозирует
+    forecast_steps шагов; ошибки сводятся в MAE/RMSE по горизонтам. ARIMA
+    переобучается в каждой точке (как в forecast_script.py), TCN обучается один
+    раз на данных до первой точки отсчёта. naive - последнее значение, базовая линия.
+    """
+
+    def __init__(self, parts, input_len=INPUT_LEN, forecast_steps=FORECAST_STEPS, arima_train_len=ARIMA_TRAIN_LEN,
+                 arima_order=ARIMA_ORDER, tcn_epochs=TCN_EPOCHS, stride=TRAIN_STRIDE, origins=BACKTEST_ORIGINS,
+                 horizons=BACKTEST_HORIZONS, seed=BACKTEST_SEED, fields=FIELDS,
+                 train_fraction=BACKTEST_TRAIN_FRACTION):
+        self.parts = parts
+        self.input_len = input_len
+        self.forecast_steps = forecast_steps
+        self.arima_train_len = arima_train_len
+        self.arima_order = arima_order
+        self.tcn_epochs = tcn_epochs
+        self.stride = stride
+        self.horizons = [h for h in horizons if h <= forecast_steps]
+        self.seed = seed
+        self.fields = list(fields)
+        self.train_fraction = train_fraction
+        self.origins = choose_origins(parts, max(input_len, arima_train_len), forecast_steps, origins, train_fraction)
+
+    def _actual(self, part_index, position):
+        return self.parts[part_index].iloc[position:position + self.forecast_steps][self.fields].to_numpy()
+
+    def _history(self, part_index, position, length):
+        return self.parts[part_index].iloc[position - length:position][self.fields].to_numpy()
+
+    def run_naive(self, train, infer):
+        errors = []
+        for part_index, position in self.origins:
+            with infer:
+                last = self._history(part_index, position, 1)[-1]
+                preds = np.repeat(last[np.newaxis], self.forecast_steps, axis=0)
+            errors.append(preds - self._actual(part_index, position))
+        return errors
+
+    def run_arima(self, train, infer):
+        errors = []
+        for part_index, position in self.origins:
+            history = self._history(part_index, position, self.arima_train_len)
+            preds = np.full((self.forecast_steps, len(self.fields)), np.nan)
+            for i in range(len(self.fields)):
+                with train:
+                    model = fit_arima(history[:, i], self.arima_order)
+                if model is not None:
+                    with infer:
+                        preds[:, i] = model.forecast(steps=self.forecast_steps)
+            errors.append(preds - self._actual(part_index, position))
+        return errors
+
+    def run_tcn(self, train, infer):
+        import tensorflow as tf
+        tf.keras.utils.set_random_seed(self.seed)
+
+        # Обучение только на данных строго до первой точки отсчёта
+        first_time = self.parts[self.origins[0][0]].index[self.origins[0][1]]
+        train_parts = [part[part.index < first_time][self.fields] for part in self.parts]
+        train_parts = [part for part in train_parts if len(part)]
+        if not train_parts:
+            return []
+        with train:
+            scaler = MinMaxScaler().fit(pd.concat(train_parts))
+            dataset = make_dataset([scaler.transform(part) for part in train_parts], self.stride,
+                                   self.input_len, self.forecast_steps)
+            if not dataset.window_count:
+                return []
+            model_tcn = build_tcn(len(self.fields), self.input_len, self.forecast_steps)
+            train_tcn(model_tcn, dataset, self.tcn_epochs)
+
+        errors = []
+        for part_index, position in self.origins:
+            window = scaler.transform(pd.DataFrame(self._history(part_index, position, self.input_len),
+                                                   columns=self.fields))
+            with infer:
+                scaled = model_tcn.predict(window[np.newaxis], verbose=0)
+            preds = scaler.inverse_transform(scaled.reshape(self.forecast_steps, len(self.fields)))
+            errors.append(preds - self._actual(part_index, position))
+        return errors
+
+    def evaluate(self, model_name):
+        train, infer = Timer(), Timer()
+        print(f"Бэктест {model_name} по {len(self.origins)} точкам отсчёта...")
+        with PeakRss() as rss:
+            errors = getattr(self, f"run_{model_name}")(train, infer)
+        if not errors:
+            return {"error": "недостаточно данных для обучения"}
+
+        result = {
+            "origins": len(errors),
+            "train_seconds": round(train.wall, 3),
+            "train_cpu_seconds": round(train.cpu, 3),
+            "inference_ms_mean": round(1000 * infer.wall / max(len(errors), 1), 3),
+            "inference_cpu_seconds": round(infer.cpu, 3),
+            "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        }
+        result.update(error_metrics(np.asarray(errors), self.horizons, self.fields))
+        return result
+
+    def config(self):
+        return {
+            "input_len": self.input_len, "forecast_steps": self.forecast_steps,
+            "arima_train_len": self.arima_train_len, "arima_order": list(self.arima_order),
+            "tcn_epochs": self.tcn_epochs, "stride": self.stride, "horizons": self.horizons,
+            "seed": self.seed, "fields": self.fields, "origins": len(self.origins),
+            "train_fraction": self.train_fraction,
+        }
+
+
+def print_report(report):
+    print(f"{'модель':<7} {'горизонт':>8} {'поле':<16} {'MAE':>9} {'RMSE':>9}")
+    for name, result in report["models"].items():
+        if "error" in result:
+            print(f"{name:<7} {result['error']}")
+            continue
+        for horizon, by_field in result["horizons"].items():
+            for field, metrics in by_field.items():
+                print(f"{name:<7} {horizon:>8} {field:<16} {_format_metric(metrics['mae'])} "
+                      f"{_format_metric(metrics['rmse'])}")
+        failed = {field: count for field, count in result.get("failed_origins", {}).items() if count}
+        if failed:
+            print(f"{name:<7} не удалось обучить (точек отсчёта из {result['origins']}): "
+                  + ", ".join(f"{field} - {count}" for field, count in failed.items()))
+        print(f"{name:<7} обучение {result['train_seconds']} с (CPU {result['train_cpu_seconds']} с), "
+              f"прогноз {result['inference_ms_mean']} мс, пик RSS {result['peak_rss_mb']} МБ")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Бэктест моделей прогноза со скользящей точкой отсчёта")
+    parser.add_argument("start", help="первый день, YYYY-MM-DD")
+    parser.add_argument("end", help="последний день, YYYY-MM-DD")
+    parser.add_argument("--device", help="устройство; по умолчанию все вместе")
+    parser.add_argument("--data", default="box_data")
+    parser.add_argument("--models", default=",".join(BACKTEST_MODELS))
+    parser.add_argument("--origins", type=int, default=BACKTEST_ORIGINS)
+    parser.add_argument("--input-len", type=int, default=INPUT_LEN)
+    parser.add_argument("--forecast-steps", type=int, default=FORECAST_STEPS)
+    parser.add_argument("--arima-train-len", type=int, default=ARIMA_TRAIN_LEN)
+    parser.add_argument("--epochs", type=int, default=TCN_EPOCHS)
+    parser.add_argument("--stride", type=int, default=TRAIN_STRIDE)
+    parser.add_argument("--seed", type=int, default=BACKTEST_SEED)
+    parser.add_argument("--train-fraction", type=float, default=BACKTEST_TRAIN_FRACTION)
+    parser.add_argument("--out", default=REPORT_FILE)
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    grid = TrainingDataLoader(args.data, FIELDS).load(args.start, args.end, args.device)
+    backtest = Backtest(segments(grid), args.input_len, args.forecast_steps, args.arima_train_len,
+                        tcn_epochs=args.epochs, stride=args.stride, origins=args.origins, seed=args.seed,
+                        train_fraction=args.train_fraction)
+    if not backtest.origins:
+        print("Недостаточно непрерывных данных для бэктеста")
+        raise SystemExit(1)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec='seconds'),
+        "data": {"start": args.start, "end": args.end, "device": args.device,
+                 "points": int(grid.notna().all(axis=1).sum())},
+        "config": backtest.config(),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                        "pandas": pd.__version__, "statsmodels": statsmodels.__version__,
+                        "cpu_count": psutil.cpu_count()},
+        "models": {name: backtest.evaluate(name) for name in args.models.split(",") if name},
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    print(f"Отчёт сохранён в {args.out}")
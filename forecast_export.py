@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import pickle
+
+from forecast_predict import EXPORT_DIR, TFLITE_FILE, META_FILE
+from forecast_script import INPUT_LEN, FORECAST_STEPS, FIELDS, STEP_SECONDS, build_tcn
+
+
+def export_tflite(model_tcn, scaler, export_dir=EXPORT_DIR, fields=FIELDS):
+    """Обученная TCN -> tcn.tflite и meta.json (параметры окна и MinMaxScaler) для forecast_predict.py."""
+    import tensorflow as tf
+
+    os.makedirs(export_dir, exist_ok=True)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model_tcn)
+    flatbuffer = converter.convert()
+
+    tflite_path = os.path.join(export_dir, TFLITE_FILE)
+    with open(tflite_path + '.tmp', 'wb') as f:
+        f.write(flatbuffer)
+    os.replace(tflite_path + '.tmp', tflite_path)
+
+    meta = {
+        "input_len": INPUT_LEN,
+        "forecast_steps": FORECAST_STEPS,
+        "step_seconds": STEP_SECONDS,
+        "fields": list(fields),
+        # MinMaxScaler: x_scaled = x * scale + min
+        "scale": [float(value) for value in scaler.scale_],
+        "min": [float(value) for value in scaler.min_],
+    }
+    with open(os.path.join(export_dir, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    print(f"Модель экспортирована в {tflite_path} ({len(flatbuffer) // 1024} КБ)")
+    return tflite_path
+
+
+def export_saved(model_dir, export_dir=EXPORT_DIR):
+    """Экспорт из каталога forecast_service.py (tcn.weights.h5 + models.pkl)."""
+    with open(os.path.join(model_dir, 'models.pkl'), 'rb') as f:
+        scaler = pickle.load(f)["scaler"]
+    model_tcn = build_tcn(len(FIELDS))
+    model_tcn.load_weights(os.path.join(model_dir, 'tcn.weights.h5'))
+    return export_tflite(model_tcn, scaler, export_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Экспорт обученной TCN в TFLite")
+    parser.add_argument("--models", default="forecast_models", help="каталог forecast_service.py")
+    parser.add_argument("--out", default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    export_saved(args.models, args.out)
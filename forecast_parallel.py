@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from forecast_script import (
+    FORECAST_STEPS, ARIMA_TRAIN_LEN, ARIMA_ORDER, FIELDS, TRAIN_STRIDE,
+    fit_arima, tcn_forecast, future_index, save_forecasts, _write_csv,
+)
+from sensor_schema import NUMERIC_FIELDS
+from training_data import TrainingDataLoader, segments
+
+FORECAST_ALL_FILE = "forecast_all.csv"
+# Число процессов для ARIMA; None - по числу ядер
+FORECAST_WORKERS = None
+
+
+def _arima_job(key, values, steps, order):
+    """Выполняется в процессе пула: ARIMA по одному ряду (устройство, поле)."""
+    started = time.monotonic()
+    model = fit_arima(values, order)
+    preds = None if model is None else np.asarray(model.forecast(steps=steps))
+    return key, preds, time.monotonic() - started
+
+
+def last_run(series, min_length=10, max_length=ARIMA_TRAIN_LEN):
+    """Хвост последнего непрерывного куска ряда без пропусков (не длиннее max_length)."""
+    parts = segments(series.to_frame(), min_length)
+    return parts[-1].iloc[-max_length:, 0] if parts else None
+
+
+class ParallelForecaster:
+    """Прогноз всех полей всех устройств за время самой медленной модели.
+
+    ARIMA по каждому ряду (устройство, поле) считается в пуле процессов,
+    TCN по air_temperature/air_humidity тем временем обучается в основном
+    процессе. Результат - один файл forecast_all.csv в длинном формате
+    (timestamp, device_id, field, model, value).
+    """
+
+    def __init__(self, data_folder='box_data', fields=NUMERIC_FIELDS, workers=FORECAST_WORKERS,
+                 steps=FORECAST_STEPS, order=ARIMA_ORDER, stride=TRAIN_STRIDE, output_folder='.'):
+        self.fields = list(fields)
+        self.workers = workers
+        self.steps = steps
+        self.order = order
+        self.stride = stride
+        self.output_folder = output_folder
+        # Ряды по отдельности: пропуск в одном датчике не выбрасывает остальные
+        self.loader = TrainingDataLoader(data_folder, self.fields, require_all_fields=False)
+
+    def run(self, start, end, device_ids=(None,)):
+        started = time.monotonic()
+        grids = {
+            device_id: grid
+            for device_id, grid in self.loader.load_devices(start, end, device_ids).items()
+            if len(grid)
+        }
+        if not grids:
+            print(f"Ошибка: Недостаточно данных за {start} - {end} ни по одному устройству.")
+            return []
+
+        jobs = {}
+        for device_id, grid in grids.items():
+            for field in self.fields:
+                series = last_run(grid[field]) if field in grid else None
+                if series is not None:
+                    jobs[(device_id, field)] = series
+
+        arima_preds = {}
+        tcn_preds = {}
+        timings = {}
+        # spawn, а не fork: в основном процессе параллельно работает TensorFlow
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(_arima_job, key, series.to_numpy(), self.steps, self.order)
+                for key, series in jobs.items()
+            ]
+
+            for device_id, grid in grids.items():
+                if not all(field in grid for field in FIELDS):
+                    continue
+                frames = segments(grid[FIELDS])
+                if frames:
+                    tcn_started = time.monotonic()
+                    tcn_preds[device_id] = (frames[-1].index[-1], tcn_forecast(frames, self.stride))
+                    timings[(device_id, "tcn")] = time.monotonic() - tcn_started
+
+            for future in futures:
+                key, preds, seconds = future.result()
+                timings[key] = seconds
+                if preds is not None:
+                    arima_preds[key] = (jobs[key].index[-1], preds)
+
+        records = [
+            self._records(device_id, field, "arima", future_index(last_time, self.steps), preds)
+            for (device_id, field), (last_time, preds) in arima_preds.items()
+        ]
+        for device_id, (last_time, preds) in tcn_preds.items():
+            if preds is None:
+                continue
+            index = future_index(last_time, self.steps)
+            for i, field in enumerate(FIELDS):
+                records.append(self._records(device_id, field, "tcn", index, preds[:, i]))
+
+        if not records:
+            # Прежние прогнозы не затираем пустым файлом
+            print("Ошибка: Недостаточно данных для прогноза ни по одному ряду.")
+            return []
+        self._save(records)
+        self._save_dashboard_files(next(iter(grids)), tcn_preds, arima_preds)
+
+        for key, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+            print(f"{key[0] or 'все'} / {key[1]}: {seconds:.1f} с")
+        print(f"Все прогнозы за {time.monotonic() - started:.1f} с, "
+              f"сумма времени моделей {sum(timings.values()):.1f} с")
+        return records
+
+    @staticmethod
+    def _records(device_id, field, model, index, values):
+        return pd.DataFrame({
+            "timestamp": index, "device_id": device_id or "", "field": field, "model": model,
+            "value": np.asarray(values)[:len(index)],
+        })
+
+    def _save(self, records):
+        df = pd.concat(records) if records else pd.DataFrame(columns=["timestamp", "device_id", "field", "model", "value"])
+        _write_csv(df.set_index("timestamp"), os.path.join(self.output_folder, FORECAST_ALL_FILE))
+        print(f"Прогнозы ({len(records)} рядов) сохранены в {FORECAST_ALL_FILE}")
+
+    def _save_dashboard_files(self, device_id, tcn_preds, arima_preds):
+        # Прежние файлы для дашборда (forecast_store.py) - по первому устройству
+        last_time, preds = tcn_preds.get(device_id, (None, None))
+        if preds is None:
+            return
+        arima_time, arima = arima_preds.get((device_id, 'air_temperature'), (None, None))
+        # Общий индекс у файлов только если ARIMA считалась от той же последней точки
+        save_forecasts(future_index(last_time, self.steps), preds, arima if arima_time == last_time else None,
+                       FIELDS, self.output_folder)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Параллельный прогноз всех полей всех устройств")
+    parser.add_argument("start", help="первый день, YYYY-MM-DD")
+    parser.add_argument("end", nargs="?", help="последний день, по умолчанию сегодня")
+    parser.add_argument("--device", action="append", help="можно несколько; по умолчанию все вместе")
+    parser.add_argument("--field", action="append", help="поля; по умолчанию все числовые колонки")
+    parser.add_argument("--workers", type=int, default=FORECAST_WORKERS)
+    parser.add_argument("--data", default="box_data")
+    args = parser.parse_args()
+
+    forecaster = ParallelForecaster(args.data, args.field or NUMERIC_FIELDS, args.workers)
+    forecaster.run(args.start, args.end or datetime.date.today().isoformat(), args.device or [None])
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from csv_tail import read_last_rows
+from devices import load_registry, day_csv_path
+from training_data import MAX_GAP_SECONDS, to_grid, segments
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        Interpreter = None
+
+EXPORT_DIR = os.path.join('forecast_models', 'export')
+TFLITE_FILE = 'tcn.tflite'
+META_FILE = 'meta.json'
+
+
+def _interpreter_class():
+    if Interpreter is not None:
+        return Interpreter
+    # Запасной вариант: полный TensorFlow, если лёгкого рантайма нет
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TcnPredictor:
+    """Прогноз TCN по экспортированной модели (forecast_export.py) без Keras.
+
+    Нужны только numpy, pandas и tflite-runtime; модель и скейлер загружаются
+    один раз, predict() на окне input_len x признаки работает на CPU за миллисекунды.
+    """
+
+    def __init__(self, export_dir=EXPORT_DIR, num_threads=1):
+        with open(os.path.join(export_dir, META_FILE), 'r') as f:
+            self.meta = json.load(f)
+        self.fields = self.meta["fields"]
+        self.input_len = self.meta["input_len"]
+        self.forecast_steps = self.meta["forecast_steps"]
+        self.step = datetime.timedelta(seconds=self.meta["step_seconds"])
+        self._scale = np.asarray(self.meta["scale"], dtype=np.float32)
+        self._min = np.asarray(self.meta["min"], dtype=np.float32)
+
+        self.interpreter = _interpreter_class()(
+            model_path=os.path.join(export_dir, TFLITE_FILE), num_threads=num_threads
+        )
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]["index"]
+        self._output = self.interpreter.get_output_details()[0]["index"]
+
+    def predict(self, window):
+        """window: (input_len, признаки) в исходных единицах -> (forecast_steps, признаки)."""
+        window = np.asarray(window, dtype=np.float32)
+        if window.shape != (self.input_len, len(self.fields)):
+            raise ValueError(f"Ожидается окно {self.input_len}x{len(self.fields)}, получено {window.shape}")
+        scaled = window * self._scale + self._min
+        self.interpreter.set_tensor(self._input, scaled[np.newaxis])
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self._output).reshape(self.forecast_steps, len(self.fields))
+        return (output - self._min) / self._scale
+
+    def grid(self, rows, device_id=None):
+        """Строки CSV -> та же регулярная сетка, на которой обучалась модель (training_data.to_grid)."""
+        rows = [row for row in rows if device_id is None or row.get("device_id") == device_id]
+        if not rows:
+            return pd.DataFrame(columns=self.fields, dtype=float)
+        df = pd.DataFrame(rows)
+        df.index = pd.to_datetime(df["timestamp"], errors='coerce')
+        df = df[df.index.notna()]
+        df = df[self.fields].apply(pd.to_numeric, errors='coerce')
+        return to_grid(df, self.fields, int(self.step.total_seconds()), MAX_GAP_SECONDS)
+
+    def latest_window(self, csv_path, device_id=None, tail_rows=None, max_tail_rows=None):
+        """Последние input_len точек сетки из последнего непрерывного куска и метка последней из них.
+
+        Хвост файла перечитывается с удвоением, пока его не хватит на input_len
+        шагов сетки (при частой отправке строк больше, чем точек сетки).
+        """
+        tail_rows = tail_rows or self.input_len * 4
+        max_tail_rows = max_tail_rows or self.input_len * 64
+        while True:
+            rows = read_last_rows(csv_path, tail_rows)
+            parts = segments(self.grid(rows, device_id))
+            if parts and len(parts[-1]) >= self.input_len:
+                window = parts[-1].iloc[-self.input_len:]
+                return window.to_numpy(dtype=float), window.index[-1].to_pydatetime()
+            # Кусок короче окна, а файл кончился - данных действительно мало
+            if len(rows) < tail_rows or tail_rows >= max_tail_rows:
+                return None, None
+            tail_rows *= 2
+
+    def forecast_csv(self, csv_path, device_id=None):
+        """[(timestamp, {поле: значение}), ...] от последней точки сетки; None, если данных мало."""
+        window, last_time = self.latest_window(csv_path, device_id)
+        if window is None:
+            return None
+        preds = self.predict(window)
+        return [
+            (last_time + self.step * (i + 1), dict(zip(self.fields, preds[i].tolist())))
+            for i in range(self.forecast_steps)
+        ]
+
+
+def write_forecast_files(forecast, folder='.'):
+    """Те же forecast_temperature.csv / forecast_humidity.csv, что пишет forecast_script.py."""
+    for field, filename in (("air_temperature", "forecast_temperature.csv"), ("air_humidity", "forecast_humidity.csv")):
+        path = os.path.join(folder, filename)
+        with open(path + '.tmp', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["timestamp", field])
+            for timestamp, values in forecast:
+                writer.writerow([timestamp.isoformat(sep=' '), values[field]])
+        os.replace(path + '.tmp', path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Быстрый прогноз TCN по экспортированной модели")
+    parser.add_argument("--model", default=EXPORT_DIR)
+    parser.add_argument("--csv", help="по умолчанию сегодняшний файл устройства в box_data")
+    parser.add_argument("--device", help="по умолчанию первое устройство из devices.json")
+    parser.add_argument("--out", default=".", help="каталог для forecast_*.csv")
+    args = parser.parse_args()
+
+    if not args.csv:
+        args.device = args.device or load_registry().default_id
+        args.csv = day_csv_path("box_data", f"{datetime.date.today():%Y-%m-%d}", args.device)
+
+    started = time.monotonic()
+    predictor = TcnPredictor(args.model)
+    loaded = time.monotonic()
+    forecast = predictor.forecast_csv(args.csv, args.device)
+    if forecast is None:
+        print(f"Недостаточно данных в {args.csv} для окна из {predictor.input_len} точек")
+    else:
+        write_forecast_files(forecast, args.out)
+        print(f"Прогноз на {len(forecast)} шагов записан: загрузка {1000 * (loaded - started):.0f} мс, "
+              f"прогноз {1000 * (time.monotonic() - loaded):.0f} мс")
@@ -1,184 +1,275 @@
+import argparse
+import datetime
+import os # Добавим импорт os для проверки файла
+
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 from statsmodels.tsa.arima.model import ARIMA
-from tcn import TCN
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Input
-import os # Добавим импорт os для проверки файла
+from columnar_store import read_frame
+from windowing import WindowDataset
+from training_data import source_path
 
 # Параметры
 INPUT_LEN = 600
 FORECAST_STEPS = 1200
 # Длина данных для обучения ARIMA (например, такая же как INPUT_LEN, или больше/меньше)
 ARIMA_TRAIN_LEN = 600
+ARIMA_ORDER = (3, 1, 2)
 CSV_FILENAME = '2025-04-11.csv' # Убедитесь, что файл в текущей директории или укажите полный путь
+FIELDS = ['air_temperature', 'air_humidity']
+STEP_SECONDS = 6
+TCN_EPOCHS = 10
+# Шаг между соседними обучающими окнами (1 - каждое окно)
+TRAIN_STRIDE = 1
+
+FORECAST_TEMPERATURE_FILE = "forecast_temperature.csv"
+FORECAST_HUMIDITY_FILE = "forecast_humidity.csv"
+FORECAST_ARIMA_FILE = "forecast_temperature_arima.csv"
 
-# --- 1. Загрузка и подготовка ВСЕХ данных ---
-try:
-    df_full = pd.read_csv(CSV_FILENAME, parse_dates=['timestamp'])
-except FileNotFoundError:
-    print(f"Ошибка: Файл не найден: {CSV_FILENAME}")
-    exit() # Выход из скрипта, если файла нет
-
-df_full.set_index('timestamp', inplace=True)
-df_full = df_full[['air_temperature', 'air_humidity']].dropna()
-
-# Проверка достаточного количества данных для ВСЕГО процесса
-# Нам нужно как минимум ARIMA_TRAIN_LEN + INPUT_LEN для ARIMA и TCN предсказания
-# и еще FORECAST_STEPS для создания хотя бы одного y_tcn
-min_total_len = max(ARIMA_TRAIN_LEN, INPUT_LEN) + FORECAST_STEPS
-# Или, если ARIMA обучается до TCN входа: ARIMA_TRAIN_LEN + INPUT_LEN + FORECAST_STEPS
-# Для цикла TCN нужно хотя бы INPUT_LEN + FORECAST_STEPS точек
-min_tcn_loop_len = INPUT_LEN + FORECAST_STEPS
-
-if len(df_full) < min_tcn_loop_len:
-    print(f"Ошибка: Недостаточно данных в файле ({len(df_full)}).")
-    print(f"Требуется как минимум {min_tcn_loop_len} точек для создания обучающих выборок TCN.")
-    exit()
-
-# Попытка установить частоту индекса (убирает предупреждения statsmodels)
-inferred_freq = pd.infer_freq(df_full.index)
-if inferred_freq:
-    print(f"Определена частота данных: {inferred_freq}")
-    df_full.index.freq = inferred_freq
-elif (df_full.index.to_series().diff().mode() == pd.Timedelta(seconds=6)).any(): # Проверка, если основная частота 6 сек
-     print("Установка предполагаемой частоты '6S'")
-     try:
-         df_full.index.freq = '6S'
-     except ValueError:
-         print("Предупреждение: Не удалось установить частоту '6S', индекс может быть нерегулярным.")
-else:
-    print("Предупреждение: Не удалось определить частоту данных. Forecasting ARIMA может использовать числовые индексы.")
+
+# --- 1. Загрузка и подготовка данных ---
+def load_frame(csv_filename=CSV_FILENAME, fields=FIELDS):
+    """Данные дня с индексом timestamp; None, если файла нет."""
+    # Если рядом есть колоночная копия (columnar_store.py), читаем её без разбора текста
+    source = source_path(csv_filename)
+    if source and source.endswith('.col'):
+        df = read_frame(source, fields)
+    else:
+        try:
+            df = pd.read_csv(csv_filename, parse_dates=['timestamp'])
+        except FileNotFoundError:
+            print(f"Ошибка: Файл не найден: {csv_filename}")
+            return None
+        df.set_index('timestamp', inplace=True)
+    return df[fields].dropna()
+
+
+def set_frequency(df):
+    # Попытка установить частоту индекса (убирает предупреждения statsmodels)
+    inferred_freq = pd.infer_freq(df.index)
+    if inferred_freq:
+        print(f"Определена частота данных: {inferred_freq}")
+        df.index.freq = inferred_freq
+    elif (df.index.to_series().diff().mode() == pd.Timedelta(seconds=STEP_SECONDS)).any(): # Проверка, если основная частота 6 сек
+        print("Установка предполагаемой частоты '6S'")
+        try:
+            df.index.freq = '6S'
+        except ValueError:
+            print("Предупреждение: Не удалось установить частоту '6S', индекс может быть нерегулярным.")
+    else:
+        print("Предупреждение: Не удалось определить частоту данных. Forecasting ARIMA может использовать числовые индексы.")
+    return df
 
 
 # --- 2. ARIMA ---
-print("Подготовка и обучение ARIMA...")
-# Данные для ARIMA: берем ARIMA_TRAIN_LEN точек ПЕРЕД последними INPUT_LEN
-if len(df_full) >= ARIMA_TRAIN_LEN + INPUT_LEN:
-    arima_train_data = df_full['air_temperature'].iloc[-(ARIMA_TRAIN_LEN + INPUT_LEN):-INPUT_LEN]
-    print(f"Используется {len(arima_train_data)} точек для обучения ARIMA.")
-elif len(df_full) > INPUT_LEN:
-     arima_train_data = df_full['air_temperature'].iloc[:-INPUT_LEN]
-     print(f"Предупреждение: Данных меньше, чем ARIMA_TRAIN_LEN + INPUT_LEN. Используется {len(arima_train_data)} точек для обучения ARIMA.")
-else:
-    arima_train_data = pd.Series([]) # Пустой Series
-    print("Ошибка: Недостаточно данных для выделения обучающей выборки ARIMA.")
-
-arima_preds = None
-if len(arima_train_data) >= 10: # Минимальный порог для ARIMA
+def arima_train_slice(series, train_len=ARIMA_TRAIN_LEN, input_len=INPUT_LEN):
+    # Данные для ARIMA: берем train_len точек ПЕРЕД последними input_len
+    if len(series) >= train_len + input_len:
+        train_data = series.iloc[-(train_len + input_len):-input_len]
+        print(f"Используется {len(train_data)} точек для обучения ARIMA.")
+    elif len(series) > input_len:
+        train_data = series.iloc[:-input_len]
+        print(f"Предупреждение: Данных меньше, чем ARIMA_TRAIN_LEN + INPUT_LEN. Используется {len(train_data)} точек для обучения ARIMA.")
+    else:
+        train_data = pd.Series([], dtype=float) # Пустой Series
+        print("Ошибка: Недостаточно данных для выделения обучающей выборки ARIMA.")
+    return train_data
+
+
+def fit_arima(train_data, order=ARIMA_ORDER):
+    """Обученная модель ARIMA или None."""
+    if len(train_data) < 10: # Минимальный порог для ARIMA
+        print("Слишком мало данных для обучения ARIMA. Пропускаем.")
+        return None
     try:
         # Передаем данные с возможно установленной частотой
-        arima_model = ARIMA(arima_train_data, order=(3,1,2)).fit()
-        # Прогнозируем на FORECAST_STEPS шагов вперед
-        arima_preds = arima_model.forecast(steps=FORECAST_STEPS)
-        print("ARIMA модель обучена и прогноз сделан.")
+        return ARIMA(train_data, order=order).fit()
     except (np.linalg.LinAlgError, ValueError, Exception) as e: # Ловим больше ошибок
-        print(f"Ошибка при обучении или прогнозировании ARIMA: {e}")
-        print("Прогноз ARIMA будет пропущен.")
-else:
-    print("Слишком мало данных для обучения ARIMA. Пропускаем.")
+        print(f"Ошибка при обучении ARIMA: {e}")
+        return None
+
 
 # --- 3. TCN ---
-print("Подготовка данных и обучение TCN...")
-scaler = MinMaxScaler()
-# Масштабируем ВЕСЬ доступный набор данных
-scaled_full = scaler.fit_transform(df_full)
-
-X_tcn, y_tcn = [], []
-# Цикл по масштабированным полным данным для создания обучающих выборок
-# Должно быть достаточно данных: len(scaled_full) >= INPUT_LEN + FORECAST_STEPS
-num_samples_possible = len(scaled_full) - INPUT_LEN - FORECAST_STEPS + 1
-if num_samples_possible > 0:
-    print(f"Создание {num_samples_possible} обучающих выборок для TCN...")
-    for i in range(num_samples_possible):
-        X_tcn.append(scaled_full[i : i + INPUT_LEN])
-        # y должен содержать FORECAST_STEPS точек для КАЖДОГО из признаков
-        y_tcn.append(scaled_full[i + INPUT_LEN : i + INPUT_LEN + FORECAST_STEPS])
-    X_tcn, y_tcn = np.array(X_tcn), np.array(y_tcn)
-    print(f"Форма X_tcn: {X_tcn.shape}, Форма y_tcn: {y_tcn.shape}") # Отладочный вывод
-else:
-    print(f"Ошибка: Недостаточно данных ({len(scaled_full)}) для создания хотя бы одной выборки TCN (требуется {INPUT_LEN + FORECAST_STEPS}).")
-    X_tcn, y_tcn = np.array([]), np.array([]) # Создаем пустые массивы
-
-future_pred = None # Инициализируем переменную для прогноза TCN
-if X_tcn.shape[0] > 1: # Нужно хотя бы 2 выборки: одна для обучения, одна для предсказания
-    X_train_tcn = X_tcn[:-1]
-    # y_tcn имеет форму (n_samples, forecast_steps, n_features)
-    # Преобразуем y для Dense слоя: (n_samples, forecast_steps * n_features)
-    y_train_tcn = y_tcn[:-1].reshape(X_train_tcn.shape[0], -1) # Правильный reshape!
-
-    # Последняя последовательность X для финального предсказания
-    latest_input_scaled = X_tcn[-1:]
-
-    print(f"Форма X_train_tcn: {X_train_tcn.shape}, Форма y_train_tcn: {y_train_tcn.shape}")
-    print(f"Форма latest_input_scaled: {latest_input_scaled.shape}")
-
-    # Определение и обучение модели TCN
-    n_features = df_full.shape[1] # Количество признаков (2 в вашем случае)
+def make_dataset(segments, stride=TRAIN_STRIDE, input_len=INPUT_LEN, forecast_steps=FORECAST_STEPS):
+    """Окна для TCN поверх масштабированных кусков данных, без копии каждого окна."""
+    return WindowDataset(segments, input_len, forecast_steps, stride=stride)
+
+
+def build_tcn(n_features, input_len=INPUT_LEN, forecast_steps=FORECAST_STEPS):
+    # TensorFlow импортируется только там, где действительно нужна модель
+    from tcn import TCN
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Input
+
     model_tcn = Sequential([
-        Input(shape=(INPUT_LEN, n_features)),
+        Input(shape=(input_len, n_features)),
         TCN(nb_filters=64, kernel_size=4, dilations=[1, 2, 4, 8], return_sequences=False),
-        Dense(FORECAST_STEPS * n_features) # Выходной слой должен соответствовать reshape для y_train_tcn
+        Dense(forecast_steps * n_features) # Выходной слой должен соответствовать reshape для y
     ])
     model_tcn.compile(optimizer='adam', loss='mse')
+    return model_tcn
+
+
+def train_tcn(model_tcn, dataset, epochs=TCN_EPOCHS):
+    # Батчи собираются генератором: в памяти только текущий батч, а не все окна сразу
+    print(f"Обучение TCN на {dataset.window_count} выборках...")
+    model_tcn.fit(dataset.forever(), steps_per_epoch=len(dataset), epochs=epochs, verbose=1)
+
+
+def predict_tcn(model_tcn, scaler, latest_input_scaled, forecast_steps=FORECAST_STEPS):
+    n_features = latest_input_scaled.shape[-1]
+    future_pred_scaled = model_tcn.predict(latest_input_scaled, verbose=0).reshape(forecast_steps, n_features)
+    return scaler.inverse_transform(future_pred_scaled)
+
+
+# --- 4. Временной индекс и сохранение результатов ---
+def future_index(last_time, steps=FORECAST_STEPS):
+    # Время для прогноза начинается после последней точки в ИСХОДНЫХ данных
+    step = pd.Timedelta(seconds=STEP_SECONDS)
+    return pd.date_range(start=last_time + step, periods=steps, freq=step)
+
+
+def _write_csv(df, filename):
+    # Через временный файл: сервер не прочитает наполовину записанный прогноз
+    tmp_name = filename + ".tmp"
+    df.to_csv(tmp_name)
+    os.replace(tmp_name, filename)
+
+
+def save_forecasts(future_time, future_pred=None, arima_preds=None, columns=FIELDS, folder='.'):
+    # Сохранение прогноза TCN (если он был сделан)
+    if future_pred is not None:
+        df_forecast = pd.DataFrame(future_pred, columns=columns, index=future_time)
+        df_forecast.index.name = 'timestamp'
+        _write_csv(df_forecast[['air_temperature']], os.path.join(folder, FORECAST_TEMPERATURE_FILE))
+        _write_csv(df_forecast[['air_humidity']], os.path.join(folder, FORECAST_HUMIDITY_FILE))
+        print("Прогнозы TCN сохранены в forecast_temperature.csv и forecast_humidity.csv")
+    else:
+        # Создаем пустые файлы или файлы с NaN, чтобы показать отсутствие прогноза
+        df_empty = pd.DataFrame(index=future_time, columns=['air_temperature'])
+        _write_csv(df_empty, os.path.join(folder, FORECAST_TEMPERATURE_FILE))
+        df_empty['air_humidity'] = np.nan # Добавляем колонку влажности
+        _write_csv(df_empty[['air_humidity']], os.path.join(folder, FORECAST_HUMIDITY_FILE))
+        print("Файлы прогнозов TCN созданы (пустые или NaN), так как модель не была обучена/не предсказывала.")
+
+    # Сохранение прогноза ARIMA (если он был сделан)
+    if arima_preds is not None:
+        if len(arima_preds) != len(future_time):
+            print(f"Предупреждение: Длина прогноза ARIMA ({len(arima_preds)}) не совпадает с длиной future_time ({len(future_time)}). Используются первые {len(future_time)} значений ARIMA.")
+        df_arima = pd.DataFrame({'air_temperature': np.asarray(arima_preds)[:len(future_time)]}, index=future_time)
+        _write_csv(df_arima, os.path.join(folder, FORECAST_ARIMA_FILE))
+        print("Прогноз ARIMA сохранен в forecast_temperature_arima.csv")
+    else:
+        # Создаем пустой файл, чтобы показать отсутствие прогноза
+        df_empty_arima = pd.DataFrame(index=future_time, columns=['air_temperature'])
+        _write_csv(df_empty_arima, os.path.join(folder, FORECAST_ARIMA_FILE))
+        print("Файл прогноза ARIMA создан (пустой), так как модель не была обучена/не предсказывала.")
+
+
+def tcn_forecast(frames, stride=TRAIN_STRIDE):
+    """Обучение TCN с нуля по непрерывным кускам и прогноз; None, если данных не хватило."""
+    df_full = pd.concat(frames)
+    min_tcn_loop_len = INPUT_LEN + FORECAST_STEPS
+
+    print("Подготовка данных и обучение TCN...")
+    scaler = MinMaxScaler()
+    # Масштабируем ВЕСЬ доступный набор данных
+    scaler.fit(df_full)
+    scaled_parts = [scaler.transform(frame) for frame in frames]
+    last_part = scaled_parts[-1]
+    # Последнее окно последнего куска - вход для прогноза, в обучение не идёт.
+    # Если последний кусок короче окна с горизонтом, прогноз строится по его хвосту
+    if len(last_part) >= min_tcn_loop_len:
+        latest_input_scaled = last_part[-min_tcn_loop_len:-FORECAST_STEPS][np.newaxis]
+    elif len(last_part) >= INPUT_LEN:
+        latest_input_scaled = last_part[-INPUT_LEN:][np.newaxis]
+    else:
+        latest_input_scaled = None
+    dataset = make_dataset(scaled_parts[:-1] + [last_part[:-1]], stride)
+
+    future_pred = None # Инициализируем переменную для прогноза TCN
+    if dataset.window_count > 0 and latest_input_scaled is not None:
+        model_tcn = build_tcn(df_full.shape[1])
+        train_tcn(model_tcn, dataset)
+        print("Предсказание TCN...")
+        future_pred = predict_tcn(model_tcn, scaler, latest_input_scaled)
+        print("Предсказание TCN завершено.")
+    elif latest_input_scaled is None:
+        print(f"Предупреждение: Последний непрерывный кусок данных короче {INPUT_LEN} точек.")
+        print("Прогноз TCN будет пропущен.")
+    else:
+        print("Предупреждение: Только одна выборка данных для TCN. Обучение невозможно.")
+        print("Прогноз TCN будет пропущен.")
+
+    return future_pred
+
+
+def train_and_forecast(frames, stride=TRAIN_STRIDE, infer_frequency=True):
+    """Последовательное обучение ARIMA (только air_temperature) и TCN по готовым кускам и запись прогнозов.
+
+    Каждый кадр - отдельный непрерывный кусок: окна TCN не склеивают куски.
+    Используется только для --csv; прогноз по box_data идёт через
+    forecast_parallel.ParallelForecaster (run_range).
+    """
+    frames = [frame for frame in frames if frame is not None and len(frame)]
+    if not frames:
+        return False
+    df_full = pd.concat(frames)
+
+    # Для цикла TCN нужно хотя бы INPUT_LEN + FORECAST_STEPS точек
+    min_tcn_loop_len = INPUT_LEN + FORECAST_STEPS
+    if max(len(frame) for frame in frames) < min_tcn_loop_len:
+        print(f"Ошибка: Недостаточно данных в файле ({len(df_full)}).")
+        print(f"Требуется как минимум {min_tcn_loop_len} точек для создания обучающих выборок TCN.")
+        return False
+    if infer_frequency:
+        set_frequency(df_full)
+
+    print("Подготовка и обучение ARIMA...")
+    arima_model = fit_arima(arima_train_slice(df_full['air_temperature']))
+    arima_preds = None
+    if arima_model is not None:
+        # Прогнозируем на FORECAST_STEPS шагов вперед
+        arima_preds = arima_model.forecast(steps=FORECAST_STEPS)
+        print("ARIMA модель обучена и прогноз сделан.")
+    else:
+        print("Прогноз ARIMA будет пропущен.")
+
+    future_pred = tcn_forecast(frames, stride)
+
+    print("Сохранение результатов...")
+    save_forecasts(future_index(df_full.index[-1]), future_pred, arima_preds, list(df_full.columns))
+    return True
+
+
+def run_once(csv_filenames=(CSV_FILENAME,), stride=TRAIN_STRIDE):
+    """Прежний режим для отдельных CSV-файлов: обучение по файлам как есть, по куску на файл."""
+    return train_and_forecast([load_frame(csv_filename) for csv_filename in csv_filenames], stride)
+
+
+def run_range(start, end, device_ids=(None,), stride=TRAIN_STRIDE, data_folder='box_data'):
+    """Прогноз по диапазону дней box_data: ARIMA по всем полям и устройствам в пуле процессов, TCN параллельно."""
+    # forecast_parallel сам импортирует этот модуль
+    from forecast_parallel import ParallelForecaster
+
+    return bool(ParallelForecaster(data_folder, stride=stride).run(start, end, list(device_ids)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Обучение ARIMA и TCN и запись прогнозов")
+    parser.add_argument("--csv", nargs="+",
+                        help="прежний последовательный режим по отдельным CSV (ARIMA только для air_temperature)")
+    parser.add_argument("--start", help="первый день диапазона box_data, YYYY-MM-DD; по умолчанию сегодня")
+    parser.add_argument("--end", help="последний день диапазона, по умолчанию равен --start")
+    parser.add_argument("--device", action="append", help="можно несколько; по умолчанию все вместе")
+    parser.add_argument("--data", default="box_data")
+    parser.add_argument("--stride", type=int, default=TRAIN_STRIDE, help="шаг между обучающими окнами")
+    args = parser.parse_args()
 
-    print(f"Обучение TCN на {len(X_train_tcn)} выборках...")
-    # Увеличьте epochs, если нужно лучшее обучение; verbose=1 для вывода прогресса
-    model_tcn.fit(X_train_tcn, y_train_tcn, epochs=10, batch_size=min(32, len(X_train_tcn)), verbose=1)
-
-    # Предсказание на последних данных
-    print("Предсказание TCN...")
-    future_pred_scaled = model_tcn.predict(latest_input_scaled).reshape(FORECAST_STEPS, n_features)
-    future_pred = scaler.inverse_transform(future_pred_scaled)
-    print("Предсказание TCN завершено.")
-
-elif X_tcn.shape[0] == 1:
-     print("Предупреждение: Только одна выборка данных для TCN. Обучение невозможно.")
-     # Можно либо загрузить предобученную модель, либо пропустить TCN
-     print("Прогноз TCN будет пропущен.")
-     # latest_input_scaled = X_tcn[0:1] # Можно взять эту выборку, если есть модель
-else:
-     print("Ошибка: Недостаточно данных для обучения TCN. Прогноз TCN будет пропущен.")
-
-# --- 4. Формирование временного индекса и сохранение результатов ---
-print("Сохранение результатов...")
-# Время для прогноза начинается после последней точки в ИСХОДНЫХ данных
-last_time = df_full.index[-1]
-future_time = pd.date_range(start=last_time + pd.Timedelta(seconds=6), periods=FORECAST_STEPS, freq='6S') # Используем '6S' если уверены
-
-# Сохранение прогноза TCN (если он был сделан)
-if future_pred is not None:
-    df_forecast = pd.DataFrame(future_pred, columns=df_full.columns, index=future_time)
-    df_forecast.index.name = 'timestamp'
-    df_forecast[['air_temperature']].to_csv("forecast_temperature.csv")
-    df_forecast[['air_humidity']].to_csv("forecast_humidity.csv")
-    print("Прогнозы TCN сохранены в forecast_temperature.csv и forecast_humidity.csv")
-else:
-    # Создаем пустые файлы или файлы с NaN, чтобы показать отсутствие прогноза
-    df_empty = pd.DataFrame(index=future_time, columns=['air_temperature'])
-    df_empty.to_csv("forecast_temperature.csv")
-    df_empty['air_humidity'] = np.nan # Добавляем колонку влажности
-    df_empty[['air_humidity']].to_csv("forecast_humidity.csv")
-    print("Файлы прогнозов TCN созданы (пустые или NaN), так как модель не была обучена/не предсказывала.")
-
-
-# Сохранение прогноза ARIMA (если он был сделан)
-if arima_preds is not None:
-    # Убедимся, что индекс совпадает с future_time
-    if len(arima_preds) == len(future_time):
-         df_arima = pd.DataFrame({'air_temperature': arima_preds.values}, index=future_time)
+    if args.csv:
+        run_once(args.csv, args.stride)
     else:
-         print(f"Предупреждение: Длина прогноза ARIMA ({len(arima_preds)}) не совпадает с длиной future_time ({len(future_time)}). Используются первые {len(future_time)} значений ARIMA.")
-         # Обрезаем или дополняем NaN, здесь обрезаем
-         df_arima = pd.DataFrame({'air_temperature': arima_preds.values[:len(future_time)]}, index=future_time)
-
-    df_arima.to_csv("forecast_temperature_arima.csv")
-    print("Прогноз ARIMA сохранен в forecast_temperature_arima.csv")
-else:
-    # Создаем пустой файл, чтобы показать отсутствие прогноза
-    df_empty_arima = pd.DataFrame(index=future_time, columns=['air_temperature'])
-    df_empty_arima.to_csv("forecast_temperature_arima.csv")
-    print("Файл прогноза ARIMA создан (пустой), так как модель не была обучена/не предсказывала.")
-
-print("Скрипт завершен.")
\ No newline at end of file
+        start = args.start or datetime.date.today().isoformat()
+        run_range(start, args.end or start, args.device or [None], args.stride, args.data)
+    print("Скрипт завершен.")
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import os
+import pickle
+import signal
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+from forecast_script import (
+    INPUT_LEN, FORECAST_STEPS, ARIMA_TRAIN_LEN, FIELDS,
+    fit_arima, make_dataset, build_tcn, train_tcn, predict_tcn, future_index, save_forecasts,
+)
+from forecast_export import export_tflite
+from training_data import TrainingDataLoader, segments, day_csv_paths
+
+MODEL_DIR = 'forecast_models'
+HISTORY_DAYS = 2
+UPDATE_INTERVAL_SECONDS = 60
+POLL_SECONDS = 5
+FINETUNE_EPOCHS = 1
+MAX_FINETUNE_WINDOWS = 2000
+# Раз в столько обновлений параметры ARIMA оцениваются заново, между ними - только новые наблюдения
+ARIMA_REFIT_EVERY = 60
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ForecastService:
+    """Долгоживущий прогнозист: модели загружаются один раз и дообучаются на новых данных.
+
+    При старте веса TCN, скейлер и ARIMA берутся из model_dir (тёплый старт),
+    а без них модели обучаются с нуля на истории. Каждое обновление дообучает
+    TCN только на окнах, в которые попали пришедшие с прошлого раза точки,
+    добавляет эти точки в ARIMA без переоценки параметров и пишет свежий прогноз.
+    """
+
+    def __init__(self, data_folder='box_data', model_dir=MODEL_DIR, interval=UPDATE_INTERVAL_SECONDS,
+                 history_days=HISTORY_DAYS, finetune_epochs=FINETUNE_EPOCHS,
+                 arima_refit_every=ARIMA_REFIT_EVERY, output_folder='.', device_id=None, export_dir=None):
+        self.data_folder = data_folder
+        # Куда после каждого обновления выгружать TFLite-модель для forecast_predict.py
+        self.export_dir = export_dir
+        self.device_id = device_id
+        # Без дискового кэша: сегодняшний файл меняется к каждому обновлению
+        self.loader = TrainingDataLoader(data_folder, FIELDS, cache_dir=None)
+        self.model_dir = model_dir
+        self.interval = interval
+        self.history_days = history_days
+        self.finetune_epochs = finetune_epochs
+        self.arima_refit_every = arima_refit_every
+        self.output_folder = output_folder
+        self.model = None
+        self.scaler = None
+        self.arima = None
+        self.arima_updates = 0
+        self.last_trained = None
+        self._wake = threading.Event()
+        os.makedirs(model_dir, exist_ok=True)
+
+    @property
+    def _weights_path(self):
+        return os.path.join(self.model_dir, 'tcn.weights.h5')
+
+    @property
+    def _models_path(self):
+        return os.path.join(self.model_dir, 'models.pkl')
+
+    @property
+    def _state_path(self):
+        return os.path.join(self.model_dir, 'state.json')
+
+    def today_paths(self):
+        return day_csv_paths(self.data_folder, datetime.date.today().strftime("%Y-%m-%d"), self.device_id)
+
+    def load_history(self):
+        """Последний непрерывный кусок истории на регулярной сетке."""
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=self.history_days - 1)
+        parts = segments(self.loader.load(start, today, self.device_id))
+        return parts[-1] if parts else None
+
+    def load(self):
+        """Тёплый старт из model_dir; False, если сохранённых моделей нет."""
+        if not (os.path.isfile(self._state_path) and os.path.isfile(self._models_path)):
+            return False
+        with open(self._state_path, 'r') as f:
+            state = json.load(f)
+        with open(self._models_path, 'rb') as f:
+            models = pickle.load(f)
+        self.scaler = models["scaler"]
+        self.arima = models["arima"]
+        self.arima_updates = state.get("arima_updates", 0)
+        self.last_trained = pd.Timestamp(state["last_trained"])
+        if os.path.isfile(self._weights_path):
+            self.model = build_tcn(len(FIELDS))
+            self.model.load_weights(self._weights_path)
+        print(f"Модели загружены из {self.model_dir}, последнее обучение на данных до {self.last_trained}")
+        return True
+
+    def save(self):
+        if self.model is not None:
+            self.model.save_weights(self._weights_path)
+        tmp_path = self._models_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({"scaler": self.scaler, "arima": self.arima}, f)
+        os.replace(tmp_path, self._models_path)
+        with open(self._state_path, 'w') as f:
+            json.dump({"last_trained": self.last_trained.isoformat(), "arima_updates": self.arima_updates}, f)
+
+    def _refit_arima(self, series):
+        self.arima = fit_arima(series.values[-ARIMA_TRAIN_LEN:])
+        self.arima_updates = 0
+
+    def train_full(self, df):
+        print(f"Обучение моделей с нуля на {len(df)} точках...")
+        self.scaler = MinMaxScaler().fit(df[FIELDS])
+        dataset = make_dataset([self.scaler.transform(df[FIELDS])])
+        if dataset.window_count:
+            self.model = build_tcn(len(FIELDS))
+            train_tcn(self.model, dataset)
+        self._refit_arima(df['air_temperature'])
+
+    def finetune(self, df, new_count):
+        scaled = self.scaler.transform(df[FIELDS])
+        # Новые окна - те, чей хвост y захватывает хотя бы одну новую точку
+        first = len(scaled) - min(new_count, MAX_FINETUNE_WINDOWS) - INPUT_LEN - FORECAST_STEPS + 1
+        dataset = make_dataset([scaled[max(first, 0):]])
+        if dataset.window_count:
+            if self.model is None:
+                self.model = build_tcn(len(FIELDS))
+            train_tcn(self.model, dataset, epochs=self.finetune_epochs)
+
+        new_values = df['air_temperature'].values[-new_count:]
+        if self.arima is None or self.arima_updates >= self.arima_refit_every:
+            self._refit_arima(df['air_temperature'])
+        else:
+            try:
+                self.arima = self.arima.append(new_values, refit=False)
+                self.arima_updates += 1
+            except (np.linalg.LinAlgError, ValueError) as e:
+                print(f"Ошибка при обновлении ARIMA, переобучаем: {e}")
+                self._refit_arima(df['air_temperature'])
+
+    def forecast(self, df):
+        future_pred = None
+        if self.model is not None and len(df) >= INPUT_LEN:
+            latest = self.scaler.transform(df[FIELDS].iloc[-INPUT_LEN:])[np.newaxis]
+            future_pred = predict_tcn(self.model, self.scaler, latest)
+        arima_preds = self.arima.forecast(steps=FORECAST_STEPS) if self.arima is not None else None
+        save_forecasts(future_index(df.index[-1]), future_pred, arima_preds, FIELDS, self.output_folder)
+
+    def update(self):
+        """Одно обновление: дообучение на новых точках и запись прогноза. False, если новых данных нет."""
+        df = self.load_history()
+        if df is None or len(df) < INPUT_LEN:
+            print("Недостаточно данных для прогноза")
+            return False
+
+        started = time.monotonic()
+        if self.scaler is None:
+            if len(df) < INPUT_LEN + FORECAST_STEPS:
+                print(f"Недостаточно данных для обучения TCN ({len(df)} точек)")
+                return False
+            self.train_full(df)
+        else:
+            new_count = int((df.index > self.last_trained).sum())
+            if not new_count:
+                return False
+            self.finetune(df, new_count)
+
+        self.forecast(df)
+        self.last_trained = df.index[-1]
+        self.save()
+        if self.export_dir and self.model is not None:
+            export_tflite(self.model, self.scaler, self.export_dir)
+        print(f"Прогноз обновлён за {time.monotonic() - started:.1f} с")
+        return True
+
+    def notify(self):
+        """Внеочередное обновление (например, по SIGUSR1 после прихода данных)."""
+        self._wake.set()
+
+    def run(self):
+        self.load()
+        last_key = None
+        last_run = None
+        while True:
+            woken = self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+            key = tuple(_stat_key(path) for path in self.today_paths())
+            due = last_run is None or time.monotonic() - last_run >= self.interval
+            if woken or (key != last_key and due):
+                last_key = key
+                last_run = time.monotonic()
+                try:
+                    self.update()
+                except Exception as e:
+                    print(f"Ошибка при обновлении прогноза: {e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сервис прогнозов с дообучением моделей")
+    parser.add_argument("--data", default="box_data")
+    parser.add_argument("--models", default=MODEL_DIR)
+    parser.add_argument("--interval", type=int, default=UPDATE_INTERVAL_SECONDS,
+                        help="не чаще одного обновления за столько секунд")
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS)
+    parser.add_argument("--device", help="устройство; по умолчанию все вместе")
+    parser.add_argument("--export", help="каталог для TFLite-модели после каждого обновления")
+    parser.add_argument("--once", action="store_true", help="одно обновление и выход")
+    args = parser.parse_args()
+
+    service = ForecastService(args.data, args.models, args.interval, args.history_days, device_id=args.device,
+                              export_dir=args.export)
+    if args.once:
+        service.load()
+        service.update()
+    else:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: service.notify())
+        print(f"Сервис прогнозов запущен (PID {os.getpid()}), обновление по SIGUSR1 или изменению данных")
+        service.run()
@@ -0,0 +1,98 @@
+import bisect
+import csv
+import datetime
+import os
+import threading
+
+# Имя ряда -> (файл forecast_script.py, колонки значения по порядку приоритета)
+FORECAST_FILES = {
+    "temperature": ("forecast_temperature.csv", ("forecast_temperature", "air_temperature")),
+    "humidity": ("forecast_humidity.csv", ("forecast_humidity", "air_humidity")),
+    "arima": ("forecast_temperature_arima.csv", ("forecast_temperature", "air_temperature")),
+}
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ForecastSeries:
+    """Один файл прогноза в памяти: отсортированные метки времени и значения.
+
+    Файл перечитывается, только когда меняются его размер или mtime,
+    поиск по времени - бинарный.
+    """
+
+    def __init__(self, path, value_columns):
+        self.path = path
+        self.value_columns = value_columns
+        self._lock = threading.Lock()
+        self._key = None
+        self._times = []
+        self._timestamps = []
+        self._values = []
+
+    def _load(self):
+        points = []
+        with open(self.path, 'r', newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                ts_str = (row.get("timestamp") or "").strip()
+                if not ts_str:
+                    continue
+                try:
+                    ts = datetime.datetime.fromisoformat(ts_str)
+                except ValueError:
+                    continue
+                value = next((row[column] for column in self.value_columns if column in row), "0")
+                points.append((ts, ts_str, float(value) if value else 0))
+        points.sort(key=lambda point: point[0])
+        self._times = [point[0] for point in points]
+        self._timestamps = [point[1] for point in points]
+        self._values = [point[2] for point in points]
+
+    def refresh(self):
+        """Возвращает False, если файла прогноза нет."""
+        key = _stat_key(self.path)
+        with self._lock:
+            if key is None:
+                self._key = None
+                self._times, self._timestamps, self._values = [], [], []
+                return False
+            if key != self._key:
+                self._load()
+                self._key = key
+            return True
+
+    def next_points(self, t, k=10, tolerance=None):
+        """До k точек начиная с первой не раньше t.
+
+        С tolerance (в секундах) - как раньше в /data: первая точка должна
+        отстоять от t не больше чем на tolerance, иначе прогноз не подходит.
+        """
+        self.refresh()
+        with self._lock:
+            start = t if tolerance is None else t - datetime.timedelta(seconds=tolerance)
+            i = bisect.bisect_left(self._times, start)
+            if i == len(self._times):
+                return []
+            if tolerance is not None and self._times[i] > t + datetime.timedelta(seconds=tolerance):
+                return []
+            return list(zip(self._timestamps[i:i + k], self._values[i:i + k]))
+
+
+class ForecastStore:
+    def __init__(self, folder='.', files=FORECAST_FILES):
+        self.series = {
+            name: ForecastSeries(os.path.join(folder, filename), columns)
+            for name, (filename, columns) in files.items()
+        }
+
+    def available(self, name):
+        return self.series[name].refresh()
+
+    def next_points(self, name, t, k=10, tolerance=None):
+        return self.series[name].next_points(t, k, tolerance)
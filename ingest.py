@@ -0,0 +1,123 @@
+import os
+
+from ingest_writer import IngestWriter, IngestQueueFull, DURABILITY_NONE
+from sensor_schema import CSV_HEADERS
+
+# Колонка CSV -> ключи в JSON от устройства, по порядку приоритета.
+# Прошивка шлёт temperature/humidity, новые устройства могут слать имена колонок.
+FIELD_ALIASES = {
+    "air_temperature": ("air_temperature", "temperature"),
+    "air_humidity": ("air_humidity", "humidity"),
+}
+
+STATUS_STORED = "stored"
+STATUS_ACCEPTED = "accepted"
+
+
+def compile_field_mapping(headers=CSV_HEADERS, aliases=FIELD_ALIASES):
+    """Таблица (колонка, ключи) для всех колонок, кроме timestamp."""
+    return tuple((column, aliases.get(column, (column,))) for column in headers if column != "timestamp")
+
+
+FIELD_MAPPING = compile_field_mapping()
+
+
+def build_record(data, timestamp, mapping=FIELD_MAPPING):
+    record = {"timestamp": timestamp.isoformat()}
+    for column, keys in mapping:
+        value = ""
+        for key in keys:
+            if data.get(key) not in (None, ""):
+                value = data[key]
+                break
+        record[column] = value
+    return record
+
+
+class Sink:
+    """Именованный приёмник показаний: каталог с дневными файлами и набор бэкендов хранения.
+
+    before_write(day, device_id) и after_write(day, rows, created, device_id) -
+    необязательные хуки, created=True, если дневной CSV-файл был создан этой
+    записью. С shard_by_device=True строки каждого устройства пишутся в свой
+    каталог <folder>/<device_id>/, и хуки вызываются по разу на устройство;
+    иначе device_id=None.
+    """
+
+    def __init__(self, name, folder, storages, before_write=None, after_write=None, shard_by_device=False):
+        self.name = name
+        self.folder = folder
+        self.storages = storages
+        self.before_write = before_write
+        self.after_write = after_write
+        self.shard_by_device = shard_by_device
+        os.makedirs(folder, exist_ok=True)
+
+    def csv_path(self, day, device_id=None):
+        if device_id:
+            return os.path.join(self.folder, device_id, f'{day}.csv')
+        return os.path.join(self.folder, f'{day}.csv')
+
+    def write(self, day, rows, fsync=False):
+        if not self.shard_by_device:
+            self._write(day, rows, fsync, None)
+            return
+        by_device = {}
+        for row in rows:
+            by_device.setdefault(row.get("device_id") or None, []).append(row)
+        for device_id, device_rows in by_device.items():
+            self._write(day, device_rows, fsync, device_id)
+
+    def _write(self, day, rows, fsync, device_id):
+        if self.before_write:
+            self.before_write(day, device_id)
+        created = not os.path.isfile(self.csv_path(day, device_id))
+        for storage in self.storages:
+            storage.append(day, rows, fsync, device_id=device_id)
+        if self.after_write:
+            self.after_write(day, rows, created, device_id)
+        print(f"Записано {len(rows)} строк в {self.csv_path(day, device_id)}")
+
+
+class IngestPipeline:
+    """Разводит уже разобранные записи по приёмникам за один проход.
+
+    С фоновым писателем строки ставятся в общую очередь с ключом
+    (приёмники, день), без него - пишутся сразу в потоке запроса.
+    """
+
+    def __init__(self, sinks, async_writes=True, flush_ms=200, flush_rows=500, max_queue=10000,
+                 durability=DURABILITY_NONE):
+        self.sinks = {sink.name: sink for sink in sinks}
+        self.writer = None
+        if async_writes:
+            self.writer = IngestWriter(self._write_batch, flush_ms, flush_rows, max_queue, durability)
+
+    def _write_batch(self, key, rows, fsync=False):
+        sink_names, day = key
+        for sink_name in sink_names:
+            self.sinks[sink_name].write(day, rows, fsync)
+
+    def submit(self, sink_names, day, rows):
+        """Возвращает STATUS_ACCEPTED/STATUS_STORED; IngestQueueFull при переполнении очереди."""
+        sink_names = tuple(sink_names)
+        for sink_name in sink_names:
+            if sink_name not in self.sinks:
+                raise KeyError(f"Неизвестный приёмник: {sink_name}")
+
+        if not self.writer:
+            self._write_batch((sink_names, day), rows)
+            return STATUS_STORED
+
+        self.writer.submit((sink_names, day), rows)
+        return STATUS_ACCEPTED
+
+    def flush(self, timeout=None):
+        if self.writer:
+            return self.writer.flush(timeout)
+        return True
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
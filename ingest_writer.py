@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+DURABILITY_NONE = "none"
+DURABILITY_FSYNC = "fsync"
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+class IngestWriter:
+    """Фоновая запись показаний пачками (group commit).
+
+    Запросы кладут строки в ограниченную очередь и сразу отвечают. Поток-писатель
+    собирает пачку и вызывает write_batch(key, rows, fsync) по одному разу на
+    каждый ключ (например, день), когда прошло flush_ms с первой строки пачки
+    или набралось flush_rows строк.
+    """
+
+    def __init__(self, write_batch, flush_ms=200, flush_rows=500, max_queue=10000,
+                 durability=DURABILITY_NONE):
+        if durability not in (DURABILITY_NONE, DURABILITY_FSYNC):
+            raise ValueError(f"Неизвестный режим надёжности: {durability}")
+        self.write_batch = write_batch
+        self.flush_interval = flush_ms / 1000.0
+        self.flush_rows = flush_rows
+        self.durability = durability
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._idle = threading.Condition()
+        self._pending = 0
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, rows):
+        """Ставит строки в очередь; IngestQueueFull, если писатель не успевает."""
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((key, rows))
+        except queue.Full:
+            with self._idle:
+                self._pending -= 1
+            raise IngestQueueFull()
+
+    @property
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batches = OrderedDict()
+        count = 0
+        taken = 0
+        try:
+            key, rows = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return batches, 0
+        batches.setdefault(key, []).extend(rows)
+        count += len(rows)
+        taken += 1
+
+        deadline = time.monotonic() + self.flush_interval
+        while count < self.flush_rows and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                key, rows = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batches.setdefault(key, []).extend(rows)
+            count += len(rows)
+            taken += 1
+        return batches, taken
+
+    def _write(self, batches):
+        fsync = self.durability == DURABILITY_FSYNC
+        for key, rows in batches.items():
+            try:
+                self.write_batch(key, rows, fsync)
+            except Exception as e:
+                print(f"Ошибка при записи пачки {key} ({len(rows)} строк): {e}")
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batches, taken = self._collect()
+            if batches:
+                self._write(batches)
+            if taken:
+                with self._idle:
+                    self._pending -= taken
+                    self._idle.notify_all()
+
+    def flush(self, timeout=None):
+        """Ждёт, пока все поставленные в очередь строки будут записаны."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending <= 0, timeout)
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
@@ -0,0 +1,144 @@
+import json
+import queue
+import threading
+import time
+
+SUBSCRIBER_QUEUE_SIZE = 100
+KEEPALIVE_SECONDS = 5
+
+
+def format_sse(event, data, event_id=None):
+    message = ""
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"event: {event}\n"
+    for line in data.splitlines() or [""]:
+        message += f"data: {line}\n"
+    return message + "\n"
+
+
+class LiveBroadcaster:
+    """Рассылка событий Server-Sent Events всем подписанным дашбордам.
+
+    Каждое событие сериализуется один раз; у подписчика своя ограниченная
+    очередь, и медленный клиент теряет старые события, а не тормозит остальных.
+    Событие с topic (device_id) получают только подписчики на этот topic
+    и подписчики без topic; событие без topic - все.
+    """
+
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # очередь подписчика -> его topic
+        self._subscribers = {}
+        self._next_id = 0
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self, topic=None):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[subscriber] = topic
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+    def publish(self, event, data, topic=None):
+        with self._lock:
+            subscribers = [
+                subscriber for subscriber, subscriber_topic in self._subscribers.items()
+                if topic is None or subscriber_topic is None or subscriber_topic == topic
+            ]
+            if not subscribers:
+                return
+            self._next_id += 1
+            message = format_sse(event, json.dumps(data, ensure_ascii=False), self._next_id)
+
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def stream(self, on_idle=None, keepalive=KEEPALIVE_SECONDS, topic=None):
+        """Генератор для Flask Response(mimetype='text/event-stream')."""
+        subscriber = self.subscribe(topic)
+        try:
+            yield f"retry: {keepalive * 1000}\n\n"
+            while True:
+                try:
+                    yield subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    if on_idle:
+                        on_idle()
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class SubscriberPoller:
+    """Один фоновый поток на процесс: poll() раз в interval секунд, пока есть подписчики.
+
+    Нагрузка от проверки не растёт с числом открытых дашбордов, как при
+    вызове из цикла каждого потока SSE.
+    """
+
+    def __init__(self, broadcaster, poll, interval=KEEPALIVE_SECONDS):
+        self.broadcaster = broadcaster
+        self.poll = poll
+        self.interval = interval
+        self._thread = threading.Thread(target=self._run, name="live-poller", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if self.broadcaster.subscriber_count:
+                try:
+                    self.poll()
+                except Exception as e:
+                    print(f"Ошибка при проверке новых показаний: {e}")
+
+
+class CoalescingPublisher:
+    """Строит снимок (например, ответ /data) один раз на серию изменений и рассылает его.
+
+    notify() только ставит флаг, сама сборка идёт в отдельном потоке и не чаще
+    раза в min_interval секунд, сколько бы показаний ни пришло за это время.
+    """
+
+    def __init__(self, broadcaster, event, build, min_interval=1.0, topic=None):
+        self.broadcaster = broadcaster
+        self.event = event
+        self.build = build
+        self.min_interval = min_interval
+        self.topic = topic
+        self._changed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"live-{event}", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._changed.set()
+
+    def _run(self):
+        while True:
+            self._changed.wait()
+            self._changed.clear()
+            if self.broadcaster.subscriber_count:
+                try:
+                    data = self.build()
+                    if data is not None:
+                        self.broadcaster.publish(self.event, data, self.topic)
+                except Exception as e:
+                    print(f"Ошибка при сборке события {self.event}: {e}")
+            time.sleep(self.min_interval)
@@ -0,0 +1,271 @@
+import asyncio
+import atexit
+import os
+import random
+import smtplib
+import threading
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import aiohttp
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+SMTP_HOST = "smtp.mail.ru"
+SMTP_PORT = 465
+# Одновременных запросов к Telegram (лимит бота - около 30 сообщений в секунду)
+NOTIFY_CONCURRENCY = 20
+NOTIFY_MAX_ATTEMPTS = 4
+NOTIFY_BACKOFF_SECONDS = 0.5
+NOTIFY_MAX_BACKOFF_SECONDS = 30
+NOTIFY_TIMEOUT_SECONDS = 10
+
+
+class DeliveryResult:
+    """Итог доставки одному получателю."""
+
+    def __init__(self, channel, recipient, ok, attempts, error=None):
+        self.channel = channel
+        self.recipient = recipient
+        self.ok = ok
+        self.attempts = attempts
+        self.error = error
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"ошибка: {self.error}"
+        return f"<{self.channel} {self.recipient}: {status}, попыток {self.attempts}>"
+
+
+def summarize(results):
+    """{канал: (доставлено, всего)}"""
+    summary = {}
+    for result in results:
+        delivered, total = summary.get(result.channel, (0, 0))
+        summary[result.channel] = (delivered + result.ok, total + 1)
+    return summary
+
+
+class EmailSender:
+    """Отправка писем через одно SMTP-соединение, которое переживает рассылки.
+
+    Перед отправкой соединение проверяется NOOP; если сервер его закрыл -
+    открывается заново. Письмо уходит одной транзакцией на всех получателей,
+    отказы сервера по отдельным адресам попадают в результаты.
+    """
+
+    def __init__(self, sender, password, host=SMTP_HOST, port=SMTP_PORT, use_ssl=True,
+                 timeout=NOTIFY_TIMEOUT_SECONDS):
+        self.sender = sender
+        self.password = password
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._smtp = None
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.host, self.port, timeout=self.timeout)
+        if self.password:
+            smtp.login(self.sender, self.password)
+        return smtp
+
+    def _connection(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        self._smtp = self._connect()
+        return self._smtp
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def send(self, subject, body, recipients):
+        if not recipients:
+            return []
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+
+        with self._lock:
+            last_error = None
+            for attempt in range(1, 3):
+                try:
+                    refused = self._connection().sendmail(self.sender, recipients, msg.as_string())
+                    break
+                except smtplib.SMTPRecipientsRefused as e:
+                    refused = e.recipients
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    # Соединение оборвалось между NOOP и отправкой - одна повторная попытка
+                    self.close()
+                    last_error = e
+                except smtplib.SMTPException as e:
+                    self.close()
+                    return [DeliveryResult("email", address, False, attempt, str(e)) for address in recipients]
+                except OSError as e:
+                    self.close()
+                    last_error = e
+            else:
+                return [DeliveryResult("email", address, False, 2, str(last_error)) for address in recipients]
+
+        return [
+            DeliveryResult("email", address, address not in refused, attempt,
+                           str(refused[address]) if address in refused else None)
+            for address in recipients
+        ]
+
+
+class Notifier:
+    """Параллельная рассылка оповещений в Telegram и на почту.
+
+    Рассылки идут в собственном цикле событий в отдельном потоке, сообщения
+    в Telegram - через одну aiohttp-сессию на всё время работы (keep-alive к
+    API между рассылками), одновременно не больше concurrency запросов. Ответ 429 повторяется через
+    retry_after из ответа API, сетевые ошибки и 5xx - с экспоненциальной
+    задержкой; прочие 4xx (бот заблокирован, неверный chat_id) не повторяются.
+    Почта отправляется параллельно в отдельном потоке. dispatch() возвращает
+    DeliveryResult по каждому получателю.
+    """
+
+    def __init__(self, bot_token, email_sender=None, api_url=TELEGRAM_API_URL, concurrency=NOTIFY_CONCURRENCY,
+                 max_attempts=NOTIFY_MAX_ATTEMPTS, backoff=NOTIFY_BACKOFF_SECONDS,
+                 max_backoff=NOTIFY_MAX_BACKOFF_SECONDS, timeout=NOTIFY_TIMEOUT_SECONDS):
+        self.bot_token = bot_token
+        self.email_sender = email_sender
+        self.api_url = api_url.rstrip('/')
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._loop_lock = threading.Lock()
+        self._loop = None
+        self._session = None
+        self._semaphore = None
+
+    def _delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _send_telegram(self, session, semaphore, url, chat_id, text):
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            async with semaphore:
+                try:
+                    async with session.post(url, json={'chat_id': chat_id, 'text': text}) as response:
+                        if response.status == 200:
+                            return DeliveryResult("telegram", chat_id, True, attempt)
+                        try:
+                            payload = await response.json(content_type=None)
+                        except ValueError:
+                            payload = None
+                        # Прокси или балансировщик может ответить не объектом Bot API
+                        if not isinstance(payload, dict):
+                            payload = {}
+                        parameters = payload.get('parameters')
+                        error = f"HTTP {response.status}: {payload.get('description', '')}".strip()
+                        if response.status == 429:
+                            retry_after = parameters.get('retry_after') if isinstance(parameters, dict) else None
+                            delay = min(self.max_backoff, float(retry_after)) if retry_after else self._delay(attempt)
+                        elif response.status >= 500:
+                            delay = self._delay(attempt)
+                        else:
+                            return DeliveryResult("telegram", chat_id, False, attempt, error)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = f"{type(e).__name__}: {e}"
+                    delay = self._delay(attempt)
+            # Пауза вне семафора, чтобы не занимать слот
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay)
+        return DeliveryResult("telegram", chat_id, False, self.max_attempts, error)
+
+    async def _telegram(self, chat_ids, text):
+        if not chat_ids:
+            return []
+        if not self.bot_token:
+            return [DeliveryResult("telegram", chat_id, False, 0, "BOT_TOKEN не задан") for chat_id in chat_ids]
+        url = f"{self.api_url}/bot{self.bot_token}/sendMessage"
+        session = self._telegram_session()
+        return await asyncio.gather(*(
+            self._send_telegram(session, self._semaphore, url, chat_id, text) for chat_id in chat_ids
+        ))
+
+    def _telegram_session(self):
+        # Создаётся в цикле событий уведомителя и живёт, пока жив процесс
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def _email(self, subject, body, emails):
+        if not emails:
+            return []
+        if self.email_sender is None:
+            return [DeliveryResult("email", address, False, 0, "почта не настроена") for address in emails]
+        try:
+            return await asyncio.to_thread(self.email_sender.send, subject, body, emails)
+        except (smtplib.SMTPException, OSError) as e:
+            return [DeliveryResult("email", address, False, 1, str(e)) for address in emails]
+
+    async def dispatch_async(self, subject, body, chat_ids=(), emails=()):
+        telegram, email = await asyncio.gather(
+            self._telegram(list(chat_ids), body),
+            self._email(subject, body, list(emails)),
+        )
+        return list(telegram) + list(email)
+
+    def _event_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="notifier", daemon=True).start()
+                atexit.register(self.close)
+            return self._loop
+
+    def dispatch(self, subject, body, chat_ids=(), emails=()):
+        """Синхронная обёртка для потока AlertWorker: рассылка идёт в цикле событий уведомителя."""
+        future = asyncio.run_coroutine_threadsafe(
+            self.dispatch_async(subject, body, chat_ids, emails), self._event_loop())
+        return future.result()
+
+    def close(self):
+        """Закрыть сессию и остановить цикл событий (вызывается и при выходе)."""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result(self.timeout)
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def notifier_from_env(bot_token, sender_email, sender_password):
+    """Notifier по переменным окружения; TELEGRAM_API_URL и SMTP_* позволяют подставить локальный сервер."""
+    email_sender = None
+    # Без пароля почта только через явно заданный (локальный) SMTP_HOST
+    if sender_email and (sender_password or os.getenv("SMTP_HOST")):
+        email_sender = EmailSender(
+            sender_email, sender_password,
+            host=os.getenv("SMTP_HOST", SMTP_HOST),
+            port=int(os.getenv("SMTP_PORT", SMTP_PORT)),
+            use_ssl=os.getenv("SMTP_SSL", "1") == "1",
+        )
+    return Notifier(
+        bot_token, email_sender,
+        api_url=os.getenv("TELEGRAM_API_URL", TELEGRAM_API_URL),
+        concurrency=int(os.getenv("NOTIFY_CONCURRENCY", NOTIFY_CONCURRENCY)),
+    )
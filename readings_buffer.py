@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import deque
+
+from columnar_store import row_micros, sort_rows
+from csv_tail import read_last_rows
+
+# Сколько последних показаний держим в памяти
+BUFFER_MAXLEN = 200
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _normalize_row(row):
+    return {key: "" if value is None else str(value) for key, value in row.items()}
+
+
+class ReadingsBuffer:
+    """Кольцевой буфер последних показаний за текущий день.
+
+    Хранит строки в том же виде, что и csv.DictReader (значения - строки).
+    Буфер привязан к одному CSV-файлу (у каждого устройства свой): смена
+    файла (новый день) или его
+    изменение другим процессом (несколько воркеров Gunicorn) приводит
+    к перечитыванию хвоста файла.
+    """
+
+    def __init__(self, maxlen=BUFFER_MAXLEN):
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        self._file_path = None
+        self._file_stat = None
+        self._rows = deque(maxlen=maxlen)
+
+    def _reset(self, file_path):
+        self._file_path = file_path
+        self._file_stat = None
+        self._rows.clear()
+
+    def reload(self, file_path):
+        stat_key = _stat_key(file_path)
+        rows = read_last_rows(file_path, self.maxlen) if stat_key else []
+        with self._lock:
+            self._reset(file_path)
+            self._rows.extend(rows)
+            self._file_stat = stat_key
+
+    def sync(self, file_path):
+        with self._lock:
+            up_to_date = self._file_path == file_path and self._file_stat == _stat_key(file_path)
+        if not up_to_date:
+            self.reload(file_path)
+
+    def extend(self, rows, file_path):
+        """Учесть строки, только что записанные в file_path; вернуть те, что новее уже известных.
+
+        Перед записью вызывающий код делает sync(), чтобы не потерять чужие
+        строки. Догруженные старые показания легли в середину файла - тогда
+        хвост перечитывается, а последним показанием остаётся прежнее.
+        """
+        rows = sort_rows(_normalize_row(row) for row in rows)
+        with self._lock:
+            latest = row_micros(self._rows[-1]) if self._file_path == file_path and self._rows else None
+            newer = [row for row in rows if latest is None or row_micros(row) > latest]
+            if self._file_path == file_path and len(newer) == len(rows):
+                self._rows.extend(rows)
+                self._file_stat = _stat_key(file_path)
+                return newer
+        self.reload(file_path)
+        return newer
+
+    def last(self, n=1):
+        with self._lock:
+            if n >= len(self._rows):
+                return list(self._rows)
+            return list(self._rows)[-n:]
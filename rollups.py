@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import to_micros, from_micros, DEVICE_COLUMN
+from day_summary import SUMMARY_VERSION, read_samples
+from sensor_schema import NUMERIC_FIELDS
+
+ROLLUPS_DB_NAME = "rollups.db"
+# Уровень: (имя, длина интервала в секундах); интервалы - по локальному "настенному" времени, как в CSV
+TIERS = (("1m", 60), ("1h", 3600), ("1d", 86400))
+TIER_SECONDS = dict(TIERS)
+# Число строк в интервале (для field_average: пустые значения считаются нулём)
+ROWS_FIELD = "_rows"
+# /series берёт самый мелкий уровень, у которого интервалов не больше points * TIER_FACTOR
+TIER_FACTOR = 20
+
+UPSERT_SQL = (
+    "INSERT INTO rollup_{tier} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (device_id, field, bucket) DO UPDATE SET "
+    "n = n + excluded.n, total = total + excluded.total, "
+    "low = min(low, excluded.low), high = max(high, excluded.high), "
+    "last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END, "
+    "last_ts = max(last_ts, excluded.last_ts)"
+)
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else np.nan
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def aggregate(device_ids, timestamps, values, fields, tier_seconds):
+    """Агрегаты пачки по (устройство, поле, интервал) для одного уровня, numpy за один проход.
+
+    device_ids - строки, timestamps - микросекунды, values - матрица (строки x поля)
+    с NaN для пустых ячеек. Возвращает кортежи
+    (device_id, поле, начало интервала, count, sum, min, max, last, метка last).
+    """
+    if not len(timestamps):
+        return []
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = np.asarray(timestamps, dtype=np.int64)[order]
+    values = np.asarray(values, dtype=float)[order]
+    devices, device_index = np.unique(np.asarray(device_ids, dtype=object)[order].astype(str), return_inverse=True)
+
+    width = tier_seconds * 1000000
+    buckets = timestamps // width * width
+    keys, group = np.unique(np.stack([device_index, buckets], axis=1), axis=0, return_inverse=True)
+    group = group.ravel()
+    n_groups = len(keys)
+    positions = np.arange(len(timestamps))
+
+    # Строка без единого значения всё равно считается в ROWS_FIELD
+    columns = [(ROWS_FIELD, np.ones(len(timestamps)))] + [(field, values[:, i]) for i, field in enumerate(fields)]
+    result = []
+    for field, column in columns:
+        valid = ~np.isnan(column)
+        if not valid.any():
+            continue
+        g, x, p = group[valid], column[valid], positions[valid]
+        count = np.bincount(g, minlength=n_groups)
+        total = np.bincount(g, weights=x, minlength=n_groups)
+        low = np.full(n_groups, np.inf)
+        high = np.full(n_groups, -np.inf)
+        last_pos = np.full(n_groups, -1)
+        np.minimum.at(low, g, x)
+        np.maximum.at(high, g, x)
+        np.maximum.at(last_pos, g, p)
+        for k in np.flatnonzero(count):
+            result.append((
+                devices[keys[k, 0]], field, int(keys[k, 1]), int(count[k]), float(total[k]),
+                float(low[k]), float(high[k]), float(column[last_pos[k]]), int(timestamps[last_pos[k]]),
+            ))
+    return result
+
+
+class RollupStore:
+    """Агрегаты показаний по уровням 1 мин / 1 ч / 1 день: count, sum, min, max, last.
+
+    Таблица rollup_<уровень> на каждый уровень, строка - (устройство, поле,
+    интервал). add_rows() вызывается из пути записи (бэкенд "rollup" в
+    storage.py): пачка сворачивается numpy и добавляется UPSERT-ом одной
+    транзакцией. rebuild() пересчитывает дни заново из сырых файлов.
+
+    rollup_coverage хранит по устройству момент, с которого агрегаты полные:
+    время первой записи через бэкенд (раньше он был выключен) или начало
+    пересчитанного rebuild() диапазона, если он дотягивается до этого момента.
+    Раньше него читатели берут сырые данные.
+    """
+
+    def __init__(self, path, fields=NUMERIC_FIELDS):
+        self.path = path
+        self.fields = list(fields)
+        self._local = threading.local()
+        self._create_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._connect()
+        with conn:
+            for tier, _ in TIERS:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS rollup_{tier} (device_id TEXT NOT NULL, field TEXT NOT NULL, "
+                    f"bucket INTEGER NOT NULL, n INTEGER NOT NULL, total REAL NOT NULL, low REAL, high REAL, "
+                    f"last REAL, last_ts INTEGER, PRIMARY KEY (device_id, field, bucket)) WITHOUT ROWID"
+                )
+            conn.execute("CREATE TABLE IF NOT EXISTS rollup_coverage (device_id TEXT PRIMARY KEY, since INTEGER NOT NULL)")
+
+    def _write(self, device_ids, timestamps, values, durable=False):
+        conn = self._connect()
+        conn.execute(f"PRAGMA synchronous={'FULL' if durable else 'NORMAL'}")
+        # Покрытие начинается не раньше момента записи: в первой пачке может быть
+        # догруженный архив, а сырые строки между ним и этой записью в агрегаты не попали
+        since = max(to_micros(datetime.datetime.now()), int(timestamps.max()))
+        with conn:
+            for tier, seconds in TIERS:
+                conn.executemany(UPSERT_SQL.format(tier=tier),
+                                 aggregate(device_ids, timestamps, values, self.fields, seconds))
+            # Первая пачка устройства; назад покрытие двигает только mark_rebuilt()
+            conn.executemany("INSERT OR IGNORE INTO rollup_coverage VALUES (?, ?)",
+                             [(device_id, since) for device_id in set(device_ids)])
+
+    def add_rows(self, rows, durable=False):
+        """Добавить пачку строк в формате CSV во все уровни."""
+        rows = [row for row in rows if row.get("timestamp")]
+        if not rows:
+            return
+        device_ids = [str(row.get("device_id", "")) for row in rows]
+        timestamps = np.array([to_micros(row["timestamp"]) for row in rows], dtype=np.int64)
+        values = np.array([[_to_float(row.get(field)) for field in self.fields] for row in rows], dtype=float)
+        self._write(device_ids, timestamps, values, durable)
+
+    def replace_range(self, device_id, start, end, timestamps, values):
+        """Заменить агрегаты устройства за [start, end) пересчитанными из сырых строк."""
+        conn = self._connect()
+        with conn:
+            for tier, seconds in TIERS:
+                width = seconds * 1000000
+                # Интервалы, целиком лежащие в диапазоне (границы дня кратны всем уровням)
+                conn.execute(f"DELETE FROM rollup_{tier} WHERE device_id = ? AND bucket >= ? AND bucket < ?",
+                             (device_id, to_micros(start) // width * width, to_micros(end)))
+                conn.executemany(UPSERT_SQL.format(tier=tier),
+                                 aggregate([device_id] * len(timestamps), timestamps, values, self.fields, seconds))
+
+    def covered_since(self, device_id):
+        """С какого момента агрегаты устройства полные; None - агрегатов ещё нет."""
+        record = self._connect().execute("SELECT since FROM rollup_coverage WHERE device_id = ?",
+                                         (device_id,)).fetchone()
+        return None if record is None else from_micros(record[0])
+
+    def covers(self, device_id, start):
+        since = self.covered_since(device_id)
+        return since is not None and since <= start
+
+    def mark_rebuilt(self, device_id, start, end):
+        """Учесть пересчёт [start, end): покрытие расширяется назад, если диапазон до него дотягивается."""
+        conn = self._connect()
+        with conn:
+            record = conn.execute("SELECT since FROM rollup_coverage WHERE device_id = ?", (device_id,)).fetchone()
+            if record is None:
+                # Записи через бэкенд ещё не было: покрытие есть, только если пересчитано до текущего момента
+                if end < datetime.datetime.now():
+                    return False
+                since = to_micros(start)
+            elif record[0] <= to_micros(end):
+                since = min(record[0], to_micros(start))
+            else:
+                return False
+            conn.execute("INSERT OR REPLACE INTO rollup_coverage VALUES (?, ?)", (device_id, since))
+        return True
+
+    def query(self, tier, device_id, fields, start, end):
+        """{поле: массивы bucket, count, sum, min, max, last} за [start, end) в порядке времени."""
+        conn = self._connect()
+        result = {}
+        for field in fields:
+            records = conn.execute(
+                f"SELECT bucket, n, total, low, high, last FROM rollup_{tier} "
+                f"WHERE device_id = ? AND field = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (device_id, field, to_micros(start), to_micros(end)),
+            ).fetchall()
+            data = np.array(records, dtype=float).reshape(-1, 6)
+            result[field] = {
+                "bucket": data[:, 0].astype(np.int64), "count": data[:, 1].astype(np.int64), "sum": data[:, 2],
+                "min": data[:, 3], "max": data[:, 4], "last": data[:, 5],
+            }
+        return result
+
+    def day_summary(self, day, device_id, source):
+        """Сводка за день в формате day_summary.build_summary: статистика полей - из дневного уровня.
+
+        last - значение поля в последней строке дня (пустое - 0.0), samples -
+        строки сырого файла дня source с номерами sample_indexes, как в build_summary.
+        None, если агрегаты покрывают день не целиком (тогда сводку строят по сырым данным).
+        """
+        start = datetime.datetime.strptime(day, "%Y-%m-%d")
+        if not self.covers(device_id, start):
+            return None
+        records = self._connect().execute(
+            "SELECT field, n, total, low, high, last, last_ts FROM rollup_1d WHERE device_id = ? AND bucket = ?",
+            (device_id, to_micros(start)),
+        ).fetchall()
+        by_field = {record[0]: record[1:] for record in records}
+        if ROWS_FIELD not in by_field:
+            return None
+        rows, last_row_ts = by_field[ROWS_FIELD][0], by_field[ROWS_FIELD][5]
+
+        stats = {}
+        for field in self.fields:
+            count, total, low, high, last, last_ts = by_field.get(field, (0, 0.0, None, None, 0.0, None))
+            # Поле, пустое в последней строке, хранит last более ранней строки
+            last = last if last_ts == last_row_ts else 0.0
+            stats[field] = {"count": count, "sum": total, "min": low, "max": high, "last": last or 0.0}
+
+        return {
+            "version": SUMMARY_VERSION,
+            "rows": rows,
+            "last_timestamp": from_micros(last_row_ts).isoformat(),
+            "fields": stats,
+            "samples": read_samples(source, rows),
+        }
+
+
+def choose_tier(start, end, points, factor=TIER_FACTOR):
+    """Уровень для графика за [start, end) на points точек; None - хватает сырых данных."""
+    seconds = (end - start).total_seconds()
+    if seconds / TIERS[0][1] <= points:
+        return None
+    for tier, tier_seconds in TIERS:
+        if seconds / tier_seconds <= points * factor:
+            return tier
+    return TIERS[-1][0]
+
+
+def tier_series(data, method):
+    """Ряд уровня для прореживания: для minmax - и минимум, и максимум интервала, иначе среднее."""
+    t = data["bucket"].astype('datetime64[us]')
+    if method == "minmax":
+        return np.repeat(t, 2), np.column_stack([data["min"], data["max"]]).ravel()
+    return t, data["sum"] / np.maximum(data["count"], 1)
+
+
+def rebuild(store, data_folder, start, end, device_ids):
+    """Пересчёт агрегатов за дни [start, end] из сырых дневных файлов."""
+    from training_data import day_range, day_sources, read_day
+
+    days = day_range(start, end)
+    if not days:
+        return
+    for day in days:
+        day_start = datetime.datetime.strptime(day, "%Y-%m-%d")
+        for device_id in device_ids:
+            frames = [read_day(path, store.fields) for path in day_sources(data_folder, day, device_id)]
+            df = pd.concat([frame[frame[DEVICE_COLUMN] == device_id] for frame in frames]) if frames else None
+            if df is None or not len(df):
+                timestamps, values = np.empty(0, dtype=np.int64), np.empty((0, len(store.fields)))
+            else:
+                timestamps = df.index.to_numpy(dtype='datetime64[us]').astype(np.int64)
+                values = df[store.fields].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+            store.replace_range(device_id, day_start, day_start + datetime.timedelta(days=1), timestamps, values)
+            if len(timestamps):
+                print(f"{device_id} {day}: {len(timestamps)} строк")
+
+    range_start = datetime.datetime.strptime(days[0], "%Y-%m-%d")
+    range_end = datetime.datetime.strptime(days[-1], "%Y-%m-%d") + datetime.timedelta(days=1)
+    for device_id in device_ids:
+        if not store.mark_rebuilt(device_id, range_start, range_end):
+            since = store.covered_since(device_id)
+            print(f"{device_id}: пересчёт не дотягивается до {since or 'текущего момента'}, "
+                  f"для этих дней по-прежнему читаются сырые данные")
+
+
+if __name__ == '__main__':
+    from devices import load_registry
+
+    parser = argparse.ArgumentParser(description="Пересчёт агрегатов 1 мин / 1 ч / 1 день из box_data")
+    parser.add_argument("start", help="первый день, YYYY-MM-DD")
+    parser.add_argument("end", nargs="?", help="последний день, по умолчанию сегодня")
+    parser.add_argument("--device", action="append", help="по умолчанию все устройства из devices.json")
+    parser.add_argument("--data", default="box_data")
+    args = parser.parse_args()
+
+    store = RollupStore(os.path.join(args.data, ROLLUPS_DB_NAME))
+    rebuild(store, args.data, args.start, args.end or datetime.date.today().isoformat(),
+            args.device or load_registry().ids())
+    print(f"Агрегаты пересчитаны в {store.path}")
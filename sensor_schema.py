@@ -0,0 +1,12 @@
+CSV_HEADERS = [
+    "timestamp", "device_id",
+    "soil1", "soil2", "soil3", "soil4", "soil5",
+    "ph_level", "ec", "tds", "turbidity", "co2",
+    "air_temperature",
+    "air_humidity",
+    "water_temperature",
+    "light_level"
+]
+
+# Числовые показания датчиков (всё, кроме timestamp и device_id)
+NUMERIC_FIELDS = CSV_HEADERS[2:]
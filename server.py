@@ -1,23 +1,47 @@
 #!/usr/bin/env python3
 from flask import Flask, request,make_response,Response, jsonify, render_template
-import csv
+import atexit
 import datetime
+import json
 import os
 from flask import send_file
 from flask_cors import CORS
 import requests
-from collections import deque
 from dotenv import load_dotenv
 from chatbot_utils import completeChat
+from readings_buffer import ReadingsBuffer
+from day_summary import load_summary, summarize_in_background, field_average
+from storage import create_storages
+from ingest import Sink, IngestPipeline, IngestQueueFull, build_record, STATUS_ACCEPTED
+from ingest_writer import DURABILITY_NONE
+from live_updates import LiveBroadcaster, CoalescingPublisher, SubscriberPoller
+from weather import WeatherProvider, WEATHER_TTL_SECONDS
+from forecast_store import ForecastStore
+from alerter import AlertWorker
+from devices import load_registry, day_csv_path, available_days, shard_legacy_days, DEVICES_FILE
+from downsample import (
+    load_series, downsample, downsample_series, series_to_json,
+    METHODS, METHOD_MINMAX, SERIES_POINTS, SERIES_MAX_POINTS, SERIES_MAX_DAYS,
+)
+from rollups import choose_tier, tier_series
+from training_data import source_path
+from sensor_schema import NUMERIC_FIELDS
 
 app = Flask(__name__)
 
 data_folder = 'box_data'
-EXPECTED_DEVICES = ["esp1"]
+BULK_MAX_RECORDS = 100000
+BULK_MAX_CLOCK_SKEW_MINUTES = 5
 
 load_dotenv()
 file_path = os.getenv("SYSTEM_PROMPT_FILE")
 
+# Устройства и их метаданные из devices.json; данные каждого - в box_data/<device_id>/
+devices = load_registry(os.getenv("DEVICES_FILE", DEVICES_FILE))
+# Общие box_data/YYYY-MM-DD.csv прежних версий раскладываются по устройствам при первом старте
+for legacy_path, legacy_counts in shard_legacy_days(data_folder, devices.default_id).items():
+    print(f"{legacy_path} разложен по устройствам: {legacy_counts}")
+
 with open(file_path, "r", encoding="utf-8") as f:
     SYSTEM_PROMPT_BASE = f.read()
 lat = os.getenv("LAT")
@@ -35,39 +59,174 @@ url = (
     "&current_weather=true"
 )
 
-response_weather = requests.get(url)
-
-try:
-    response_weather = requests.get(url, timeout=10)
-    if response_weather.status_code == 200:
-        data = response_weather.json()
-        current = data.get("current_weather", {})
-        print("Температура:", current.get("temperature"), "°C")
-        print("Скорость ветра:", current.get("windspeed"), "км/ч")
-        print("Направление ветра:", current.get("winddirection"), "°")
-        print("Погодный код (weathercode):", current.get("weathercode"))
-        print("Время измерения:", current.get("time"))
-    else:
-        print("Ошибка при запросе погоды при старте:", response_weather.status_code)
-except requests.exceptions.RequestException as e:
-    print(f"ОШИБКА: Не удалось получить данные о погоде при старте. Причина: {e}")
+# Погода только из памяти: обновляется в фоне, запросы к /data не ждут open-meteo
+weather = WeatherProvider(url, ttl=int(os.getenv("WEATHER_TTL_SECONDS", WEATHER_TTL_SECONDS)))
+weather.start()
+
+# Прогнозы forecast_script.py в памяти, перечитываются при изменении файлов
+forecasts = ForecastStore()
 
 os.makedirs('box_data', exist_ok=True)
-CSV_HEADERS = [
-    "timestamp", "device_id",
-    "soil1", "soil2", "soil3", "soil4", "soil5",
-    "ph_level", "ec", "tds", "turbidity", "co2",
-    "air_temperature",
-    "air_humidity",
-    "water_temperature",
-    "light_level"
-]
+# Через запятую: csv (всегда включён), columnar, sqlite, rollup (агрегаты 1 мин / 1 ч / 1 день)
+storages = create_storages(os.getenv("STORAGE_BACKENDS", "csv,rollup").split(","), data_folder)
+sensor_db = next((storage.store for storage in storages if storage.name == "sqlite"), None)
+rollup_db = next((storage.store for storage in storages if storage.name == "rollup"), None)
 
 
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 
-def get_growbox_data_for_date(date_str=None):
+def today_csv_path(device_id=None):
+    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    return day_csv_path(data_folder, current_date, device_id or devices.default_id)
+
+
+# Сегодняшние строки, записанные в CSV до включения бэкенда sqlite: без них /data и /monitor-data
+# не видели бы утренних показаний (повторный импорт дублей не создаёт)
+if sensor_db:
+    for sqlite_device_id in devices.ids():
+        if os.path.isfile(today_csv_path(sqlite_device_id)):
+            sensor_db.import_csv(today_csv_path(sqlite_device_id))
+
+
+def resolve_device_id(device_id):
+    # Параметр device_id у эндпоинтов чтения: без него - устройство по умолчанию, неизвестное - None
+    device_id = device_id or devices.default_id
+    return device_id if devices.known(device_id) else None
+
+
+# Буфер последних показаний у каждого устройства свой, как и дневной файл
+readings = {}
+
+
+def device_readings(device_id):
+    buffer = readings.get(device_id)
+    if buffer is None:
+        buffer = readings.setdefault(device_id, ReadingsBuffer())
+    return buffer
+
+
+def get_recent_rows(n=1, device_id=None):
+    device_id = device_id or devices.default_id
+    if sensor_db:
+        today_start = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        rows = sensor_db.last_rows(n, start=today_start, device_id=device_id)
+        if rows:
+            return rows
+    # Без SQLite или если в ней ещё нет сегодняшних строк - хвост CSV
+    buffer = device_readings(device_id)
+    buffer.sync(today_csv_path(device_id))
+    return buffer.last(n)
+
+
+# Проверка оповещений сразу по приходу показаний; ALERTS_ENABLED=0 - выключить
+alerts = AlertWorker() if os.getenv("ALERTS_ENABLED", "1") == "1" else None
+
+
+def box_data_before_write(day, device_id):
+    csv_filename = day_csv_path(data_folder, day, device_id)
+    if csv_filename == today_csv_path(device_id):
+        device_readings(device_id).sync(csv_filename)
+
+
+def box_data_after_write(day, rows, created, device_id):
+    csv_filename = day_csv_path(data_folder, day, device_id)
+    if csv_filename == today_csv_path(device_id):
+        if created:
+            summarize_previous_day(device_id)
+        # Догруженные /sensor/data/bulk старые показания не выдаём за последние
+        newer = device_readings(device_id).extend(rows, csv_filename)
+        if newer:
+            publish_live_readings(device_id, newer)
+            if alerts:
+                alerts.submit(newer)
+
+
+# Push новых показаний на дашборды через Server-Sent Events (/stream)
+live = LiveBroadcaster()
+# device_id -> метка последнего опубликованного показания
+live_state = {}
+
+
+def build_live_dashboard():
+    data, status = build_dashboard_data()
+    return data if status == 200 else None
+
+
+dashboard_publisher = CoalescingPublisher(live, "dashboard", build_live_dashboard, topic=devices.default_id)
+
+
+def publish_live_readings(device_id, rows):
+    live_state[device_id] = rows[-1].get("timestamp")
+    for row in rows:
+        live.publish("reading", row, device_id)
+    # Событие dashboard - то же, что /data без device_id
+    if device_id == devices.default_id:
+        dashboard_publisher.notify()
+
+
+def check_external_updates():
+    # Показания, записанные другим воркером Gunicorn, замечаем по хвосту файла
+    for device_id in devices.ids():
+        last_rows = get_recent_rows(1, device_id)
+        if last_rows and last_rows[-1].get("timestamp") != live_state.get(device_id):
+            publish_live_readings(device_id, last_rows)
+
+
+# После перезапуска последнее показание уже было опубликовано до него - не повторяем его как новое
+for live_device_id in devices.ids():
+    live_rows = get_recent_rows(1, live_device_id)
+    if live_rows:
+        live_state[live_device_id] = live_rows[-1].get("timestamp")
+external_updates = SubscriberPoller(live, check_external_updates)
+
+
+sinks = [
+    Sink("box_data", data_folder, storages, box_data_before_write, box_data_after_write, shard_by_device=True),
+    Sink("experiment", "experiment", create_storages(["csv"], "experiment")),
+]
+# Запись в фоне пачками; INGEST_ASYNC=0 - писать прямо в потоке запроса
+pipeline = IngestPipeline(
+    sinks,
+    async_writes=os.getenv("INGEST_ASYNC", "1") == "1",
+    flush_ms=int(os.getenv("INGEST_FLUSH_MS", "200")),
+    flush_rows=int(os.getenv("INGEST_FLUSH_ROWS", "500")),
+    max_queue=int(os.getenv("INGEST_QUEUE_SIZE", "10000")),
+    durability=os.getenv("INGEST_DURABILITY", DURABILITY_NONE),
+)
+atexit.register(pipeline.close)
+
+# Куда попадают показания с /sensor/data (через запятую), например box_data,experiment
+SENSOR_DATA_SINKS = os.getenv("SENSOR_DATA_SINKS", "box_data").split(",")
+EXPERIMENT_SINKS = ["experiment"]
+
+
+def get_day_summary(date_str, device_id=None):
+    device_id = device_id or devices.default_id
+    csv_filename = day_csv_path(data_folder, date_str, device_id)
+    # Статистика - из дневных агрегатов, выборка строк - из сырого файла;
+    # дни, которые агрегаты покрывают не целиком, - по-старому, из сырых данных
+    source = source_path(csv_filename) if rollup_db else None
+    if source:
+        summary = rollup_db.day_summary(date_str, device_id, source)
+        if summary:
+            return summary
+    is_today = csv_filename == today_csv_path(device_id)
+    # Прошедшие дни берём из файла-спутника, текущий день - из SQLite, если он включён
+    if sensor_db and (is_today or not os.path.isfile(csv_filename)):
+        return sensor_db.day_summary(date_str, device_id)
+    return load_summary(csv_filename, persist=not is_today)
+
+
+def summarize_previous_day(device_id):
+    # Вызывается при смене дня: сводка за вчера строится один раз в фоне
+    yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+    csv_filename = day_csv_path(data_folder, yesterday.strftime("%Y-%m-%d"), device_id)
+    if os.path.isfile(csv_filename):
+        summarize_in_background(csv_filename)
+
+
+def get_growbox_data_for_date(date_str=None, device_id=None):
     def safe_float(val, default=0.0):
         try:
             return float(val) if val else default
@@ -78,22 +237,13 @@ def get_growbox_data_for_date(date_str=None):
     requested_date = date_str if date_str and date_str != 'now' else None
 
     filename_date = requested_date or datetime.datetime.now().strftime("%Y-%m-%d")
-    csv_filename = os.path.join(data_folder, f'{filename_date}.csv')
+    csv_filename = day_csv_path(data_folder, filename_date, device_id or devices.default_id)
 
-    if not os.path.isfile(csv_filename):
+    if not sensor_db and not os.path.isfile(csv_filename):
         print(f"Файл данных не найден: {csv_filename}")
         return None, requested_date is not None, requested_date
 
     try:
-        with open(csv_filename, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            all_rows = list(reader)
-
-        if not all_rows:
-            return None, requested_date is not None, requested_date
-
-        last_row_in_file = all_rows[-1]
-
         if requested_date:
             is_historical = True
             fields_to_average = [
@@ -101,20 +251,22 @@ def get_growbox_data_for_date(date_str=None):
                 "ph_level", "ec", "tds", "turbidity", "co2",
                 "air_temperature", "air_humidity", "light_level", "water_temperature"
             ]
-            sums = {field: 0.0 for field in fields_to_average}
-            count = len(all_rows)
+            summary = get_day_summary(requested_date, device_id)
+            if not summary or not summary["rows"]:
+                return None, True, requested_date
 
-            for row in all_rows:
-                for field in fields_to_average:
-                    sums[field] += safe_float(row.get(field))
+            data = {field: field_average(summary, field) for field in fields_to_average}
+            data["timestamp"] = summary["last_timestamp"]
+            return data, is_historical, requested_date
 
-            data = {field: (sums[field] / count) for field in fields_to_average}
-            data["timestamp"] = last_row_in_file.get("timestamp")
+        all_rows = get_recent_rows(1, device_id)
+        if not all_rows:
+            return None, False, requested_date
 
-        else:
-            is_historical = False
-            data = {key: safe_float(val) for key, val in last_row_in_file.items() if key != 'timestamp'}
-            data["timestamp"] = last_row_in_file.get("timestamp")
+        last_row_in_file = all_rows[-1]
+
+        data = {key: safe_float(val) for key, val in last_row_in_file.items() if key != 'timestamp'}
+        data["timestamp"] = last_row_in_file.get("timestamp")
 
         return data, is_historical, requested_date
 
@@ -146,63 +298,94 @@ def proxy(path):
 
     return Response(resp.content, resp.status_code, headers)
 
-@app.route('/sensor/data', methods=['POST'])
-def receive_sensor_data():
-    try:
-        data = request.json
-        print(f"Получены данные: {data}")
-        if not data or "device_id" not in data:
-            return jsonify({"error": "Invalid request format or missing device_id"}), 400
-
-        device_id = data["device_id"]
-        if device_id not in EXPECTED_DEVICES:
-            return jsonify({"error": f"Unknown device: {device_id}"}), 400
+def parse_device_timestamp(value, now):
+    # Время с устройства: ISO 8601 или unix-время в секундах; без него - время приёма
+    if value in (None, ""):
+        return now
+    if isinstance(value, bool):
+        raise ValueError("timestamp must be ISO 8601 or unix seconds")
+    if isinstance(value, (int, float)):
+        timestamp = datetime.datetime.fromtimestamp(value)
+    else:
+        timestamp = datetime.datetime.fromisoformat(str(value))
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+    if timestamp > now + datetime.timedelta(minutes=BULK_MAX_CLOCK_SKEW_MINUTES):
+        raise ValueError("timestamp is in the future")
+    return timestamp
+
+
+def iter_bulk_readings():
+    # JSON-массив целиком или NDJSON (по объекту на строку), читаемый потоком
+    content_type = (request.mimetype or "").lower()
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+        return
 
+    readings_list = request.get_json(silent=True)
+    if not isinstance(readings_list, list):
+        raise ValueError("Expected a JSON array or an NDJSON body")
+    yield from readings_list
 
-        timestamp = datetime.datetime.now().isoformat()
-
-        row = [
-            timestamp,
-            data.get("device_id", ""),
-            data.get("soil1", ""),
-            data.get("soil2", ""),
-            data.get("soil3", ""),
-            data.get("soil4", ""),
-            data.get("soil5", ""),
-            data.get("ph_level", ""),
-            data.get("ec", ""),
-            data.get("tds", ""),
-            data.get("turbidity", ""),
-            data.get("co2", ""),
-            data.get("temperature", ""),
-            data.get("humidity", ""),
-            "",
-            data.get("light_level", "")
-        ]
 
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        csv_filename = f'box_data/{current_date}.csv'
+@app.route('/sensor/data/bulk', methods=['POST'])
+def receive_sensor_data_bulk():
+    now = datetime.datetime.now()
+    results = []
+    rows_by_day = {}
 
-        file_exists = os.path.isfile(csv_filename)
-
-        with open(csv_filename, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            if not file_exists:
-                writer.writerow(CSV_HEADERS)
-            writer.writerow(row)
+    try:
+        for index, data in enumerate(iter_bulk_readings()):
+            if index >= BULK_MAX_RECORDS:
+                results.append({"index": index, "status": "invalid", "error": "Too many records in one request"})
+                break
+            try:
+                if isinstance(data, Exception):
+                    raise ValueError(f"Invalid JSON: {data}")
+                if not isinstance(data, dict) or "device_id" not in data:
+                    raise ValueError("Invalid record format or missing device_id")
+                if not devices.known(data["device_id"]):
+                    raise ValueError(f"Unknown device: {data['device_id']}")
+                timestamp = parse_device_timestamp(data.get("timestamp"), now)
+            except (ValueError, TypeError, OverflowError, OSError) as e:
+                results.append({"index": index, "status": "invalid", "error": str(e)})
+                continue
 
-        print(f"Записаны данные в {csv_filename}: {row}")
+            result = {"index": index, "status": None}
+            results.append(result)
+            day = timestamp.strftime("%Y-%m-%d")
+            rows_by_day.setdefault(day, []).append((timestamp, build_record(data, timestamp), result))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        return jsonify({"message": "Data stored successfully"}), 201
+    for day in sorted(rows_by_day):
+        items = sorted(rows_by_day[day], key=lambda item: item[0])
+        rows = [record for _, record, _ in items]
+        try:
+            status = pipeline.submit(SENSOR_DATA_SINKS, day, rows)
+        except IngestQueueFull:
+            status = "rejected"
+        for _, _, result in items:
+            result["status"] = status
+            if status == "rejected":
+                result["error"] = "Ingest queue is full, retry later"
 
-    except Exception as e:
-        print(f"Ошибка при обработке данных датчика: {e}")
-        return jsonify({"error": "Failed to process request"}), 500
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(f"Пакетная загрузка: {counts}")
 
+    return jsonify({"counts": counts, "results": results}), 200
 
 
-@app.route('/sensor/data_experiment', methods=['POST'])
-def receive_sensor_data_experiment():
+def ingest_reading(sink_names):
     try:
         data = request.json
         print(f"Получены данные: {data}")
@@ -210,50 +393,37 @@ def receive_sensor_data_experiment():
             return jsonify({"error": "Invalid request format or missing device_id"}), 400
 
         device_id = data["device_id"]
-        if device_id not in EXPECTED_DEVICES:
+        if not devices.known(device_id):
             return jsonify({"error": f"Unknown device: {device_id}"}), 400
 
+        timestamp = datetime.datetime.now()
+        record = build_record(data, timestamp)
 
-        timestamp = datetime.datetime.now().isoformat()
-
-        row = [
-            timestamp,
-            data.get("device_id", ""),
-            data.get("soil1", ""),
-            data.get("soil2", ""),
-            data.get("soil3", ""),
-            data.get("soil4", ""),
-            data.get("soil5", ""),
-            data.get("ph_level", ""),
-            data.get("ec", ""),
-            data.get("tds", ""),
-            data.get("turbidity", ""),
-            data.get("co2", ""),
-            data.get("temperature", ""),
-            data.get("humidity", ""),
-            "",
-            data.get("light_level", "")
-        ]
-
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        csv_filename = f'experiment/{current_date}.csv'
-
-        file_exists = os.path.isfile(csv_filename)
-
-        with open(csv_filename, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            if not file_exists:
-                writer.writerow(CSV_HEADERS)
-            writer.writerow(row)
-
-        print(f"Записаны данные в {csv_filename}: {row}")
-
+        try:
+            status = pipeline.submit(sink_names, timestamp.strftime("%Y-%m-%d"), [record])
+        except IngestQueueFull:
+            resp = jsonify({"error": "Ingest queue is full, retry later"})
+            resp.headers['Retry-After'] = '1'
+            return resp, 503
+
+        if status == STATUS_ACCEPTED:
+            return jsonify({"message": "Data accepted"}), 202
         return jsonify({"message": "Data stored successfully"}), 201
 
     except Exception as e:
         print(f"Ошибка при обработке данных датчика: {e}")
         return jsonify({"error": "Failed to process request"}), 500
 
+
+@app.route('/sensor/data', methods=['POST'])
+def receive_sensor_data():
+    return ingest_reading(SENSOR_DATA_SINKS)
+
+
+@app.route('/sensor/data_experiment', methods=['POST'])
+def receive_sensor_data_experiment():
+    return ingest_reading(EXPERIMENT_SINKS)
+
 @app.route('/update', methods=['GET'])
 def check_update():
     try:
@@ -310,27 +480,14 @@ def dashboard():
 def new_dashboard():
     return render_template('new_dashboard.html')
 
-@app.route('/data')
-def get_data():
-    data_folder = 'box_data'
-    response_weather = requests.get(url)
+def build_dashboard_data(device_id=None):
+    device_id = device_id or devices.default_id
+    current = weather.get_current()
 
-    current = {}
-    try:
-        response_weather = requests.get(url, timeout=10)
-        response_weather.raise_for_status()
-        data = response_weather.json()
-        current = data.get("current_weather", {})
-    except requests.exceptions.RequestException as e:
-        print(f"ОШИБКА: Не удалось получить данные о погоде. Причина: {e}")
-
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    csv_filename = f'{data_folder}/{current_date}.csv'
+    last_rows = get_recent_rows(10, device_id)
 
-    # csv_filename = f'2025-04-11.csv'
-
-    if not os.path.isfile(csv_filename):
-        return jsonify({"error": "No data available"}), 404
+    if not last_rows:
+        return {"error": "No data available"}, 404
 
     # # Calculate the time threshold for 15 minutes ago
     # fifteen_minutes_ago = datetime.datetime.now() - datetime.timedelta(minutes=5)
@@ -364,9 +521,6 @@ def get_data():
 
 
 
-    with open(csv_filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        last_rows = deque(reader, maxlen=10)
     humidity_data = [
         {
             "timestamp": row["timestamp"],
@@ -417,97 +571,32 @@ def get_data():
 
 
     if last_row is None:
-        return jsonify({"error": "No data available"}), 404
+        return {"error": "No data available"}, 404
 
     last_timestamp = last_row["timestamp"]
     try:
         last_ts_dt = datetime.datetime.fromisoformat(last_timestamp)
     except ValueError:
-        return jsonify({"error": "Invalid last timestamp format"}), 400
-
-
-    forecast_filename_temp = 'forecast_temperature.csv'
-    if not os.path.isfile(forecast_filename_temp):
-        return jsonify({"error": "No forecast data available"}), 404
-
-    forecast_data_temp = []
-    with open(forecast_filename_temp, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        start_collect = False
-        for row in reader:
-            ts_str = row.get("timestamp", "").strip()
-            if not ts_str:
-                continue
-
-            try:
-                forecast_ts = datetime.datetime.fromisoformat(ts_str)
-            except ValueError:
-                continue
+        return {"error": "Invalid last timestamp format"}, 400
 
-            if not start_collect:
-                delta = abs((forecast_ts - last_ts_dt).total_seconds())
-                if delta <= 10:
-                    start_collect = True
-
-            if start_collect:
-                temp = row.get("forecast_temperature", row.get("air_temperature", "0"))
-                forecast_data_temp.append({
-                    "timestamp": ts_str,
-                    "forecast_temperature": float(temp) if temp else 0
-                })
-                if len(forecast_data_temp) >= 10:
-                    break
-
-    forecast_filename_hum = 'forecast_humidity.csv'
-    if not os.path.isfile(forecast_filename_hum):
-        return jsonify({"error": "No forecast data available"}), 404
-
-    forecast_data_hum = []
-    with open(forecast_filename_hum, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        start_collect = False
-        for row in reader:
-            ts_str = row.get("timestamp", "").strip()
-            if not ts_str:
-                continue
 
-            try:
-                forecast_ts = datetime.datetime.fromisoformat(ts_str)
-            except ValueError:
-                continue
+    if not (forecasts.available("temperature") and forecasts.available("humidity")):
+        return {"error": "No forecast data available"}, 404
 
-            if not start_collect:
-                delta = abs((forecast_ts - last_ts_dt).total_seconds())
-                if delta <= 10:
-                    start_collect = True
-
-            if start_collect:
-                temp = row.get("forecast_humidity", row.get("air_humidity", "0"))
-                forecast_data_hum.append({
-                    "timestamp": ts_str,
-                    "forecast_humidity": float(temp) if temp else 0
-                })
-                if len(forecast_data_hum) >= 10:
-                    break
+    forecast_data_temp = [
+        {"timestamp": ts, "forecast_temperature": value}
+        for ts, value in forecasts.next_points("temperature", last_ts_dt, 10, tolerance=10)
+    ]
+    forecast_data_hum = [
+        {"timestamp": ts, "forecast_humidity": value}
+        for ts, value in forecasts.next_points("humidity", last_ts_dt, 10, tolerance=10)
+    ]
 
     max_dates = 10
 
-    box_data_folder = 'box_data'
-    available_dates = []
-    if os.path.isdir(box_data_folder):
-        for fname in os.listdir(box_data_folder):
-            if fname.lower().endswith('.csv'):
-                date_part = fname[:-4]
-                try:
-                    datetime.datetime.strptime(date_part, '%Y-%m-%d')
-                    available_dates.append(date_part)
-                except ValueError:
-                    continue
-        available_dates.sort(reverse=True)
-        available_dates = available_dates[:max_dates]
-    else:
-        available_dates = []
+    available_dates = available_days(os.path.join(data_folder, device_id), max_dates)
     data = {
+        "device_id": device_id,
         "soil1": float(last_row["soil1"]) if last_row["soil1"] else 0,
         "soil2": float(last_row["soil2"]) if last_row["soil2"] else 0,
         "soil3": float(last_row["soil3"]) if last_row["soil3"] else 0,
@@ -534,7 +623,37 @@ def get_data():
         "history_data": available_dates
     }
 
-    return jsonify(data)
+    return data, 200
+
+
+def unknown_device_response(device_id):
+    return jsonify({"error": f"Unknown device: {device_id}"}), 404
+
+
+@app.route('/devices')
+def list_devices():
+    return jsonify({"default": devices.default_id, "devices": devices.to_list()})
+
+
+@app.route('/data')
+def get_data():
+    device_id = resolve_device_id(request.args.get('device_id'))
+    if device_id is None:
+        return unknown_device_response(request.args.get('device_id'))
+    data, status = build_dashboard_data(device_id)
+    return jsonify(data), status
+
+@app.route('/stream')
+def stream():
+    # Показания только одного устройства, по умолчанию - первого
+    device_id = resolve_device_id(request.args.get('device_id'))
+    if device_id is None:
+        return unknown_device_response(request.args.get('device_id'))
+    return Response(
+        live.stream(topic=device_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/data_by_date')
 def data_by_date():
@@ -547,8 +666,12 @@ def data_by_date():
     except ValueError:
         return jsonify({"error": f"Неверный формат даты: {date_str}. Ожидается YYYY-MM-DD."}), 400
 
-    csv_filename = os.path.join(data_folder, f'{date_str}.csv')
-    if not os.path.isfile(csv_filename):
+    device_id = resolve_device_id(request.args.get('device_id'))
+    if device_id is None:
+        return unknown_device_response(request.args.get('device_id'))
+
+    summary = get_day_summary(date_str, device_id)
+    if summary is None:
         return jsonify({"error": f"Нет данных за дату {date_str}"}), 404
 
     # weather_url = 'ВАШ_URL_ПОГОДЫ'
@@ -559,11 +682,7 @@ def data_by_date():
     # else:
     current_weather = {}
 
-    with open(csv_filename, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        all_rows = list(reader)
-
-    if not all_rows:
+    if not summary["rows"]:
         return jsonify({"error": "Файл пустой или некорректный формат"}), 404
 
     def safe_float(val):
@@ -576,23 +695,9 @@ def data_by_date():
         "soil1", "soil2", "soil3", "soil4", "soil5",
         "ph_level", "air_temperature", "air_humidity", "light_level"
     ]
-    sums = {field: 0.0 for field in fields_to_average}
-    count = len(all_rows)
+    averages = {field: field_average(summary, field) for field in fields_to_average}
 
-    for row in all_rows:
-        for field in fields_to_average:
-            sums[field] += safe_float(row.get(field, 0))
-
-    averages = {field: (sums[field] / count) for field in fields_to_average}
-
-    N = len(all_rows)
-    step = max(1, N // 10)
-    sampled_rows = []
-    for i in range(10):
-        idx = i * step
-        if idx >= N:
-            idx = N - 1
-        sampled_rows.append(all_rows[idx])
+    sampled_rows = summary["samples"]
 
     humidity_data = [
         {
@@ -642,27 +747,14 @@ def data_by_date():
         for row in sampled_rows
     ]
 
-    last_row = all_rows[-1]
+    last_values = {field: stats["last"] for field, stats in summary["fields"].items()}
 
     max_dates = 5
 
-    box_data_folder = 'box_data'
-    available_dates = []
-    if os.path.isdir(box_data_folder):
-        for fname in os.listdir(box_data_folder):
-            if fname.lower().endswith('.csv'):
-                date_part = fname[:-4]
-                try:
-                    datetime.datetime.strptime(date_part, '%Y-%m-%d')
-                    available_dates.append(date_part)
-                except ValueError:
-                    continue
-        available_dates.sort(reverse=True)
-        available_dates = available_dates[:max_dates]
-    else:
-        available_dates = []
+    available_dates = available_days(os.path.join(data_folder, device_id), max_dates)
 
     result = {
+        "device_id": device_id,
         "soil1": averages["soil1"],
         "soil2": averages["soil2"],
         "soil3": averages["soil3"],
@@ -673,10 +765,10 @@ def data_by_date():
         "air_humidity": averages["air_humidity"],
         "light_level": averages["light_level"],
 
-        "co2": safe_float(last_row.get("co2", 0)),
-        "turbidity": safe_float(last_row.get("turbidity", 0)),
-        "ec": safe_float(last_row.get("ec", 0)),
-        "tds": safe_float(last_row.get("tds", 0)),
+        "co2": last_values["co2"],
+        "turbidity": last_values["turbidity"],
+        "ec": last_values["ec"],
+        "tds": last_values["tds"],
 
         "humidity_data": humidity_data,
         "temperature_data": temperature_data,
@@ -694,42 +786,105 @@ def data_by_date():
     }
 
     return jsonify(result), 200
+
+@app.route('/data/range')
+def data_range():
+    if not sensor_db:
+        return jsonify({"error": "SQLite-хранилище не включено (STORAGE_BACKENDS)"}), 503
+
+    try:
+        start = datetime.datetime.fromisoformat(request.args['start'])
+        end = datetime.datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+        limit = int(request.args.get('limit', 10000))
+    except KeyError:
+        return jsonify({"error": "Параметр 'start' обязателен (ISO 8601)"}), 400
+    except ValueError as e:
+        return jsonify({"error": f"Неверный параметр: {e}"}), 400
+
+    fields = [f for f in request.args.get('fields', '').split(',') if f]
+    unknown = [f for f in fields if f not in sensor_db.fields]
+    if unknown:
+        return jsonify({"error": f"Неизвестные поля: {', '.join(unknown)}"}), 400
+
+    rows = sensor_db.query(start, end, device_id=request.args.get('device_id'), fields=fields or None, limit=limit)
+    return jsonify({"count": len(rows), "rows": rows})
+
+@app.route('/series')
+def series():
+    device_id = resolve_device_id(request.args.get('device_id'))
+    if device_id is None:
+        return unknown_device_response(request.args.get('device_id'))
+
+    try:
+        start = datetime.datetime.fromisoformat(request.args['start'])
+        end = datetime.datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.datetime.now()
+        points = int(request.args.get('points', SERIES_POINTS))
+    except KeyError:
+        return jsonify({"error": "Параметр 'start' обязателен (ISO 8601)"}), 400
+    except ValueError as e:
+        return jsonify({"error": f"Неверный параметр: {e}"}), 400
+
+    method = request.args.get('method', METHOD_MINMAX)
+    if method not in METHODS:
+        return jsonify({"error": f"Неизвестный метод: {method}. Доступны: {', '.join(METHODS)}"}), 400
+    if not 2 <= points <= SERIES_MAX_POINTS:
+        return jsonify({"error": f"points должно быть от 2 до {SERIES_MAX_POINTS}"}), 400
+    if not start < end or (end - start).days > SERIES_MAX_DAYS:
+        return jsonify({"error": f"Нужен интервал start < end не длиннее {SERIES_MAX_DAYS} дней"}), 400
+
+    fields = [f for f in request.args.get('fields', 'air_temperature,air_humidity').split(',') if f]
+    unknown = [f for f in fields if f not in NUMERIC_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Неизвестные поля: {', '.join(unknown)}"}), 400
+
+    # Длинные периоды - из агрегатов подходящего уровня, короткие и не покрытые агрегатами - из сырых показаний
+    tier = choose_tier(start, end, points) if rollup_db and rollup_db.covers(device_id, start) else None
+    rollup = rollup_db.query(tier, device_id, fields, start, end) if tier else None
+    if rollup:
+        raw_points = {field: int(data["count"].sum()) for field, data in rollup.items()}
+        downsampled = {field: downsample(*tier_series(data, method), points, method) for field, data in rollup.items()}
+    else:
+        tier = None
+        df = load_series(data_folder, device_id, fields, start, end)
+        raw_points = {field: int(df[field].notna().sum()) for field in fields}
+        downsampled = downsample_series(df, fields, points, method)
+
+    return jsonify({
+        "device_id": device_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "method": method,
+        "tier": tier or "raw",
+        "raw_points": raw_points,
+        "series": series_to_json(downsampled),
+    })
+
 @app.route('/monitor')
 def monitor():
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    csv_filename = f'{data_folder}/{current_date}.csv'
+    device_id = resolve_device_id(request.args.get('device_id'))
+    if device_id is None:
+        return f"Unknown device: {request.args.get('device_id')}", 404
+    last_rows = get_recent_rows(1, device_id)
 
-    if not os.path.isfile(csv_filename):
+    if not last_rows:
         return "No data available", 404
 
-    last_row = None
-    with open(csv_filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            last_row = row
+    last_row = last_rows[0]
 
-    if last_row is None:
-        return "No data available", 404
-
-    return render_template('monitor.html', data=last_row)
+    return render_template('monitor.html', data=last_row, device_id=device_id)
 
 
 @app.route('/monitor-data')
 def monitor_data():
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    csv_filename = f'{data_folder}/{current_date}.csv'
+    device_id = resolve_device_id(request.args.get('device_id'))
+    if device_id is None:
+        return unknown_device_response(request.args.get('device_id'))
+    last_rows = get_recent_rows(1, device_id)
 
-    if not os.path.isfile(csv_filename):
+    if not last_rows:
         return jsonify({"error": "No data available"}), 404
 
-    last_row = None
-    with open(csv_filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            last_row = row
-
-    if last_row is None:
-        return jsonify({"error": "No data available"}), 404
+    last_row = last_rows[0]
 
     return jsonify(last_row)
 
@@ -737,6 +892,10 @@ def monitor_data():
 def data_status():
     return jsonify({"message": True})
 
+@app.route('/weather-status')
+def weather_status():
+    return jsonify(weather.metrics())
+
 @app.route('/login')
 def login_page():
     return render_template('login_page.html')
@@ -762,12 +921,17 @@ def chat():
         if not user_input:
             return jsonify({"error": "Empty message"}), 400
 
-        current_data, is_historical, requested_date = get_growbox_data_for_date(date_context)
+        device_id = resolve_device_id(data.get("device_id"))
+        if device_id is None:
+            return unknown_device_response(data.get("device_id"))
+
+        current_data, is_historical, requested_date = get_growbox_data_for_date(date_context, device_id)
 
         current_request_time = datetime.datetime.now().isoformat(timespec='seconds')
 
         data_context_block = "\n<CURRENT_DATA>\n"
         data_context_block += f"info: Текущее время запроса: {current_request_time}\n"
+        data_context_block += f"device: {devices.get(device_id).name} ({device_id})\n"
 
         if current_data:
             data_header = "type: Средние показатели за день" if is_historical else "type: Текущие показатели"
@@ -822,23 +986,13 @@ def chat():
         print(f"Chat error: {e}")
         return jsonify({"error": "Failed to get reply"}), 500
 
-def get_latest_growbox_data():
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    csv_filename = f'box_data/{current_date}.csv'
-
-    if not os.path.isfile(csv_filename):
-        print(f"Файл данных за сегодня ({csv_filename}) не найден.")
-        return None
-
+def get_latest_growbox_data(device_id=None):
     try:
-        with open(csv_filename, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            last_row = None
-            for row in reader:
-                last_row = row
-
-        if not last_row:
+        last_rows = get_recent_rows(1, device_id)
+        if not last_rows:
+            print(f"Нет данных за сегодня ({today_csv_path(device_id)}).")
             return None
+        last_row = last_rows[0]
 
         data = {
             "soil1": float(last_row.get("soil1") or 0),
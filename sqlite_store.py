@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import datetime
+import glob
+import os
+import sqlite3
+import threading
+
+from columnar_store import to_micros, from_micros, format_value
+from day_summary import SUMMARY_VERSION, sample_indexes
+from sensor_schema import NUMERIC_FIELDS
+
+DB_FILE_NAME = "samples.db"
+INSERT_BATCH_ROWS = 5000
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (ValueError, TypeError):
+        return None
+
+
+class SqliteStore:
+    """Показания датчиков в SQLite: таблица samples с индексом (device_id, ts).
+
+    ts - микросекунды от 1970-01-01 в локальном времени, как в columnar_store.
+    Соединение своё у каждого потока, журнал WAL позволяет читать во время записи.
+    """
+
+    def __init__(self, path, fields=NUMERIC_FIELDS):
+        self.path = path
+        self.fields = list(fields)
+        self._local = threading.local()
+        self._create_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        columns = ", ".join(f"{field} REAL" for field in self.fields)
+        conn = self._connect()
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS samples (device_id TEXT NOT NULL, ts INTEGER NOT NULL, {columns})")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS samples_device_ts ON samples (device_id, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts)")
+
+    def insert_rows(self, rows, durable=False):
+        """Пакетная вставка строк в формате CSV одной транзакцией; дубликаты пропускаются.
+
+        durable=True - синхронизация с диском при коммите (PRAGMA synchronous=FULL).
+        """
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" * (len(self.fields) + 2))
+        values = [
+            [str(row.get("device_id", "")), to_micros(row["timestamp"])] + [_to_float(row.get(field)) for field in self.fields]
+            for row in rows
+        ]
+        conn = self._connect()
+        conn.execute(f"PRAGMA synchronous={'FULL' if durable else 'NORMAL'}")
+        with conn:
+            cursor = conn.executemany(f"INSERT OR IGNORE INTO samples VALUES ({placeholders})", values)
+        return cursor.rowcount
+
+    def _to_row(self, record, fields=None):
+        row = {"timestamp": from_micros(record[1]).isoformat(), "device_id": record[0]}
+        for field, value in zip(fields or self.fields, record[2:]):
+            row[field] = "" if value is None else format_value(value)
+        return row
+
+    def _select(self, where, params, order="ASC", limit=None, fields=None):
+        columns = ", ".join(["device_id", "ts"] + list(fields or self.fields))
+        sql = f"SELECT {columns} FROM samples WHERE {where} ORDER BY ts {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self._connect().execute(sql, params).fetchall()
+
+    def _range_where(self, start=None, end=None, device_id=None):
+        clauses, params = ["1 = 1"], []
+        if device_id is not None:
+            clauses.append("device_id = ?")
+            params.append(device_id)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(to_micros(start))
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(to_micros(end))
+        return " AND ".join(clauses), params
+
+    def query(self, start=None, end=None, device_id=None, fields=None, limit=None):
+        """Строки за [start, end) в порядке времени."""
+        fields = list(fields or self.fields)
+        where, params = self._range_where(start, end, device_id)
+        records = self._select(where, params, limit=limit, fields=fields)
+        return [self._to_row(record, fields) for record in records]
+
+    def last_rows(self, n, start=None, device_id=None):
+        where, params = self._range_where(start, None, device_id)
+        records = self._select(where, params, order="DESC", limit=n)
+        return [self._to_row(record) for record in reversed(records)]
+
+    def day_summary(self, day, device_id=None):
+        """Сводка за день в том же формате, что и day_summary.build_summary."""
+        start = datetime.datetime.strptime(day, "%Y-%m-%d")
+        where, params = self._range_where(start, start + datetime.timedelta(days=1), device_id)
+        conn = self._connect()
+
+        aggregates = ", ".join(
+            f"COUNT({field}), TOTAL({field}), MIN({field}), MAX({field})" for field in self.fields
+        )
+        record = conn.execute(f"SELECT COUNT(*), {aggregates} FROM samples WHERE {where}", params).fetchone()
+        rows = record[0]
+        if not rows:
+            return None
+
+        last_row = self._to_row(self._select(where, params, order="DESC", limit=1)[0])
+        stats = {}
+        for i, field in enumerate(self.fields):
+            count, total, minimum, maximum = record[1 + 4 * i:5 + 4 * i]
+            stats[field] = {
+                "count": count, "sum": total, "min": minimum, "max": maximum,
+                "last": _to_float(last_row[field]) or 0.0,
+            }
+
+        indexes = sample_indexes(rows)
+        columns = ", ".join(["device_id", "ts"] + self.fields)
+        numbered = conn.execute(
+            f"SELECT {columns}, rn FROM (SELECT {columns}, ROW_NUMBER() OVER (ORDER BY ts) - 1 AS rn "
+            f"FROM samples WHERE {where}) WHERE rn IN ({', '.join('?' * len(set(indexes)))})",
+            params + sorted(set(indexes)),
+        ).fetchall()
+        by_index = {record[-1]: self._to_row(record[:-1]) for record in numbered}
+
+        return {
+            "version": SUMMARY_VERSION,
+            "rows": rows,
+            "last_timestamp": last_row["timestamp"],
+            "fields": stats,
+            "samples": [by_index[i] for i in indexes],
+        }
+
+    def import_csv(self, csv_path, batch_rows=INSERT_BATCH_ROWS):
+        inserted = 0
+        batch = []
+        with open(csv_path, 'r', newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                if not row.get("timestamp"):
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_rows:
+                    inserted += self.insert_rows(batch)
+                    batch = []
+        inserted += self.insert_rows(batch)
+        return inserted
+
+
+def import_archive(store, paths):
+    """Разовый импорт архива box_data/*.csv и box_data/<device_id>/*.csv; повторный запуск не создаёт дублей."""
+    csv_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            csv_paths.extend(sorted(glob.glob(os.path.join(path, '*.csv')) + glob.glob(os.path.join(path, '*', '*.csv'))))
+        else:
+            csv_paths.append(path)
+
+    total = 0
+    for csv_path in csv_paths:
+        inserted = store.import_csv(csv_path)
+        total += inserted
+        print(f"{csv_path}: добавлено {inserted} строк")
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Импорт архива box_data в SQLite")
+    parser.add_argument("paths", nargs="*", default=["box_data"], help="CSV-файлы или каталоги с ними")
+    parser.add_argument("--db", default=os.path.join("box_data", DB_FILE_NAME))
+    args = parser.parse_args()
+
+    total = import_archive(SqliteStore(args.db), args.paths)
+    print(f"Импорт завершён, всего добавлено {total} строк")
@@ -0,0 +1,162 @@
+import csv
+import os
+from contextlib import contextmanager
+
+from columnar_store import ColumnarDay, csv_to_columnar, row_micros, sort_rows
+from csv_tail import read_last_rows
+from sensor_schema import CSV_HEADERS
+from rollups import RollupStore, ROLLUPS_DB_NAME
+from sqlite_store import SqliteStore, DB_FILE_NAME
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Один файл блокировки на каталог: дописывание и пересборка дня не пересекаются между воркерами
+CSV_LOCK_FILE = ".csv.lock"
+
+
+def _day_folder(folder, device_id):
+    # Шардирование по устройствам: <folder>/<device_id>/...
+    if not device_id:
+        return folder
+    device_folder = os.path.join(folder, device_id)
+    os.makedirs(device_folder, exist_ok=True)
+    return device_folder
+
+
+@contextmanager
+def _locked(path):
+    with open(path, 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class CsvStorage:
+    """Дневные CSV-файлы <folder>[/<device_id>]/YYYY-MM-DD.csv - основной формат, его читают все эндпоинты."""
+
+    name = "csv"
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def path(self, day, device_id=None):
+        return os.path.join(_day_folder(self.folder, device_id), f'{day}.csv')
+
+    def append(self, day, rows, fsync=False, device_id=None):
+        """Строки дописываются по времени; пачка старше конца файла вставляется в середину."""
+        csv_filename = self.path(day, device_id)
+        rows = sort_rows(rows)
+        with _locked(os.path.join(os.path.dirname(csv_filename), CSV_LOCK_FILE)):
+            file_exists = os.path.isfile(csv_filename)
+            last_rows = read_last_rows(csv_filename, 1) if file_exists else []
+            if rows and last_rows and row_micros(rows[0]) < row_micros(last_rows[-1]):
+                self._rewrite(csv_filename, rows, fsync)
+                return
+            with open(csv_filename, 'a', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                if not file_exists:
+                    writer.writerow(CSV_HEADERS)
+                writer.writerows([row.get(key, "") for key in CSV_HEADERS] for row in rows)
+                if fsync:
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+
+    @staticmethod
+    def _rewrite(csv_filename, rows, fsync):
+        # Догрузка старых показаний: день пересобирается по времени (tmp + os.replace)
+        with open(csv_filename, 'r', newline='') as csvfile:
+            merged = sort_rows(list(csv.DictReader(csvfile)) + rows)
+        with open(csv_filename + '.tmp', 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(CSV_HEADERS)
+            writer.writerows([row.get(key, "") for key in CSV_HEADERS] for row in merged)
+            if fsync:
+                csvfile.flush()
+                os.fsync(csvfile.fileno())
+        os.replace(csv_filename + '.tmp', csv_filename)
+
+
+class ColumnarStorage:
+    """Колоночная копия <folder>[/<device_id>]/YYYY-MM-DD.col/ для быстрого чтения истории через numpy.memmap."""
+
+    name = "columnar"
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def path(self, day, device_id=None):
+        return os.path.join(_day_folder(self.folder, device_id), f'{day}.col')
+
+    def append(self, day, rows, fsync=False, device_id=None):
+        day_path = self.path(day, device_id)
+        csv_filename = day_path[:-len('.col')] + '.csv'
+        # Бэкенд включили посреди дня: копия начинается со всего CSV (в нём уже есть и эти строки,
+        # CsvStorage пишет первым), иначе утренние показания пропали бы из истории
+        if not ColumnarDay(day_path).exists() and os.path.isfile(csv_filename):
+            with _locked(os.path.join(os.path.dirname(csv_filename), CSV_LOCK_FILE)):
+                if not ColumnarDay(day_path).exists():
+                    csv_to_columnar(csv_filename, day_path)
+                    return
+        ColumnarDay(day_path).append(rows, fsync)
+
+
+class SqliteStorage:
+    """Все показания в <folder>/samples.db с индексом (device_id, ts) для запросов по диапазону."""
+
+    name = "sqlite"
+
+    def __init__(self, folder):
+        self.store = SqliteStore(os.path.join(folder, DB_FILE_NAME))
+
+    def path(self, day, device_id=None):
+        return self.store.path
+
+    def append(self, day, rows, fsync=False, device_id=None):
+        # Одна база на все устройства: чтение по устройству идёт по индексу (device_id, ts)
+        self.store.insert_rows(rows, durable=fsync)
+
+
+class RollupStorage:
+    """Агрегаты 1 мин / 1 ч / 1 день в <folder>/rollups.db, дополняются каждой записанной пачкой."""
+
+    name = "rollup"
+
+    def __init__(self, folder):
+        self.store = RollupStore(os.path.join(folder, ROLLUPS_DB_NAME))
+
+    def path(self, day, device_id=None):
+        return self.store.path
+
+    def append(self, day, rows, fsync=False, device_id=None):
+        self.store.add_rows(rows, durable=fsync)
+
+
+STORAGE_BACKENDS = {
+    CsvStorage.name: CsvStorage,
+    ColumnarStorage.name: ColumnarStorage,
+    SqliteStorage.name: SqliteStorage,
+    RollupStorage.name: RollupStorage,
+}
+
+
+def create_storages(names, folder):
+    """Создаёт бэкенды по списку имён; CSV включается всегда."""
+    names = [name.strip() for name in names if name.strip()]
+    if CsvStorage.name not in names:
+        names.insert(0, CsvStorage.name)
+
+    # CSV - первым: колоночная копия при первой записи дня строится из уже дописанного CSV
+    names.sort(key=lambda name: name != CsvStorage.name)
+    storages = []
+    for name in names:
+        if name not in STORAGE_BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд хранения: {name}")
+        storages.append(STORAGE_BACKENDS[name](folder))
+    return storages
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import argparse
+import sqlite3
+import threading
+
+DB_FILE = "telegram_users.db"
+ANY = "*"
+
+
+class Subscriber:
+    def __init__(self, user_id, email, notifications_enabled, subscriptions):
+        self.user_id = user_id
+        self.email = email or None
+        self.notifications_enabled = bool(notifications_enabled)
+        # [(device_id, rule)]; пустой список - подписка на всё
+        self.subscriptions = subscriptions
+
+    def wants(self, device_id, rules):
+        if not self.subscriptions:
+            return True
+        return any(
+            (device == ANY or device == device_id) and (rule == ANY or rule in rules)
+            for device, rule in self.subscriptions
+        )
+
+
+class SubscriberRegistry:
+    """Подписчики оповещений из базы Telegram-бота, снимок в памяти.
+
+    Одно долгоживущее соединение; таблицы перечитываются, только когда
+    PRAGMA data_version показывает, что базу изменило другое соединение
+    (бот), или после invalidate(). Таблица alert_subscriptions ограничивает
+    оповещения пользователя устройствами и правилами ('*' - любые); у кого
+    строк там нет, тот получает всё, как раньше.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._version = None
+        self._subscribers = []
+        self.reloads = 0
+
+    def _connect(self):
+        # Соединение открывается при первом обращении, а не при импорте alerter
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS alert_subscriptions ("
+                    "user_id INTEGER NOT NULL, device_id TEXT NOT NULL DEFAULT '*', rule TEXT NOT NULL DEFAULT '*', "
+                    "UNIQUE (user_id, device_id, rule))"
+                )
+            self._conn = conn
+        return self._conn
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def _load(self):
+        subscriptions = {}
+        for user_id, device_id, rule in self._conn.execute(
+                "SELECT user_id, device_id, rule FROM alert_subscriptions"):
+            subscriptions.setdefault(user_id, []).append((device_id, rule))
+        try:
+            users = self._conn.execute("SELECT user_id, email, notifications_enabled FROM users").fetchall()
+        except sqlite3.OperationalError:
+            # Бот ещё не создал таблицу users
+            users = []
+        self._subscribers = [
+            Subscriber(user_id, email, enabled, subscriptions.get(user_id, []))
+            for user_id, email, enabled in users
+        ]
+        self.reloads += 1
+
+    def snapshot(self):
+        with self._lock:
+            version = self._connect().execute("PRAGMA data_version").fetchone()[0]
+            if version != self._version:
+                self._load()
+                self._version = version
+            return self._subscribers
+
+    def recipients(self, device_id=None, rules=()):
+        """(chat_id для Telegram, адреса email) подписчиков на устройство и любое из правил."""
+        rules = set(rules)
+        user_ids, emails = [], []
+        for subscriber in self.snapshot():
+            if device_id is not None and not subscriber.wants(device_id, rules):
+                continue
+            if subscriber.notifications_enabled:
+                user_ids.append(subscriber.user_id)
+            if subscriber.email:
+                emails.append(subscriber.email)
+        return user_ids, emails
+
+    def subscribe(self, user_id, device_id=ANY, rule=ANY):
+        with self._lock, self._connect():
+            self._conn.execute("INSERT OR IGNORE INTO alert_subscriptions VALUES (?, ?, ?)", (user_id, device_id, rule))
+            # Свои записи не меняют data_version этого соединения
+            self._version = None
+
+    def unsubscribe(self, user_id, device_id=None, rule=None):
+        """Удалить подписки пользователя; без device_id/rule - все (снова получает всё)."""
+        where, params = ["user_id = ?"], [user_id]
+        if device_id is not None:
+            where.append("device_id = ?")
+            params.append(device_id)
+        if rule is not None:
+            where.append("rule = ?")
+            params.append(rule)
+        with self._lock, self._connect():
+            self._conn.execute(f"DELETE FROM alert_subscriptions WHERE {' AND '.join(where)}", params)
+            self._version = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Подписки на оповещения по устройствам и правилам")
+    parser.add_argument("--db", default=DB_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    for name in ("add", "remove"):
+        command = commands.add_parser(name)
+        command.add_argument("user_id", type=int)
+        command.add_argument("--device", default=ANY if name == "add" else None)
+        command.add_argument("--rule", default=ANY if name == "add" else None)
+    args = parser.parse_args()
+
+    registry = SubscriberRegistry(args.db)
+    if args.command == "add":
+        registry.subscribe(args.user_id, args.device, args.rule)
+    elif args.command == "remove":
+        registry.unsubscribe(args.user_id, args.device, args.rule)
+    for subscriber in registry.snapshot():
+        scope = ", ".join(f"{device}/{rule}" for device, rule in subscriber.subscriptions) or "всё"
+        telegram = "вкл" if subscriber.notifications_enabled else "выкл"
+        print(f"{subscriber.user_id}: Telegram {telegram}, email {subscriber.email or '-'}, подписка: {scope}")
@@ -0,0 +1,37 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alert_rules import Rule, RuleEngine, STATE_OPENED, STATE_ACTIVE, STATE_CLOSED
+
+
+def _rows(device_id, temperatures, start=datetime.datetime(2024, 5, 1, 12, 0)):
+    return [
+        {"device_id": device_id, "timestamp": (start + datetime.timedelta(seconds=10 * i)).isoformat(),
+         "air_temperature": value}
+        for i, value in enumerate(temperatures)
+    ]
+
+
+def test_breach_inside_batch_is_reported():
+    engine = RuleEngine([Rule("temp_max", "air_temperature", max=30)])
+
+    # Скачок посреди пачки: последняя строка уже в норме
+    events = engine.evaluate(_rows("esp1", [20, 50, 20]))
+    assert [(event.state, event.value) for event in events] == [(STATE_OPENED, 50.0), (STATE_CLOSED, 20.0)]
+    assert events[0].row["air_temperature"] == 50
+
+
+def test_transitions_carry_over_batches():
+    engine = RuleEngine([Rule("temp_max", "air_temperature", max=30)])
+    start = datetime.datetime(2024, 5, 1, 12, 0)
+
+    assert [event.state for event in engine.evaluate(_rows("esp1", [20, 40], start))] == [STATE_OPENED]
+    later = start + datetime.timedelta(minutes=1)
+    assert [event.state for event in engine.evaluate(_rows("esp1", [45, 20, 35], later))] == \
+        [STATE_CLOSED, STATE_OPENED]
+    later += datetime.timedelta(minutes=1)
+    assert [event.state for event in engine.evaluate(_rows("esp1", [50], later))] == [STATE_ACTIVE]
+    assert engine.evaluate(_rows("esp2", [20], later)) == []
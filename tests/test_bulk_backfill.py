@@ -0,0 +1,70 @@
+import csv
+import datetime
+import importlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar_store import ColumnarDay, to_micros, TIMESTAMP_COLUMN
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    # Сервер читает box_data/ и файл промпта относительно текущего каталога при импорте
+    folder = tmp_path_factory.mktemp("server")
+    (folder / "prompt.txt").write_text("", encoding="utf-8")
+    cwd = os.getcwd()
+    os.chdir(folder)
+    env = dict(os.environ)
+    os.environ.update(
+        SYSTEM_PROMPT_FILE="prompt.txt", ALERTS_ENABLED="0", INGEST_ASYNC="0",
+        STORAGE_BACKENDS="csv,columnar,rollup", DEVICES_FILE=str(folder / "devices.json"),
+    )
+    import weather
+    start = weather.WeatherProvider.start
+    weather.WeatherProvider.start = lambda self, interval=None: None
+    try:
+        yield importlib.import_module("server")
+    finally:
+        weather.WeatherProvider.start = start
+        os.environ.clear()
+        os.environ.update(env)
+        os.chdir(cwd)
+
+
+def test_bulk_backlog_after_live_reading(server):
+    client = server.app.test_client()
+    published = []
+    server.live.publish = lambda event, data, topic=None: published.append((event, data))
+
+    assert client.post("/sensor/data", json={"device_id": "esp1", "temperature": 25, "humidity": 50}).status_code == 201
+    live = client.get("/monitor-data?device_id=esp1").get_json()
+    published.clear()
+
+    # Пропущенные показания за начало дня приходят уже после живого
+    start = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    backlog = [
+        {"device_id": "esp1", "timestamp": (start + datetime.timedelta(seconds=i)).isoformat(),
+         "temperature": 10, "humidity": 40}
+        for i in range(3)
+    ]
+    response = client.post("/sensor/data/bulk", json=backlog)
+    assert response.get_json()["counts"] == {"stored": 3}
+
+    assert client.get("/monitor-data?device_id=esp1").get_json() == live
+    assert not [data for event, data in published if event == "reading"]
+
+    day = start.strftime("%Y-%m-%d")
+    with open(os.path.join("box_data", "esp1", f"{day}.csv"), newline="") as f:
+        timestamps = [to_micros(row["timestamp"]) for row in csv.DictReader(f)]
+    assert len(timestamps) == 4
+    assert timestamps == sorted(timestamps)
+
+    columns = ColumnarDay(os.path.join("box_data", "esp1", f"{day}.col"))
+    assert np.all(np.diff(columns.column(TIMESTAMP_COLUMN)) >= 0)
+    window = columns.read(["air_temperature"], start, start + datetime.timedelta(seconds=2))
+    assert np.asarray(window["air_temperature"]).tolist() == [10.0, 10.0]
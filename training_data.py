@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import ColumnarDay, columnar_path, row_micros, TIMESTAMP_COLUMN, DEVICE_COLUMN
+from csv_tail import read_last_rows
+from devices import device_folders
+
+GRID_SECONDS = 6
+# Пропуски до стольких секунд заполняются интерполяцией, более длинные остаются NaN
+MAX_GAP_SECONDS = 60
+CACHE_DIR = 'forecast_cache'
+CACHE_VERSION = 1
+
+
+def day_range(start, end):
+    """Даты 'YYYY-MM-DD' от start до end включительно."""
+    start = datetime.date.fromisoformat(str(start))
+    end = datetime.date.fromisoformat(str(end))
+    return [(start + datetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+
+
+def _first_csv_row(csv_path):
+    with open(csv_path, 'r', newline='') as csvfile:
+        return next(csv.DictReader(csvfile), None)
+
+
+def _columnar_complete(col_path, csv_path):
+    """Колоночная копия содержит те же первую и последнюю строки, что и CSV.
+
+    Копия, начатая посреди дня (бэкенд включили позже), без утренних строк -
+    такой день читается из CSV.
+    """
+    if not os.path.isfile(csv_path):
+        return True
+    timestamps = ColumnarDay(col_path).column(TIMESTAMP_COLUMN)
+    first, last = _first_csv_row(csv_path), read_last_rows(csv_path, 1)
+    if first is None or not last:
+        return True
+    return len(timestamps) and timestamps[0] <= row_micros(first) and timestamps[-1] >= row_micros(last[-1])
+
+
+def source_path(csv_path):
+    col_path = columnar_path(csv_path)
+    if ColumnarDay(col_path).exists() and _columnar_complete(col_path, csv_path):
+        return col_path
+    return csv_path if os.path.isfile(csv_path) else None
+
+
+def day_csv_paths(data_folder, day, device_id=None):
+    """CSV дня: box_data/<device_id>/ (для device_id=None - всех устройств) и прежний общий файл."""
+    if device_id is not None:
+        folders = [os.path.join(data_folder, device_id)]
+    else:
+        folders = list(device_folders(data_folder).values())
+    # Общий box_data/<day>.csv - архив до разбиения по устройствам, фильтруется в _build
+    folders.append(data_folder)
+    return [os.path.join(folder, f'{day}.csv') for folder in folders]
+
+
+def day_sources(data_folder, day, device_id=None):
+    """Существующие файлы дня, колоночные - вместо CSV, если есть."""
+    paths = [source_path(csv_path) for csv_path in day_csv_paths(data_folder, day, device_id)]
+    return [path for path in paths if path]
+
+
+def _fingerprint(path):
+    """Размер и mtime исходника; у колоночного дня - файла с метками времени."""
+    if path.endswith('.col'):
+        path = os.path.join(path, f'{TIMESTAMP_COLUMN}.i64')
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_day(path, fields):
+    """Сырые показания дня: DataFrame с индексом timestamp и колонкой device_id."""
+    if path.endswith('.col'):
+        day = ColumnarDay(path)
+        data = day.read(fields)
+        devices = np.asarray(day.devices, dtype=object)
+        df = pd.DataFrame({field: np.asarray(data[field]) for field in fields},
+                          index=pd.to_datetime(np.asarray(data[TIMESTAMP_COLUMN]), unit='us'))
+        df[DEVICE_COLUMN] = devices[np.asarray(data[DEVICE_COLUMN])] if len(devices) else ""
+    else:
+        df = pd.read_csv(path, usecols=[TIMESTAMP_COLUMN, DEVICE_COLUMN] + list(fields),
+                         dtype={DEVICE_COLUMN: str})
+        # Метки от устройств бывают с 'T' и с пробелом; нераспознанные строки отбрасываем
+        df[TIMESTAMP_COLUMN] = pd.to_datetime(df[TIMESTAMP_COLUMN], format='ISO8601', errors='coerce')
+        df = df.dropna(subset=[TIMESTAMP_COLUMN]).set_index(TIMESTAMP_COLUMN)
+    df.index.name = TIMESTAMP_COLUMN
+    return df
+
+
+def to_grid(df, fields, grid_seconds=GRID_SECONDS, max_gap_seconds=MAX_GAP_SECONDS, require_all_fields=True):
+    """Регулярная сетка с шагом grid_seconds: среднее в ячейке, короткие пропуски интерполируются.
+
+    require_all_fields=False оставляет пропуски по каждому полю отдельно
+    (для моделей по одному ряду), иначе дыра в одном поле - дыра во всей строке.
+    """
+    grid = df[fields].sort_index().resample(f'{grid_seconds}s').mean()
+    limit = max(max_gap_seconds // grid_seconds, 0)
+    if limit:
+        grid = grid.interpolate(method='time', limit=limit, limit_area='inside')
+    if require_all_fields:
+        # Незаполненная длинная дыра остаётся NaN во всех полях, чтобы её было видно
+        grid[grid.isna().any(axis=1)] = np.nan
+    return grid
+
+
+def segments(grid, min_length=1):
+    """Непрерывные куски сетки без пропусков (для windowing.WindowDataset)."""
+    valid = grid.notna().all(axis=1).to_numpy()
+    # Границы кусков - места, где valid меняется
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], valid, [False])).astype(np.int8)))
+    return [grid.iloc[lo:hi] for lo, hi in zip(edges[::2], edges[1::2]) if hi - lo >= min_length]
+
+
+class TrainingDataLoader:
+    """Показания за диапазон дней по устройствам на регулярной сетке, с кэшем на диске.
+
+    Кэш - pickle на (устройство, диапазон дат, поля, параметры сетки); он
+    перестраивается, только если изменился какой-то из исходных дневных файлов.
+    Устройство None - все устройства вместе (как раньше в forecast_script).
+    """
+
+    def __init__(self, data_folder='box_data', fields=('air_temperature', 'air_humidity'),
+                 grid_seconds=GRID_SECONDS, max_gap_seconds=MAX_GAP_SECONDS, cache_dir=CACHE_DIR,
+                 require_all_fields=True):
+        self.data_folder = data_folder
+        self.fields = list(fields)
+        self.require_all_fields = require_all_fields
+        self.grid_seconds = grid_seconds
+        self.max_gap_seconds = max_gap_seconds
+        self.cache_dir = cache_dir
+
+    def _cache_paths(self, device_id, start, end):
+        params = json.dumps([CACHE_VERSION, self.fields, self.grid_seconds, self.max_gap_seconds,
+                             self.require_all_fields])
+        digest = hashlib.sha1(params.encode('utf-8')).hexdigest()[:10]
+        base = os.path.join(self.cache_dir, f'{device_id or "all"}_{start}_{end}_{digest}')
+        return base + '.pkl', base + '.json'
+
+    def _build(self, sources, device_id):
+        frames = []
+        for path in sources:
+            df = read_day(path, self.fields)
+            if device_id is not None:
+                df = df[df[DEVICE_COLUMN] == device_id]
+            if len(df):
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=self.fields, dtype=float)
+        return to_grid(pd.concat(frames), self.fields, self.grid_seconds, self.max_gap_seconds,
+                       self.require_all_fields)
+
+    def load(self, start, end, device_id=None):
+        days = day_range(start, end)
+        sources = [path for day in days for path in day_sources(self.data_folder, day, device_id)]
+        fingerprint = {path: _fingerprint(path) for path in sources}
+
+        if self.cache_dir:
+            frame_path, meta_path = self._cache_paths(device_id, days[0], days[-1])
+            try:
+                with open(meta_path, 'r') as f:
+                    if json.load(f) == fingerprint:
+                        return pd.read_pickle(frame_path)
+            except (OSError, ValueError):
+                pass
+
+        grid = self._build(sources, device_id)
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            grid.to_pickle(frame_path + '.tmp')
+            os.replace(frame_path + '.tmp', frame_path)
+            with open(meta_path, 'w') as f:
+                json.dump(fingerprint, f)
+        return grid
+
+    def load_devices(self, start, end, device_ids=(None,)):
+        return {device_id: self.load(start, end, device_id) for device_id in device_ids}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Подготовка обучающих данных: сетка, пропуски, кэш")
+    parser.add_argument("start", help="первый день, YYYY-MM-DD")
+    parser.add_argument("end", help="последний день, YYYY-MM-DD")
+    parser.add_argument("--device", action="append", help="можно несколько; по умолчанию все вместе")
+    parser.add_argument("--data", default="box_data")
+    parser.add_argument("--grid", type=int, default=GRID_SECONDS)
+    parser.add_argument("--max-gap", type=int, default=MAX_GAP_SECONDS)
+    args = parser.parse_args()
+
+    loader = TrainingDataLoader(args.data, grid_seconds=args.grid, max_gap_seconds=args.max_gap)
+    for device_id, grid in loader.load_devices(args.start, args.end, args.device or [None]).items():
+        parts = segments(grid)
+        print(f"{device_id or 'все устройства'}: {len(grid)} точек сетки, "
+              f"{int(grid.notna().all(axis=1).sum())} без пропусков, {len(parts)} непрерывных кусков")
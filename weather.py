@@ -0,0 +1,121 @@
+import threading
+import time
+
+import requests
+
+WEATHER_TTL_SECONDS = 600
+WEATHER_MAX_STALE_SECONDS = 3 * 3600
+WEATHER_TIMEOUT_SECONDS = 10
+
+
+class WeatherProvider:
+    """Текущая погода open-meteo из памяти: TTL-кэш с фоновым обновлением.
+
+    get_current() никогда не ходит в сеть в потоке запроса. Свежие данные
+    (моложе ttl) отдаются как есть; устаревшие, но моложе max_stale - тоже
+    отдаются, а обновление запускается в фоне (stale-while-revalidate).
+    """
+
+    def __init__(self, url, ttl=WEATHER_TTL_SECONDS, max_stale=WEATHER_MAX_STALE_SECONDS,
+                 timeout=WEATHER_TIMEOUT_SECONDS):
+        self.url = url
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._current = None
+        self._fetched_at = None
+        self._refreshing = False
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+        self._last_error = None
+
+    def _age(self, now):
+        return None if self._fetched_at is None else now - self._fetched_at
+
+    def _fetch(self):
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        payload = response.json()
+        current = payload.get("current_weather", {}) if isinstance(payload, dict) else None
+        if not isinstance(current, dict):
+            raise ValueError(f"неожиданный ответ open-meteo: {str(payload)[:200]}")
+        return current
+
+    def refresh(self):
+        try:
+            try:
+                current = self._fetch()
+            except Exception as e:
+                # Любая ошибка (сеть, JSON, формат ответа) - только в статистику, кэш остаётся прежним
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._last_error = str(e)
+                print(f"ОШИБКА: Не удалось получить данные о погоде. Причина: {e}")
+                return False
+
+            with self._lock:
+                first_fetch = self._current is None
+                self._current = current
+                self._fetched_at = time.monotonic()
+                self._stats["refreshes"] += 1
+                self._last_error = None
+        finally:
+            with self._lock:
+                self._refreshing = False
+        if first_fetch:
+            print("Температура:", current.get("temperature"), "°C")
+            print("Скорость ветра:", current.get("windspeed"), "км/ч")
+            print("Направление ветра:", current.get("winddirection"), "°")
+            print("Погодный код (weathercode):", current.get("weathercode"))
+            print("Время измерения:", current.get("time"))
+        return True
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="weather-refresh", daemon=True).start()
+
+    def get_current(self):
+        now = time.monotonic()
+        with self._lock:
+            age = self._age(now)
+            if age is not None and age < self.ttl:
+                self._stats["hits"] += 1
+                return self._current
+            if age is not None and age < self.max_stale:
+                self._stats["stale_hits"] += 1
+                current = self._current
+            else:
+                self._stats["misses"] += 1
+                current = {}
+        self.refresh_async()
+        return current
+
+    def start(self, interval=None):
+        """Периодическое обновление в фоне, чтобы запросы почти всегда попадали в свежий кэш."""
+        interval = interval or self.ttl * 0.9
+
+        def loop():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    # Поток не должен умирать: иначе кэш больше никогда не обновится
+                    print(f"ОШИБКА: Сбой фонового обновления погоды: {e}")
+                time.sleep(interval)
+
+        with self._lock:
+            self._refreshing = True
+        threading.Thread(target=loop, name="weather-loop", daemon=True).start()
+
+    def metrics(self):
+        with self._lock:
+            age = self._age(time.monotonic())
+            return dict(
+                self._stats,
+                age_seconds=None if age is None else round(age, 1),
+                ttl_seconds=self.ttl,
+                last_error=self._last_error,
+            )
@@ -0,0 +1,68 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+WINDOW_BATCH_SIZE = 32
+
+
+class WindowDataset:
+    """Обучающие окна TCN (X - input_len точек, y - следующие forecast_steps) без копирования данных.
+
+    segments - список непрерывных кусков масштабированных данных (например,
+    по дню на кусок), окна не пересекают границы кусков. Окна - это view через
+    sliding_window_view, в память копируется только текущий батч.
+    """
+
+    def __init__(self, segments, input_len, forecast_steps, stride=1, batch_size=WINDOW_BATCH_SIZE,
+                 dtype=np.float32):
+        self.input_len = input_len
+        self.forecast_steps = forecast_steps
+        self.batch_size = batch_size
+        self.dtype = dtype
+        length = input_len + forecast_steps
+
+        self._views = []
+        counts = []
+        for segment in segments:
+            segment = np.asarray(segment)
+            if len(segment) < length:
+                continue
+            # (окна, признаки, length) -> (окна, length, признаки), всё ещё view
+            view = sliding_window_view(segment, length, axis=0).transpose(0, 2, 1)[::stride]
+            self._views.append(view)
+            counts.append(len(view))
+        self._offsets = np.cumsum([0] + counts)
+
+    @property
+    def window_count(self):
+        return int(self._offsets[-1])
+
+    @property
+    def n_features(self):
+        return self._views[0].shape[2] if self._views else 0
+
+    def __len__(self):
+        """Число батчей за эпоху."""
+        return -(-self.window_count // self.batch_size)
+
+    def window(self, index):
+        segment = int(np.searchsorted(self._offsets, index, side='right')) - 1
+        return self._views[segment][index - self._offsets[segment]]
+
+    def batch(self, indexes):
+        windows = np.stack([self.window(i) for i in indexes]).astype(self.dtype, copy=False)
+        X = windows[:, :self.input_len]
+        y = windows[:, self.input_len:].reshape(len(indexes), -1)
+        return X, y
+
+    def iter_batches(self, shuffle=False, rng=None):
+        order = np.arange(self.window_count)
+        if shuffle:
+            (rng or np.random.default_rng()).shuffle(order)
+        for start in range(0, len(order), self.batch_size):
+            yield self.batch(order[start:start + self.batch_size])
+
+    def forever(self, shuffle=True, seed=None):
+        """Бесконечный генератор батчей для model.fit(..., steps_per_epoch=len(dataset))."""
+        rng = np.random.default_rng(seed)
+        while True:
+            yield from self.iter_batches(shuffle, rng)